@@ -0,0 +1,332 @@
+"""
+File:           api.py
+Versioned JSON API (/api/v1) mirroring the venue, artist, show and search pages,
+plus the bulk creation of the shows of a tour.
+
+Rows are projected to plain columns in SQL, never loaded as model instances,
+and serialized with orjson when it is installed (json otherwise). Listings are
+keyset paginated like the pages (?limit=, ?after=, ?before=), ?fields=a,b
+selects the returned fields and bodies are brotli / gzip compressed when the
+client accepts it.
+"""
+import gzip
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, request, current_app, abort
+from sqlalchemy.exc import IntegrityError
+
+from models import Venue, Artist, Show, db
+from pagination import keyset_paginate, page_args
+from filters import show_filter_args
+import booking
+import geo
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Smaller bodies are sent as they are, compressing them does not pay off
+COMPRESS_MIN_SIZE = 500
+
+# Selectable fields and the column behind each of them
+VENUE_FIELDS = {
+    'id': Venue.id,
+    'name': Venue.name,
+    'genres': Venue.genre_names,
+    'address': Venue.address,
+    'city': Venue.city,
+    'state': Venue.state,
+    'phone': Venue.phone,
+    'website': Venue.website,
+    'facebook_link': Venue.facebook_link,
+    'seeking_talent': Venue.seeking_talent,
+    'seeking_description': Venue.seeking_description,
+    'image_link': Venue.image_link,
+    'latitude': Venue.latitude,
+    'longitude': Venue.longitude,
+}
+ARTIST_FIELDS = {
+    'id': Artist.id,
+    'name': Artist.name,
+    'genres': Artist.genre_names,
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'website': Artist.website,
+    'facebook_link': Artist.facebook_link,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+    'image_link': Artist.image_link,
+}
+SHOW_FIELDS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+}
+# Extra fields of the detail and search responses, computed from the shows
+SHOW_LIST_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count')
+SEARCH_FIELDS = ('num_upcoming_shows',)
+NEARBY_FIELDS = ('distance_km',)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """ Encode data as JSON bytes """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode()
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def selected_fields(fields, extra=()):
+    """ Names asked for by ?fields= (every field when absent), 400 for unknown ones """
+    requested = request.args.get('fields')
+    if not requested:
+        return list(fields) + list(extra)
+    names = list(dict.fromkeys(x.strip() for x in requested.split(',') if x.strip()))
+    unknown = [x for x in names if x not in fields and x not in extra]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def _columns(fields, names, *required):
+    """ Labelled columns of the selected names plus the ones needed for paging / joins """
+    wanted = list(dict.fromkeys([*required, *[x for x in names if x in fields]]))
+    return [fields[x].label(x) for x in wanted]
+
+
+def _project(row, names):
+    """ Dict of the selected names of a row, genres are [] rather than null """
+    item = row._asdict()
+    if 'genres' in item and item['genres'] is None:
+        item['genres'] = []
+    return {x: item[x] for x in names if x in item}
+
+
+def _page(page, names):
+    return {
+        'data': [_project(x, names) for x in page.items],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    }
+
+
+def _listing(model, fields):
+    """ Keyset paginated ?genre= filtered listing of venues / artists """
+    names = selected_fields(fields)
+    query = db.session.query(*_columns(fields, names, 'id'))
+    genre = request.args.get('genre')
+    if genre:
+        query = query.filter(model.has_genre(genre))
+    page = keyset_paginate(query, [model.id], keys=lambda x: (x.id,), **page_args(int))
+    return json_response(_page(page, names))
+
+
+def _detail(model, fields, owner_id, shows):
+    """ A venue / artist with its past and upcoming shows, `shows(id)` is the query of the show rows """
+    names = selected_fields(fields, SHOW_LIST_FIELDS)
+    row = db.session.query(*_columns(fields, names, 'id')).filter(model.id == owner_id).first()
+    if row is None:
+        abort(404, f'{model.__name__} {owner_id} does not exist')
+    data = _project(row, names)
+    if 'past_shows' not in names and 'upcoming_shows' not in names:
+        # Counts alone are read from the stats table, the shows are not loaded
+        if any(x in names for x in SHOW_LIST_FIELDS):
+            counts = model.show_counts([owner_id])[owner_id]
+            for name, value in (('past_shows_count', counts.past), ('upcoming_shows_count', counts.upcoming)):
+                if name in names:
+                    data[name] = value
+    elif any(x in names for x in SHOW_LIST_FIELDS):
+        now = datetime.now()
+        past, upcoming = [], []
+        for show in shows(owner_id):
+            (upcoming if show.start_time >= now else past).append(show._asdict())
+        for name, value in (('past_shows', past), ('upcoming_shows', upcoming),
+                            ('past_shows_count', len(past)), ('upcoming_shows_count', len(upcoming))):
+            if name in names:
+                data[name] = value
+    return json_response(data)
+
+
+def _search(model, fields):
+    """ Venues / artists matching ?q= (and ?genre=) with their upcoming show counts """
+    names = selected_fields(fields, SEARCH_FIELDS)
+    search_term = request.args.get('q', '')
+    rows = model.search(
+        search_term,
+        limit=current_app.config['SEARCH_LIMIT'],
+        genre=request.args.get('genre'),
+        columns=_columns(fields, names, 'id')
+    )
+    data = [_project(x, names) for x in rows]
+    if 'num_upcoming_shows' in names:
+        show_counts = model.show_counts([x.id for x in rows])
+        for row, item in zip(rows, data):
+            item['num_upcoming_shows'] = show_counts[row.id].upcoming
+    return json_response({'count': len(data), 'data': data})
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def venues():
+    """ Page of venues """
+    return _listing(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/search')
+def search_venues():
+    """ Venues matching ?q= """
+    return _search(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/nearby')
+def nearby_venues():
+    """ Venues closest to ?lat=&lon=, within ?radius= km when given, nearest first """
+    names = selected_fields(VENUE_FIELDS, NEARBY_FIELDS)
+    args = geo.nearby_args()
+    if args['latitude'] is None:
+        abort(400, 'lat and lon are required, in degrees')
+    data = []
+    for row, distance_km in geo.nearby(columns=_columns(VENUE_FIELDS, names, 'id'), **args):
+        item = _project(row, names)
+        if 'distance_km' in names:
+            item['distance_km'] = round(distance_km, 3)
+        data.append(item)
+    return json_response({'count': len(data), 'data': data})
+
+
+@api.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    """ A venue with its shows """
+    return _detail(Venue, VENUE_FIELDS, venue_id, Venue.shows_with_artist_query)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def artists():
+    """ Page of artists """
+    return _listing(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/search')
+def search_artists():
+    """ Artists matching ?q= """
+    return _search(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    """ An artist with their shows """
+    return _detail(Artist, ARTIST_FIELDS, artist_id, Artist.shows_with_venue_query)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def shows():
+    """ Page of shows ordered by start time, with their venue and artist, filtered like /shows """
+    names = selected_fields(SHOW_FIELDS)
+    filters = show_filter_args()
+    query = db.session.query(*_columns(SHOW_FIELDS, names, 'start_time', 'id'))
+    # Only join the sides whose columns were asked for or filtered on
+    if filters['city'] or filters['state'] or any(x in names for x in ('venue_name', 'venue_image_link')):
+        query = query.join(Venue, Show.venue_id == Venue.id)
+    if any(x in names for x in ('artist_name', 'artist_image_link')):
+        query = query.join(Artist, Show.artist_id == Artist.id)
+    page = keyset_paginate(
+        Show.filter_listing(query, **filters),
+        [Show.start_time, Show.id],
+        keys=lambda x: (x.start_time, x.id),
+        **page_args(datetime, int)
+    )
+    return json_response(_page(page, names))
+
+
+@api.route('/shows/batch', methods=['POST'])
+def create_shows():
+    """
+    Create the shows of {"shows": [{"venue_id", "artist_id", "start_time", "duration" or "end_time"}, ...]},
+    all of them in one transaction or none. Bad rows are reported by their number, from 1.
+    """
+    body = request.get_json(silent=True)
+    shows = body.get('shows') if isinstance(body, dict) else None
+    if not isinstance(shows, list) or not shows:
+        abort(400, 'Expected a JSON body {"shows": [...]} with at least one show')
+    if len(shows) > current_app.config['BATCH_MAX_SHOWS']:
+        abort(400, f'At most {current_app.config["BATCH_MAX_SHOWS"]} shows per request')
+    bookings, errors = [], {}
+    for row, show in enumerate(shows, start=1):
+        try:
+            if not isinstance(show, dict):
+                raise ValueError('Expected an object')
+            bookings.append(booking.booking(
+                show.get('venue_id'), show.get('artist_id'), show.get('start_time'),
+                duration=show.get('duration'), end_time=show.get('end_time')
+            ))
+        except ValueError as err:
+            errors[row] = str(err)
+    if not errors:
+        try:
+            errors = booking.schedule(bookings)
+        except IntegrityError:
+            abort(409, 'A venue or an artist has just been booked at one of these times')
+    if errors:
+        return json_response({'errors': [{'row': row, 'error': error} for row, error in errors.items()]}, status=400)
+    return json_response({'count': len(bookings), 'data': bookings}, status=201)
+
+
+#  Errors and compression
+#  ----------------------------------------------------------------
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(409)
+def api_error(error):
+    return json_response({'error': error.description}, status=error.code)
+
+
+@api.after_request
+def compress(response):
+    """ Brotli / gzip encode the body for clients accepting it """
+    if response.direct_passthrough or response.status_code < 200 or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
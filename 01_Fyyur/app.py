@@ -3,17 +3,37 @@
 #----------------------------------------------------------------------------#
 
 import json
+import sys
+from datetime import datetime
+import click
+from functools import lru_cache
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from babel import Locale
+from babel.dates import LC_TIME, UTC, parse_pattern
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import CSRFProtect
 from flask_migrate import Migrate
-from models import Venue, VenuesGenres, Artist, ArtistsGenres, Show, db
-from forms import ShowForm, VenueForm, ArtistForm
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from models import Venue, VenuesGenres, VenueStats, Artist, ArtistsGenres, Show, Deletions, TableSync, show_end_time, db
+from models import record_shows, refresh_show_stats, roll_show_stats
+from forms import ShowForm, TourForm, VenueForm, ArtistForm
+from pagination import keyset_paginate, page_args
+from filters import show_filter_args
+from suggest import PrefixIndex, VENUE, ARTIST
+from cache import ResponseCache, VersionStamps
+from dbpool import pool_stats
+from profiler import RequestProfiler
+import metrics
+from api import api
+import booking
+import geo
+import importer
+import exporter
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -26,6 +46,18 @@ app.config.from_object('config')
 db.init_app(app)
 
 migrate = Migrate(app, db)
+response_cache = ResponseCache(app)
+version_stamps = VersionStamps(app.config['CACHE_TTL'], app.config['VERSION_BUCKET'])
+profiler = RequestProfiler(app)
+metrics.init_app(app)
+# JSON twin of the pages under /api/v1
+app.register_blueprint(api)
+# Its writes only take JSON bodies, which a cross-site form cannot send without a CORS preflight
+csrf.exempt(api)
+
+# Venue / artist names for the search type-ahead, built on the first request
+search_index = PrefixIndex()
+search_index_syncs = {VENUE: TableSync(Venue), ARTIST: TableSync(Artist)}
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -38,22 +70,144 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 
 
+DATETIME_FORMATS = {
+    'full': " EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=None)
+def datetime_formatter(format, locale=LC_TIME):
+    """ Parsed Babel pattern and locale for a format, resolved once per (format, locale) """
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=8192)
+def format_datetime_cached(value, format, locale=LC_TIME):
+    """ Rendered string of a datetime, the same show times repeat across pages """
+    pattern, locale = datetime_formatter(format, locale)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return pattern.apply(value, locale)
+
+
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = " EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    # Views pass datetime objects, ISO strings are still accepted
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return format_datetime_cached(value, format)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+
+def page_url(**cursor):
+    """ URL of another page of the current listing, keeping its filters """
+    args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+    args.update(cursor)
+    return url_for(request.endpoint, **args)
+
+
+app.jinja_env.globals['page_url'] = page_url
+
+
+def stream_template(template_name, **context):
+    """ Render a template chunk by chunk so large listings are not built in memory """
+    # Reference: https://flask.palletsprojects.com/en/1.1.x/patterns/streaming/
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(5)
+    return Response(stream_with_context(stream))
+
+
+def shows_last_modified():
+    """ The show listing changes with any venue or artist (show creation bumps both, deleting a venue counts) """
+    stamps = [Venue.last_modified(), Artist.last_modified()]
+    return max((x for x, _ in stamps if x is not None), default=None), sum(x for _, x in stamps)
+
+def search_results(rows, show_counts):
+    """ Template data of a venue / artist search page """
+    data = [
+        {
+            'id': x.id,
+            'name': x.name,
+            'num_upcoming_shows': show_counts[x.id].upcoming
+        }
+        for x in rows
+    ]
+    return {
+        'count': len(data),
+        'data': data
+    }
+
+
+def shows_query():
+    """ Shows joined with their venue and artist columns, so a page costs a single query """
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(
+        Venue, Show.venue_id == Venue.id
+    ).join(
+        Artist, Show.artist_id == Artist.id
+    )
+
+
+def show_listing(rows):
+    """ Template data of the /shows page from shows_query() rows """
+    return [
+        {
+            'venue_id': x.venue_id,
+            'venue_name': x.venue_name,
+            'artist_id': x.artist_id,
+            'artist_name': x.artist_name,
+            'artist_image_link': x.artist_image_link,
+            'start_time': x.start_time
+        }
+        for x in rows
+    ]
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
+@app.before_first_request
+def build_search_index():
+    """ Load every venue and artist name into the type-ahead index """
+    for sync in search_index_syncs.values():
+        sync.reset()
+    venues = db.session.query(Venue.id, Venue.name).yield_per(1000)
+    artists = db.session.query(Artist.id, Artist.name).yield_per(1000)
+    search_index.build(
+        [(VENUE, x.id, x.name) for x in venues] + [(ARTIST, x.id, x.name) for x in artists]
+    )
+
+
+def sync_search_index():
+    """ Apply the venue / artist changes of the other workers and of the CLI commands to the type-ahead index """
+    for kind, sync in search_index_syncs.items():
+        changes = sync.poll(app.config['INDEX_SYNC_INTERVAL'])
+        if changes is None:
+            continue
+        model = sync.model
+        rows = db.session.query(model.id, model.name).filter(model.updated_at >= changes.since)
+        ids = {x for x, in db.session.query(model.id)} if changes.deleted else None
+        search_index.update(kind, rows, ids)
+
+
+@app.before_first_request
+def build_venue_locator():
+    """ Load the venue coordinates into the nearby search index where PostgreSQL does not serve it """
+    geo.build_venue_locator()
+
+
 @app.route('/')
 def index():
     return render_template('pages/home.html')
@@ -63,87 +217,102 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@version_stamps.conditional(lambda: 'venues', Venue.last_modified)
+@response_cache.cached('venues')
 def venues():
     """ Get all venues """
-    data = []
-    all_venues = Venue.query.all()
-    unique_locations = set([(x.city, x.state) for x in all_venues])
-    for location in unique_locations:
+    # Page through the venues in area order, then group the page into areas in the database
+    venues = db.session.query(*Venue.area_order())
+    genre = request.args.get('genre')
+    if genre:
+        venues = venues.filter(Venue.has_genre(genre))
+    page = keyset_paginate(
+        venues,
+        Venue.area_order(),
+        keys=lambda x: (x.state, x.city, x.id),
+        **page_args(str, str, int)
+    )
+    venue_ids = [x.id for x in page.items]
+    response_cache.tag(*[f'venue:{x}' for x in venue_ids])
+    # Areas are grouped and ordered in the database and streamed into the template
+    data = Venue.areas(venue_ids)
+
+    return stream_template('pages/venues.html', areas=data, page=page)
+
+
+@app.route('/venues/nearby')
+def nearby_venues():
+    """ Venues closest to ?lat=&lon=, within ?radius= km when given """
+    args = geo.nearby_args()
+    venues = []
+    if args['latitude'] is not None:
+        columns = [Venue.id, Venue.name, Venue.address, Venue.city, Venue.state]
         venues = [
             {
                 'id': x.id,
                 'name': x.name,
-                'num_upcoming_shows': len(x.upcoming_shows)
+                'address': x.address,
+                'city': x.city,
+                'state': x.state,
+                'distance_km': distance_km
             }
-            for x in all_venues if x.city == location[0] and x.state == location[1]
+            for x, distance_km in geo.nearby(columns=columns, **args)
         ]
-        data.append(
-            {
-                'city': location[0],
-                'state': location[1],
-                'venues': venues
-            }
-        )
-
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/nearby_venues.html', venues=venues, args=args)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     """ Search for a venue using search_term """
     search_term = request.form.get('search_term')
-    # Reference: https://stackoverflow.com/questions/3325467/sqlalchemy-equivalent-to-sql-like-statement
-    # Get all venues using LIKE sql statement
-    venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    data = [
-        {
-            'id': x.id,
-            'name': x.name,
-            'num_upcoming_shows': len(x.upcoming_shows)
-        }
-        for x in venues
-    ]
-    response = {
-        'count': len(data),
-        'data': data
-    }
+    # Ranked search on name, city, state and genres backed by the trigram indexes
+    venues = Venue.search(search_term, limit=app.config['SEARCH_LIMIT'], genre=request.args.get('genre'))
+    show_counts = Venue.show_counts([x.id for x in venues])
     return render_template(
         'pages/search_venues.html',
-        results=response,
+        results=search_results(venues, show_counts),
         search_term=request.form.get('search_term', '')
     )
 
 
 @app.route('/venues/<int:venue_id>')
+@version_stamps.conditional(lambda venue_id: f'venue:{venue_id}', Venue.last_modified)
+@response_cache.cached()
 def show_venue(venue_id):
     """ Show a venue by id """
-    venue = Venue.query.get(venue_id)
-    # Upcoming show details
-    upcoming_shows_details = [
-        {
-            'artist_id': x.artist_id,
-            'artist_name': x.artist.name,
-            'artist_image_link': x.artist.image_link,
-            'start_time': x.start_time.isoformat()
-        }
-        for x in venue.upcoming_shows
-    ]
+    venue = Venue.query.options(selectinload(Venue.genres)).get(venue_id)
+    # Shows with their artist columns come from one joined query
+    data = venue_details(venue, venue.genres_list, venue.shows_with_artist())
+    response_cache.tag(
+        f'venue:{venue_id}',
+        *[f'artist:{x["artist_id"]}' for x in data['past_shows'] + data['upcoming_shows']]
+    )
 
-    # Past show details
-    past_show_details = [
+    return render_template('pages/show_venue.html', venue=data)
+
+
+def venue_details(venue, genres, shows):
+    """ Template data of the venue page from its columns, genres and shows_with_artist() rows """
+    now = datetime.now()
+    shows = [
         {
             'artist_id': x.artist_id,
-            'artist_name': x.artist.name,
-            'artist_image_link': x.artist.image_link,
-            'start_time': x.start_time.isoformat()
+            'artist_name': x.artist_name,
+            'artist_image_link': x.artist_image_link,
+            'start_time': x.start_time,
+            'upcoming': x.start_time >= now
         }
-        for x in venue.past_shows
+        for x in shows
     ]
+    # Upcoming show details
+    upcoming_shows_details = [x for x in shows if x['upcoming']]
+    # Past show details
+    past_show_details = [x for x in shows if not x['upcoming']]
 
-    data = {
-        'id': venue_id,
+    return {
+        'id': venue.id,
         'name': venue.name,
-        'genres': venue.genres_list,
+        'genres': genres,
         'address': venue.address,
         'city': venue.city,
         'state': venue.state,
@@ -159,7 +328,32 @@ def show_venue(venue_id):
         'upcoming_shows_count': len(upcoming_shows_details)
     }
 
-    return render_template('pages/show_venue.html', venue=data)
+@app.route('/search/suggest')
+def search_suggest():
+    """ Type-ahead suggestions for venue / artist names starting with ?q= """
+    prefix = request.args.get('q', '')
+    kind = request.args.get('type')
+    if kind not in (VENUE, ARTIST):
+        kind = None
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    sync_search_index()
+    return jsonify({'suggestions': search_index.suggest(prefix, limit=limit, kind=kind)})
+
+@app.route('/cache/stats')
+def cache_stats():
+    """ Response cache hit / miss counters """
+    return jsonify(response_cache.stats)
+
+@app.route('/metrics')
+def metrics_view():
+    """ Prometheus metrics """
+    return metrics.metrics_response()
+
+
+@app.route('/pool/stats')
+def pool_stats_view():
+    """ Database connection pool telemetry """
+    return jsonify(pool_stats.snapshot(db.engine.pool))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -197,6 +391,7 @@ def create_venue_submission():
         # Redirect to the new_venue.html page with the error message in the above line
         return redirect(url_for('create_venue_submission'))
 
+    now = datetime.utcnow()
     try:
         # Create a venue instance using form data
         venue = Venue(
@@ -209,8 +404,11 @@ def create_venue_submission():
             facebook_link=facebook_link,
             website=website,
             seeking_talent=seeking_talent,
-            seeking_description=seeking_description
+            seeking_description=seeking_description,
+            genre_names=list(dict.fromkeys(genres)),
+            updated_at=now
         )
+        venue.latitude, venue.longitude = geo.geocode(city, state)
         db.session.add(venue)
 
         # Creating Venue generes instances and assigning using backref
@@ -220,6 +418,10 @@ def create_venue_submission():
             db.session.add(new_genre)
 
         db.session.commit()
+        search_index.add(VENUE, venue.id, name)
+        geo.venue_locator.add(venue.id, venue.latitude, venue.longitude)
+        response_cache.invalidate('venues')
+        version_stamps.touch('venues', at=now)
     except Exception as err:
         print(err)
         db.session.rollback()
@@ -240,12 +442,28 @@ def delete_venue(venue_id):
     """ Delete a venue by id """
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
     error = False
     try:
-        venue = Venue.query.get(venue_id)
+        now = datetime.utcnow()
+        # The shows and genres of the venue go with it, the pages and show counts of their artists change
+        artist_ids = venue.touch(now)
+        Show.query.filter(Show.venue_id == venue.id).delete(synchronize_session=False)
+        refresh_show_stats(Show.artist_id, artist_ids)
+        VenueStats.query.filter(VenueStats.venue_id == venue.id).delete(synchronize_session=False)
+        VenuesGenres.query.filter(VenuesGenres.venue_id == venue.id).delete(synchronize_session=False)
         db.session.delete(venue)
+        Deletions.record(Venue.__tablename__, now)
         db.session.commit()
-    except():
+        search_index.remove(VENUE, int(venue_id))
+        geo.venue_locator.remove(int(venue_id))
+        artist_tags = [f'artist:{x}' for x in artist_ids]
+        response_cache.invalidate('venues', 'shows', f'venue:{venue_id}', *artist_tags)
+        version_stamps.touch('venues', 'shows', f'venue:{venue_id}', at=now, deleted=True)
+        version_stamps.touch(*artist_tags, at=now)
+    except Exception:
         db.session.rollback()
         error = True
     finally:
@@ -261,75 +479,83 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 @app.route('/artists')
+@version_stamps.conditional(lambda: 'artists', Artist.last_modified)
+@response_cache.cached('artists')
 def artists():
     """ Get all artists """
-    artists = Artist.query.all()
+    artists = db.session.query(Artist.id, Artist.name)
+    genre = request.args.get('genre')
+    if genre:
+        artists = artists.filter(Artist.has_genre(genre))
+    page = keyset_paginate(
+        artists,
+        [Artist.id],
+        keys=lambda x: (x.id,),
+        **page_args(int)
+    )
+    response_cache.tag(*[f'artist:{x.id}' for x in page.items])
     data = [
         {
             'id': x.id,
             'name': x.name
         }
-        for x in artists
+        for x in page.items
     ]
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     """ Search for artist using search_term """
     search_term = request.form.get('search_term')
-    # Reference: https://stackoverflow.com/questions/3325467/sqlalchemy-equivalent-to-sql-like-statement
-    # Get all venues using LIKE sql statement
-    artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-    data = [
-        {
-            'id': x.id,
-            'name': x.name,
-            'num_upcoming_shows': len(x.upcoming_shows)
-        }
-        for x in artists
-    ]
-    response = {
-        'count': len(data),
-        'data': data
-    }
+    # Ranked search on name, city, state and genres backed by the trigram indexes
+    artists = Artist.search(search_term, limit=app.config['SEARCH_LIMIT'], genre=request.args.get('genre'))
+    show_counts = Artist.show_counts([x.id for x in artists])
     return render_template(
         'pages/search_artists.html',
-        results=response,
+        results=search_results(artists, show_counts),
         search_term=request.form.get('search_term', '')
     )
 
 
 @app.route('/artists/<int:artist_id>')
+@version_stamps.conditional(lambda artist_id: f'artist:{artist_id}', Artist.last_modified)
+@response_cache.cached()
 def show_artist(artist_id):
     """ Get a artist by id """
-    artist = Artist.query.get(artist_id)
-    # Upcoming show details
-    upcoming_shows_details = [
-        {
-            'artist_id': x.artist_id,
-            'artist_name': x.artist.name,
-            'artist_image_link': x.artist.image_link,
-            'start_time': x.start_time.isoformat()
-        }
-        for x in artist.upcoming_shows
-    ]
+    artist = Artist.query.options(selectinload(Artist.genres)).get(artist_id)
+    # Shows with their venue columns come from one joined query
+    data = artist_details(artist, artist.genres_list, artist.shows_with_venue())
+    response_cache.tag(
+        f'artist:{artist_id}',
+        *[f'venue:{x["venue_id"]}' for x in data['past_shows'] + data['upcoming_shows']]
+    )
 
-    # Past show details
-    past_show_details = [
+    return render_template('pages/show_artist.html', artist=data)
+
+
+def artist_details(artist, genres, shows):
+    """ Template data of the artist page from its columns, genres and shows_with_venue() rows """
+    now = datetime.now()
+    shows = [
         {
             'venue_id': x.venue_id,
-            'venue_name': x.venue.name,
-            'venue_image_link': x.venue.image_link,
-            'start_time': x.start_time.isoformat()
+            'venue_name': x.venue_name,
+            'venue_image_link': x.venue_image_link,
+            'start_time': x.start_time,
+            'upcoming': x.start_time >= now
         }
-        for x in artist.past_shows
+        for x in shows
     ]
+    # Upcoming show details
+    upcoming_shows_details = [x for x in shows if x['upcoming']]
+    # Past show details
+    past_show_details = [x for x in shows if not x['upcoming']]
 
-    data = {
-        'id': artist_id,
+    return {
+        'id': artist.id,
         'name': artist.name,
-        'genres': artist.genres_list,
+        'genres': genres,
         'city': artist.city,
         'state': artist.state,
         'phone': artist.phone,
@@ -344,8 +570,6 @@ def show_artist(artist_id):
         'upcoming_shows_count': len(upcoming_shows_details)
     }
 
-    return render_template('pages/show_artist.html', artist=data)
-
 #  Update
 #  ----------------------------------------------------------------
 
@@ -393,6 +617,7 @@ def edit_artist_submission(artist_id):
         return redirect(url_for('edit_artist_submission'))
 
     error = False
+    now = datetime.utcnow()
     try:
         # Update artist instance with form data
         artist = Artist.query.get(artist_id)
@@ -405,19 +630,18 @@ def edit_artist_submission(artist_id):
         artist.website = website
         artist.seeking_venue = seeking_venue
         artist.seeking_description = seeking_description
+        # Venue pages listing this artist change too
+        venue_ids = artist.touch(now)
         db.session.add(artist)
 
-        # Delete old generes
-        for x in artist.genres:
-            db.session.delete(x)
-
-        # Creating Artist generes instances and assigning using backref
-        for genre in genres:
-            new_genre = ArtistsGenres(genre=genre)
-            new_genre.artist = artist  # backref
-            db.session.add(new_genre)
+        # Only the added / removed genres are written
+        artist.sync_genres(genres)
 
         db.session.commit()
+        search_index.add(ARTIST, artist_id, name)
+        # Listings and the show list show the name / image too, venue pages are tagged with their artists
+        response_cache.invalidate('artists', 'shows', f'artist:{artist_id}')
+        version_stamps.touch('artists', 'shows', f'artist:{artist_id}', *[f'venue:{x}' for x in venue_ids], at=now)
     except Exception as err:
         print(err)
         db.session.rollback()
@@ -478,6 +702,7 @@ def edit_venue_submission(venue_id):
         # Redirect to the new_venue.html page with the error message in the above line
         return redirect(url_for('edit_venue_submission'))
 
+    now = datetime.utcnow()
     try:
         # Update venue instance with form data
         venue = Venue.query.get(venue_id)
@@ -491,17 +716,19 @@ def edit_venue_submission(venue_id):
         venue.website = website
         venue.seeking_talent = seeking_talent
         venue.seeking_description = seeking_description
+        venue.latitude, venue.longitude = geo.geocode(city, state)
+        # Artist pages listing this venue change too
+        artist_ids = venue.touch(now)
 
-        # Delete old generes
-        [db.session.delete(x) for x in venue.genres]
-
-        # Creating Venue generes instances and assigning using backref
-        for genre in genres:
-            new_genre = VenuesGenres(genre=genre)
-            new_genre.venue = venue  # backref
-            db.session.add(new_genre)
+        # Only the added / removed genres are written
+        venue.sync_genres(genres)
 
         db.session.commit()
+        search_index.add(VENUE, venue_id, name)
+        geo.venue_locator.add(venue_id, venue.latitude, venue.longitude)
+        # Listings (grouped by city) and the show list show the venue too, artist pages are tagged with it
+        response_cache.invalidate('venues', 'shows', f'venue:{venue_id}')
+        version_stamps.touch('venues', 'shows', f'venue:{venue_id}', *[f'artist:{x}' for x in artist_ids], at=now)
     except Exception as err:
         print(err)
         db.session.rollback()
@@ -551,6 +778,7 @@ def create_artist_submission():
         return redirect(url_for('create_artist_submission'))
 
     error = False
+    now = datetime.utcnow()
     try:
         # Create a venue instance using form data
         artist = Artist(
@@ -562,7 +790,9 @@ def create_artist_submission():
             facebook_link=facebook_link,
             website=website,
             seeking_venue=seeking_venue,
-            seeking_description=seeking_description
+            seeking_description=seeking_description,
+            genre_names=list(dict.fromkeys(genres)),
+            updated_at=now
         )
         db.session.add(artist)
 
@@ -573,6 +803,9 @@ def create_artist_submission():
             db.session.add(new_genre)
 
         db.session.commit()
+        search_index.add(ARTIST, artist.id, name)
+        response_cache.invalidate('artists')
+        version_stamps.touch('artists', at=now)
     except Exception as err:
         print(err)
         db.session.rollback()
@@ -592,21 +825,20 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@version_stamps.conditional(lambda: 'shows', shows_last_modified)
+@response_cache.cached('shows')
 def shows():
-    """ Get all shows """
-    shows = Show.query.all()
-    data = [
-        {
-            'venue_id': x.venue.id,
-            'venue_name': x.venue.name,
-            'artist_id': x.artist.id,
-            'artist_name': x.artist.name,
-            'artist_image_link': x.artist.image_link,
-            'start_time': x.start_time.isoformat()
-        }
-        for x in shows
-    ]
-    return render_template('pages/shows.html', shows=data)
+    """ Get all shows, optionally from / to a date or tonight / this weekend in a city / state """
+    filters = show_filter_args()
+    page = keyset_paginate(
+        Show.filter_listing(shows_query(), **filters),
+        [Show.start_time, Show.id],
+        keys=lambda x: (x.start_time, x.id),
+        **page_args(datetime, int)
+    )
+    data = show_listing(page.items)
+    response_cache.tag(*[f'venue:{x["venue_id"]}' for x in data], *[f'artist:{x["artist_id"]}' for x in data])
+    return render_template('pages/shows.html', shows=data, page=page, filters=filters)
 
 
 @app.route('/shows/create')
@@ -622,7 +854,6 @@ def create_show_submission():
     # Get the form data
     artist_id = request.form['artist_id']
     venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
 
     form = ShowForm()
     # Validate form data
@@ -645,13 +876,36 @@ def create_show_submission():
         flash('The artist id ' + artist_id + ' does not exist')
         return redirect(url_for('create_show_submission'))
 
+    # Neither the venue nor the artist may already be booked during the show
+    show_fields = {
+        'venue_id': venue.id,
+        'artist_id': artist.id,
+        'start_time': form.start_time.data,
+        'end_time': show_end_time(form.start_time.data, form.duration.data)
+    }
+    conflict = Show.find_conflicts([show_fields]).get(0)
+    if conflict is not None:
+        flash(str(conflict))
+        return redirect(url_for('create_show_submission'))
+
     try:
         # Create Show instance using form data
-        show = Show(venue_id=venue_id,
-                    artist_id=artist_id,
-                    start_time=start_time)
+        show = Show(**show_fields)
         db.session.add(show)
+        db.session.flush()
+        record_shows([show_fields])
+        # Show counts and show lists of both sides change
+        now = datetime.utcnow()
+        venue.updated_at = now
+        artist.updated_at = now
         db.session.commit()
+        response_cache.invalidate('shows', 'venues', f'venue:{venue_id}', f'artist:{artist_id}')
+        version_stamps.touch('shows', 'venues', 'artists', f'venue:{venue_id}', f'artist:{artist_id}', at=now)
+    except IntegrityError:
+        # Booked meanwhile by a concurrent request, rejected by the exclusion constraints
+        db.session.rollback()
+        flash('The venue or the artist has just been booked at that time')
+        return redirect(url_for('create_show_submission'))
     except():
         db.session.rollback()
         error = True
@@ -666,6 +920,59 @@ def create_show_submission():
         return render_template('pages/home.html')
 
 
+@app.route('/shows/batch')
+def create_tour_form():
+    """ Tour form, the shows of an artist at many venues and dates """
+    form = TourForm()
+    return render_template('forms/new_tour.html', form=form, errors={})
+
+
+@app.route('/shows/batch', methods=['POST'])
+def create_tour_submission():
+    """ Submit callback for the tour form, every show is created or none """
+    form = TourForm()
+    if not form.validate_on_submit():
+        flash(form.errors)
+        return redirect(url_for('create_tour_form'))
+
+    bookings, errors = booking.parse_tour(form.artist_id.data, form.dates.data)
+    if len(bookings) + len(errors) > app.config['BATCH_MAX_SHOWS']:
+        flash(f'A tour has at most {app.config["BATCH_MAX_SHOWS"]} shows')
+        return render_template('forms/new_tour.html', form=form, errors={}), 400
+    if not errors:
+        try:
+            errors = booking.schedule(bookings)
+        except IntegrityError:
+            # Booked meanwhile by a concurrent request, rejected by the exclusion constraints
+            flash('A venue or the artist has just been booked at one of these times')
+            return render_template('forms/new_tour.html', form=form, errors={}), 409
+    if errors:
+        # The form is sent back with its dates to fix the reported rows
+        return render_template('forms/new_tour.html', form=form, errors=errors), 400
+
+    flash(f'{len(bookings)} shows listed successfully')
+    return render_template('pages/home.html')
+
+
+@booking.shows_booked.connect_via(app)
+def invalidate_booked_shows(sender, venue_ids, artist_ids, at):
+    """ Drop the cached pages of the venues and artists of new shows """
+    tags = [f'venue:{x}' for x in venue_ids] + [f'artist:{x}' for x in artist_ids]
+    response_cache.invalidate('shows', 'venues', *tags)
+    version_stamps.touch('shows', 'venues', 'artists', *tags, at=at)
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):entity>.<any(jsonl, csv):file_format>')
+def export(entity, file_format):
+    """ Stream every venue, artist or show as JSON lines / CSV """
+    mimetype = 'application/x-ndjson' if file_format == 'jsonl' else 'text/csv'
+    body = exporter.serialize(exporter.export_rows(entity), file_format)
+    return Response(stream_with_context(body), mimetype=mimetype)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -673,9 +980,76 @@ def not_found_error(error):
 
 @app.errorhandler(500)
 def server_error(error):
+    metrics.count_server_error()
     return render_template('errors/500.html'), 500
 
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(importer.ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='File format, guessed from the extension by default.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows inserted per transaction.')
+def import_command(entity, path, file_format, chunk_size):
+    """ Bulk import venues, artists or shows from a CSV / JSON lines file """
+    if file_format is None:
+        file_format = 'csv' if path.endswith('.csv') else 'jsonl'
+    report = importer.ImportReport()
+    with click.open_file(path, encoding='utf-8') as stream:
+        rows = importer.read_rows(stream, file_format)
+        importer.import_rows(entity, rows, chunk_size=chunk_size, report=report)
+    for line, error in report.errors[:20]:
+        click.echo(f'line {line}: {error}', err=True)
+    if report.rejected > 20:
+        click.echo(f'... {report.rejected - 20} more rejected rows', err=True)
+    click.echo(str(report))
+    if report.errors:
+        sys.exit(1)
+
+
+@app.cli.command('geocode')
+@click.option('--table', type=click.Path(exists=True, dir_okay=False),
+              help='Lookup table of places (city, state, latitude, longitude), GEOCODE_TABLE by default.')
+@click.option('--overwrite', is_flag=True, help='Geocode venues which already have coordinates too.')
+def geocode_command(table, overwrite):
+    """ Fill the venue coordinates from the offline lookup table of places """
+    places = geo.load_places(table or app.config['GEOCODE_TABLE'])
+    geocoded, unknown = geo.geocode_venues(places, overwrite=overwrite)
+    click.echo(f'{geocoded} venues geocoded, {unknown} in places missing from the lookup table')
+
+
+@app.cli.command('roll-stats')
+@click.option('--rebuild', is_flag=True, help='Recount the stats of every venue and artist from their shows.')
+def roll_stats_command(rebuild):
+    """ Move the shows started since the last run from the upcoming to the past counts, run it periodically """
+    if rebuild:
+        refresh_show_stats(Show.venue_id, [x for x, in db.session.query(Venue.id)])
+        refresh_show_stats(Show.artist_id, [x for x, in db.session.query(Artist.id)])
+        db.session.commit()
+        click.echo('Show stats of every venue and artist recounted')
+        return
+    click.echo(f'{roll_show_stats()} venues / artists rolled')
+
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(exporter.ENTITIES)))
+@click.argument('path', default='-', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(exporter.FORMATS),
+              help='File format, guessed from the extension by default.')
+def export_command(entity, path, file_format):
+    """ Export every venue, artist or show to a CSV / JSON lines file (stdout by default) """
+    if file_format is None:
+        file_format = 'csv' if path.endswith('.csv') else 'jsonl'
+    with click.open_file(path, 'w', encoding='utf-8') as stream:
+        for chunk in exporter.serialize(exporter.export_rows(entity), file_format):
+            stream.write(chunk)
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
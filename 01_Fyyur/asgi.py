@@ -0,0 +1,308 @@
+"""
+File:           asgi.py
+ASGI entry point with an async read path.
+
+The read-only pages (venues, artists, shows, show_venue, show_artist and both
+searches) are answered by coroutines querying PostgreSQL through an asyncpg
+pool; the independent queries of the detail pages run concurrently. The
+queries are the ones of models.py / app.py, compiled for asyncpg, and the pages
+are rendered with the same templates. Every other request, writes included,
+is passed on to the Flask app.
+
+Flask contexts must not be held across an await, so each page is handled in
+synchronous steps around the awaited queries: read the request and build the
+queries, fetch, render. The response cache, version stamps, metrics and the
+profiler only apply to the Flask app.
+
+    uvicorn asgi:application --workers 4
+"""
+import asyncio
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+import asyncpg
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, render_template, session
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import HTTPException
+
+from app import app, csrf, venue_details, artist_details, search_results, shows_query, show_listing
+from models import Venue, Artist, Show, collect_show_counts, group_areas, db
+from pagination import keyset_query, keyset_page, page_args
+from filters import show_filter_args
+
+# Queries are compiled with %(name)s placeholders, then renumbered into asyncpg's $n
+DIALECT = postgresql.dialect(paramstyle='pyformat')
+
+VENUE_COLUMNS = [
+    Venue.id, Venue.name, Venue.genre_names, Venue.address, Venue.city, Venue.state, Venue.phone,
+    Venue.website, Venue.facebook_link, Venue.seeking_talent, Venue.seeking_description, Venue.image_link
+]
+ARTIST_COLUMNS = [
+    Artist.id, Artist.name, Artist.genre_names, Artist.city, Artist.state, Artist.phone, Artist.website,
+    Artist.facebook_link, Artist.seeking_venue, Artist.seeking_description, Artist.image_link
+]
+
+
+def compile_query(query):
+    """ Return (sql, args) of a SQLAlchemy query for asyncpg """
+    compiled = query.statement.compile(dialect=DIALECT)
+    params = compiled.construct_params()
+    names = list(params)
+    sql = compiled.string % {name: f'${position}' for position, name in enumerate(names, start=1)}
+    processors = compiled._bind_processors
+    return sql, [processors[x](params[x]) if x in processors else params[x] for x in names]
+
+
+def prepare(build):
+    """ Build a query in the app context (the models need the session's dialect) and compile it """
+    with app.app_context():
+        return compile_query(build())
+
+
+@lru_cache(maxsize=None)
+def _row_type(fields):
+    return namedtuple('Row', fields, rename=True)
+
+
+class Database:
+    """ asyncpg pool of the worker, opened on the first query or at lifespan startup """
+
+    def __init__(self, config):
+        self.config = config
+        self.pool = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self._lock:
+            if self.pool is not None:
+                return
+            options = {
+                'min_size': self.config['ASYNC_DB_POOL_MIN_SIZE'],
+                'max_size': self.config['ASYNC_DB_POOL_MAX_SIZE'],
+            }
+            if self.config['DB_POOLER']:
+                # PgBouncer in transaction mode: no prepared statement cache, no startup parameters
+                options['statement_cache_size'] = 0
+            else:
+                options['server_settings'] = {'statement_timeout': str(self.config['DB_STATEMENT_TIMEOUT_MS'])}
+            self.pool = await asyncpg.create_pool(self.config['SQLALCHEMY_DATABASE_URI'], **options)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def fetch(self, sql, args):
+        """ Rows of a compiled query as named tuples, like the rows of a SQLAlchemy query """
+        if self.pool is None:
+            await self.connect()
+        records = await self.pool.fetch(sql, *args)
+        if not records:
+            return []
+        row = _row_type(tuple(records[0].keys()))
+        return [row(*x) for x in records]
+
+
+def _environ(scope, body):
+    """ WSGI environ of an ASGI http scope, to build Flask request contexts from """
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'SERVER_NAME': scope.get('server', ('localhost', 80))[0],
+        'SERVER_PORT': str(scope.get('server', ('localhost', 80))[1]),
+        'REMOTE_ADDR': scope.get('client', ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    # The whole body has been read, chunked uploads included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def render(environ, template, status=200, **context):
+    """ Response of a rendered template, with the session cookie holding the CSRF token of the forms """
+    with app.request_context(environ):
+        response = app.make_response((render_template(template, **context), status))
+        app.session_interface.save_session(app, session, response)
+        return response
+
+
+#  Pages
+#  ----------------------------------------------------------------
+
+async def venues(database, environ):
+    with app.request_context(environ):
+        paging = page_args(str, str, int)
+        genre = request.args.get('genre')
+        query = db.session.query(*Venue.area_order())
+        if genre:
+            query = query.filter(Venue.has_genre(genre))
+        ids = compile_query(keyset_query(query, Venue.area_order(), paging['limit'], paging['after'], paging['before']))
+    page = keyset_page(await database.fetch(*ids), lambda x: (x.state, x.city, x.id), **paging)
+    areas = []
+    if page.items:
+        areas = await database.fetch(*prepare(lambda: Venue.areas_query([x.id for x in page.items])))
+    return render(environ, 'pages/venues.html', areas=group_areas(areas), page=page)
+
+
+async def artists(database, environ):
+    with app.request_context(environ):
+        paging = page_args(int)
+        genre = request.args.get('genre')
+        query = db.session.query(Artist.id, Artist.name)
+        if genre:
+            query = query.filter(Artist.has_genre(genre))
+        rows = compile_query(keyset_query(query, [Artist.id], paging['limit'], paging['after'], paging['before']))
+    page = keyset_page(await database.fetch(*rows), lambda x: (x.id,), **paging)
+    data = [{'id': x.id, 'name': x.name} for x in page.items]
+    return render(environ, 'pages/artists.html', artists=data, page=page)
+
+
+async def shows(database, environ):
+    with app.request_context(environ):
+        paging = page_args(datetime, int)
+        filters = show_filter_args()
+        query = Show.filter_listing(shows_query(), **filters)
+        columns = [Show.start_time, Show.id]
+        rows = compile_query(keyset_query(query, columns, paging['limit'], paging['after'], paging['before']))
+    page = keyset_page(await database.fetch(*rows), lambda x: (x.start_time, x.id), **paging)
+    return render(environ, 'pages/shows.html', shows=show_listing(page.items), page=page, filters=filters)
+
+
+async def _details(database, model, columns, shows_query_of, owner_id):
+    """ Columns and shows of a venue / artist, fetched concurrently """
+    owner, owner_shows = await asyncio.gather(
+        database.fetch(*prepare(lambda: db.session.query(*columns).filter(model.id == owner_id))),
+        database.fetch(*prepare(lambda: shows_query_of(owner_id)))
+    )
+    return owner[0] if owner else None, owner_shows
+
+
+async def show_venue(database, environ, venue_id):
+    venue, venue_shows = await _details(database, Venue, VENUE_COLUMNS, Venue.shows_with_artist_query, venue_id)
+    if venue is None:
+        return render(environ, 'errors/404.html', status=404)
+    data = venue_details(venue, venue.genre_names or [], venue_shows)
+    return render(environ, 'pages/show_venue.html', venue=data)
+
+
+async def show_artist(database, environ, artist_id):
+    artist, artist_shows = await _details(
+        database, Artist, ARTIST_COLUMNS, Artist.shows_with_venue_query, artist_id
+    )
+    if artist is None:
+        return render(environ, 'errors/404.html', status=404)
+    data = artist_details(artist, artist.genre_names or [], artist_shows)
+    return render(environ, 'pages/show_artist.html', artist=data)
+
+
+async def _search(database, environ, model, template):
+    with app.request_context(environ):
+        # What CSRFProtect checks before the search views of the Flask app
+        if app.config.get('WTF_CSRF_ENABLED', True):
+            csrf.protect()
+        search_term = request.form.get('search_term')
+        rows = compile_query(model.search_query(
+            search_term, app.config['SEARCH_LIMIT'], request.args.get('genre'), columns=[model.id, model.name]
+        ))
+    rows = await database.fetch(*rows)
+    show_counts = collect_show_counts(())
+    if rows:
+        show_counts = collect_show_counts(
+            await database.fetch(*prepare(lambda: model.show_counts_query([x.id for x in rows])))
+        )
+    return render(environ, template, results=search_results(rows, show_counts), search_term=search_term or '')
+
+
+async def search_venues(database, environ):
+    return await _search(database, environ, Venue, 'pages/search_venues.html')
+
+
+async def search_artists(database, environ):
+    return await _search(database, environ, Artist, 'pages/search_artists.html')
+
+
+ROUTES = [
+    ('GET', re.compile(r'/venues'), venues),
+    ('GET', re.compile(r'/venues/(?P<venue_id>\d+)'), show_venue),
+    ('POST', re.compile(r'/venues/search'), search_venues),
+    ('GET', re.compile(r'/artists'), artists),
+    ('GET', re.compile(r'/artists/(?P<artist_id>\d+)'), show_artist),
+    ('POST', re.compile(r'/artists/search'), search_artists),
+    ('GET', re.compile(r'/shows'), shows),
+]
+
+
+class AsyncReadApp:
+    """ ASGI app serving ROUTES itself and everything else through the WSGI app """
+
+    def __init__(self, flask_app):
+        self.database = Database(flask_app.config)
+        self.fallback = WsgiToAsgi(flask_app)
+
+    def match(self, scope):
+        for method, pattern, handler in ROUTES:
+            if scope['method'] != method:
+                continue
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                return handler, {key: int(value) for key, value in match.groupdict().items()}
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler, params = self.match(scope) if scope['type'] == 'http' else (None, None)
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        environ = _environ(scope, body)
+        try:
+            response = await handler(self.database, environ, **params)
+        except HTTPException as error:
+            # e.g. a missing CSRF token on a search
+            response = error.get_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.database.connect()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.database.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncReadApp(app)
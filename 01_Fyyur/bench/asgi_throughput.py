@@ -0,0 +1,114 @@
+"""
+File:           bench/asgi_throughput.py
+Throughput and latency of a running server under many concurrent keep-alive connections.
+
+Run the same data set (bench/seed.py, PostgreSQL) behind both entry points and
+point the benchmark at each of them:
+
+    gunicorn -w 4 app:app -b 127.0.0.1:8000
+    uvicorn asgi:application --workers 4 --port 8001
+
+    python bench/asgi_throughput.py http://127.0.0.1:8001 [--connections 1000] [--duration 30]
+                                    [--paths /venues /venues/{id} /artists/{id} /shows] [--ids 100]
+
+{id} in a path is replaced by a random id from 1 to --ids (the venues / artists
+of the data set). 1000 connections need `ulimit -n` above 1000 on both sides.
+"""
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def read_response(reader):
+    """ Read one HTTP/1.1 response, return (status, keep the connection open) """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(host, port, paths, ids, deadline, results):
+    """ One keep-alive connection requesting random paths until the deadline """
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        path = random.choice(paths).replace('{id}', str(random.randint(1, ids)))
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            status, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            results['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+            continue
+        results['latencies'].append(time.perf_counter() - start)
+        if status >= 400:
+            results['errors'] += 1
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, paths, ids, connections, duration):
+    parts = urlsplit(url)
+    results = {'latencies': [], 'errors': 0}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[
+        client(parts.hostname, parts.port or 80, paths, ids, deadline, results) for _ in range(connections)
+    ])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a running server with concurrent keep-alive connections')
+    parser.add_argument('url', help='base url of the server, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--paths', nargs='+', default=['/venues', '/venues/{id}', '/artists/{id}', '/shows'])
+    parser.add_argument('--ids', type=int, default=100, help='largest id substituted for {id}')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.paths, args.ids, args.connections, args.duration))
+    latencies = [x * 1000 for x in results['latencies']]
+    print(f'{args.connections} connections, {args.duration:.0f} s, {len(latencies)} responses, '
+          f'{results["errors"]} errors')
+    if latencies:
+        print(f'throughput {len(latencies) / args.duration:10.1f} req/s')
+        print(f'latency    p50 {percentile(latencies, 50):.1f} ms   p95 {percentile(latencies, 95):.1f} ms   '
+              f'p99 {percentile(latencies, 99):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+File:           bench/batch_shows.py
+Throughput of listing a whole tour: one show at a time against the batch endpoints.
+
+A tour of --shows shows of one artist at consecutive venues is listed three
+ways through the Flask test client: a POST /shows/create per show, one POST
+/shows/batch of the tour form and one POST /api/v1/shows/batch. Every method
+books its own artist and dates beyond the seeded shows, so nothing is rejected
+as double booked. Shows per second and SQL statements per tour are printed.
+
+    python bench/batch_shows.py [--database URI] [--shows 40 100] [--tours 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from seed import SHOW_DAYS, DEFAULT_DATABASE, bench_app  # noqa: E402
+
+METHODS = ('one by one', 'tour form', 'api batch')
+
+
+def tour(size, venues, first_day):
+    """ (venue_id, start_time) of the shows of a tour, one venue and day after another """
+    return [
+        (i % venues + 1, datetime.combine(first_day + timedelta(days=i), datetime.min.time()) + timedelta(hours=20))
+        for i in range(size)
+    ]
+
+
+def post_one_by_one(client, artist_id, shows):
+    for venue_id, start_time in shows:
+        response = client.post('/shows/create', data={
+            'venue_id': str(venue_id), 'artist_id': str(artist_id),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': '120'
+        })
+        if response.status_code != 200:
+            raise SystemExit(f'/shows/create answered {response.status_code}')
+
+
+def post_tour_form(client, artist_id, shows):
+    dates = '\n'.join(f'{venue_id}, {start_time:%Y-%m-%d %H:%M}, 120' for venue_id, start_time in shows)
+    response = client.post('/shows/batch', data={'artist_id': str(artist_id), 'dates': dates})
+    if response.status_code != 200:
+        raise SystemExit(f'/shows/batch answered {response.status_code}')
+
+
+def post_api_batch(client, artist_id, shows):
+    body = {'shows': [
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time.isoformat(), 'duration': 120}
+        for venue_id, start_time in shows
+    ]}
+    response = client.post('/api/v1/shows/batch', data=json.dumps(body), content_type='application/json')
+    if response.status_code != 201:
+        raise SystemExit(f'/api/v1/shows/batch answered {response.status_code}: {response.get_data(as_text=True)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tour listing throughput, per show against batch')
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE_URI', DEFAULT_DATABASE))
+    parser.add_argument('--shows', type=int, nargs='+', default=[40, 100], help='shows per tour')
+    parser.add_argument('--tours', type=int, default=5, help='tours listed per method and size')
+    args = parser.parse_args()
+
+    app = bench_app(args.database)
+    app.config['WTF_CSRF_ENABLED'] = False
+    from sqlalchemy import event
+    from models import Venue, Artist, db
+    posts = dict(zip(METHODS, (post_one_by_one, post_tour_form, post_api_batch)))
+
+    counter = {'queries': 0}
+    with app.app_context():
+        def count(*args):
+            counter['queries'] += 1
+        event.listen(db.engine, 'before_cursor_execute', count)
+        venues, artists = Venue.query.count(), Artist.query.count()
+        db.session.remove()
+    if not venues or artists < len(METHODS) * args.tours * len(args.shows):
+        sys.exit('Not enough venues / artists, load the database with bench/seed.py first')
+
+    client = app.test_client()
+    # Beyond the seeded shows, every tour gets its own artist and days
+    first_day = date.today() + timedelta(days=SHOW_DAYS + 30)
+    artist_id = artists
+    print(f'{"shows":>6} {"method":<12} {"shows/s":>10} {"ms / tour":>10} {"queries / tour":>15}')
+    for size in args.shows:
+        for method in METHODS:
+            elapsed = queries = 0
+            for _ in range(args.tours):
+                shows = tour(size, venues, first_day)
+                first_day += timedelta(days=size)
+                counter['queries'] = 0
+                start = time.perf_counter()
+                posts[method](client, artist_id, shows)
+                elapsed += time.perf_counter() - start
+                queries += counter['queries']
+                artist_id -= 1
+            print(f'{size:>6} {method:<12} {size * args.tours / elapsed:>10.0f} '
+                  f'{elapsed * 1000 / args.tours:>10.1f} {queries / args.tours:>15.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+File:           bench/format_datetime.py
+Micro-benchmark of the `datetime` Jinja filter for a 5,000 show page.
+
+Compares the old path (isoformat() in the view, dateutil parse and Babel
+pattern resolution per call) with the cached formatter fed datetime objects.
+
+    python bench/format_datetime.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app import format_datetime, format_datetime_cached  # noqa: E402
+
+SHOWS = 5000
+FULL = " EEEE MMMM, d, y 'at' h:mma"
+# Shows start on the hour, so times repeat across a page like on the real site
+START_TIMES = [datetime(2026, 1, 1, 20) + timedelta(hours=(i * 7) % 2000) for i in range(SHOWS)]
+
+
+def old_filter(value):
+    return babel.dates.format_datetime(dateutil.parser.parse(value), FULL)
+
+
+def render_old():
+    for value in START_TIMES:
+        old_filter(value.isoformat())
+
+
+def render_new():
+    for value in START_TIMES:
+        format_datetime(value, 'full')
+
+
+def main():
+    assert old_filter(START_TIMES[0].isoformat()) == format_datetime(START_TIMES[0], 'full')
+    old = min(timeit.repeat(render_old, number=1, repeat=5))
+    format_datetime_cached.cache_clear()
+    cold = timeit.timeit(render_new, number=1)
+    warm = min(timeit.repeat(render_new, number=1, repeat=5))
+    print(f'{SHOWS} shows per page')
+    print(f'parse + babel per call:  {old * 1000:8.1f} ms')
+    print(f'cached formatter, cold:  {cold * 1000:8.1f} ms')
+    print(f'cached formatter, warm:  {warm * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+File:           bench/locustfile.py
+Locust scenario of a visitor browsing listings, detail pages and searching.
+
+Run it against a server holding the bench/seed.py data set; Locust reports
+p50 / p95 / p99 per route (pip install locust, it is not an app dependency).
+
+    locust -f bench/locustfile.py --host http://127.0.0.1:5000 \
+           --headless -u 50 -r 10 -t 2m --csv bench/locust
+
+BENCH_OWNERS is the number of venues / artists in the data set (scale / 10).
+"""
+import os
+import random
+import re
+
+from locust import HttpUser, task, between
+
+OWNERS = int(os.getenv('BENCH_OWNERS', 100))
+TERMS = ['the', 'park', 'jazz', 'blue hall', 'san francisco', 'ca']
+GENRES = ['Jazz', 'Rock n Roll', 'Blues', 'Pop', 'Folk']
+CSRF_TOKEN = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+class Visitor(HttpUser):
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        # The search forms are CSRF protected, the token comes with any page
+        match = CSRF_TOKEN.search(self.client.get('/').text)
+        self.csrf_token = match.group(1) if match else ''
+
+    @task(4)
+    def venues(self):
+        self.client.get('/venues')
+
+    @task(1)
+    def venues_by_genre(self):
+        self.client.get(f'/venues?genre={random.choice(GENRES)}', name='/venues?genre=')
+
+    @task(8)
+    def venue(self):
+        self.client.get(f'/venues/{random.randint(1, OWNERS)}', name='/venues/<id>')
+
+    @task(4)
+    def artists(self):
+        self.client.get('/artists')
+
+    @task(8)
+    def artist(self):
+        self.client.get(f'/artists/{random.randint(1, OWNERS)}', name='/artists/<id>')
+
+    @task(4)
+    def shows(self):
+        self.client.get('/shows')
+
+    @task(2)
+    def search(self):
+        kind = random.choice(['venues', 'artists'])
+        self.client.post(f'/{kind}/search', name=f'/{kind}/search',
+                         data={'search_term': random.choice(TERMS), 'csrf_token': self.csrf_token})
+
+    @task(6)
+    def suggest(self):
+        term = random.choice(TERMS)
+        self.client.get(f'/search/suggest?q={term[:random.randint(1, len(term))]}', name='/search/suggest')
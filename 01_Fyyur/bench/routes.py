@@ -0,0 +1,223 @@
+"""
+File:           bench/routes.py
+Latency, queries per request and memory of every route, run in-process
+through the Flask test client against the database loaded by bench/seed.py.
+
+Each route is requested a number of times after a warm-up request; p50 / p95 /
+p99 latency, SQL statements per request and the process RSS are printed. The
+response cache is disabled unless --cache is given, so every request reaches
+the database. DELETE /venues/<id> is not exercised as it rewrites the data set.
+
+--save writes the results to the baseline file; --baseline compares against it
+and exits with status 1 when a route runs more queries than before or its p95
+is more than --tolerance slower, which makes `fab test` block the deploy.
+
+The same routes are pytest-benchmark cases in tests/test_route_benchmarks.py,
+run on the seeded test database; this script is the baseline and regression gate.
+
+    python bench/routes.py [--database URI] [--requests 30] [--only venue]
+                           [--baseline bench/baseline.json [--save]] [--tolerance 0.3]
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from seed import bench_app, DEFAULT_DATABASE  # noqa: E402
+
+# A route slower than its baseline by less than this is never a regression
+SLACK_MS = 2.0
+
+VENUE_FORM = {
+    'name': 'Bench Hall', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+    'phone': '123-123-1234', 'image_link': '', 'facebook_link': '', 'website': '',
+    'seeking_talent': 'No', 'seeking_description': '', 'genres': ['Jazz', 'Blues']
+}
+ARTIST_FORM = {
+    'name': 'Bench Band', 'city': 'San Francisco', 'state': 'CA', 'phone': '326-123-5000',
+    'image_link': '', 'facebook_link': '', 'website': '', 'seeking_venue': 'No',
+    'seeking_description': '', 'genres': ['Rock n Roll']
+}
+
+
+def routes(venue_id, artist_id):
+    """ (name, method, path, form data or a function returning it) of every route of app.py """
+    slots = itertools.count()
+
+    def show_form():
+        # Every show gets its own slot, beyond the seeded ones, so none is rejected as double booked
+        start_time = datetime.now() + timedelta(days=400, hours=3 * next(slots))
+        return {
+            'venue_id': str(venue_id), 'artist_id': str(artist_id),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': '120'
+        }
+
+    def tour_form():
+        # Ten shows in ten slots of their own
+        starts = [datetime.now() + timedelta(days=400, hours=3 * next(slots)) for _ in range(10)]
+        return {'artist_id': str(artist_id), 'dates': '\n'.join(f'{venue_id}, {x:%Y-%m-%d %H:%M}' for x in starts)}
+    return [
+        ('home', 'GET', '/', None),
+        ('venues', 'GET', '/venues', None),
+        ('venues genre', 'GET', '/venues?genre=Jazz', None),
+        ('venue', 'GET', f'/venues/{venue_id}', None),
+        ('venue search', 'POST', '/venues/search', {'search_term': 'park'}),
+        ('venues nearby', 'GET', '/venues/nearby?lat=37.77&lon=-122.42', None),
+        ('venue create form', 'GET', '/venues/create', None),
+        ('venue create', 'POST', '/venues/create', VENUE_FORM),
+        ('venue edit form', 'GET', f'/venues/{venue_id}/edit', None),
+        ('venue edit', 'POST', f'/venues/{venue_id}/edit', VENUE_FORM),
+        ('artists', 'GET', '/artists', None),
+        ('artists genre', 'GET', '/artists?genre=Jazz', None),
+        ('artist', 'GET', f'/artists/{artist_id}', None),
+        ('artist search', 'POST', '/artists/search', {'search_term': 'band'}),
+        ('artist create form', 'GET', '/artists/create', None),
+        ('artist create', 'POST', '/artists/create', ARTIST_FORM),
+        ('artist edit form', 'GET', f'/artists/{artist_id}/edit', None),
+        ('artist edit', 'POST', f'/artists/{artist_id}/edit', ARTIST_FORM),
+        ('shows', 'GET', '/shows', None),
+        ('shows 100', 'GET', '/shows?limit=100', None),
+        ('show create form', 'GET', '/shows/create', None),
+        ('show create', 'POST', '/shows/create', show_form),
+        ('tour create form', 'GET', '/shows/batch', None),
+        ('tour create', 'POST', '/shows/batch', tour_form),
+        ('suggest', 'GET', '/search/suggest?q=the', None),
+        ('export venues', 'GET', '/export/venues.jsonl', None),
+        ('export shows', 'GET', '/export/shows.csv', None),
+        ('api venues', 'GET', '/api/v1/venues', None),
+        ('api venue', 'GET', f'/api/v1/venues/{venue_id}', None),
+        ('api venue search', 'GET', '/api/v1/venues/search?q=park', None),
+        ('api venues nearby', 'GET', '/api/v1/venues/nearby?lat=40.71&lon=-74.0&radius=25', None),
+        ('api artists', 'GET', '/api/v1/artists?fields=id,name', None),
+        ('api artist', 'GET', f'/api/v1/artists/{artist_id}', None),
+        ('api artist search', 'GET', '/api/v1/artists/search?q=band', None),
+        ('api shows', 'GET', '/api/v1/shows', None),
+        ('cache stats', 'GET', '/cache/stats', None),
+        ('pool stats', 'GET', '/pool/stats', None),
+        ('metrics', 'GET', '/metrics', None),
+    ]
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def rss_mib():
+    """ Current resident set size, the peak where /proc is not available """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(app, counter, method, path, data, requests):
+    """ Time requests calls of one route, return its result dict """
+    # A fresh client per route, flashed messages of writes do not leak into reads
+    client = app.test_client()
+    timings = []
+    queries = 0
+    for i in range(requests + 1):
+        counter['queries'] = 0
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data() if callable(data) else data)
+        response.get_data()
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} answered {response.status_code}')
+        # The first request warms caches up and is not counted
+        if i:
+            timings.append(elapsed)
+            queries += counter['queries']
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': round(queries / requests, 1),
+        'rss_mib': round(rss_mib(), 1)
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """ Return a message for every route slower or chattier than its baseline """
+    found = []
+    for name, result in results.items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            found.append(f'{name}: {result["queries"]} queries per request, baseline {before["queries"]}')
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance) + SLACK_MS:
+            found.append(f'{name}: p95 {result["p95_ms"]:.2f} ms, baseline {before["p95_ms"]:.2f} ms')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route of the app')
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE_URI', DEFAULT_DATABASE))
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--only', help='run the routes whose name contains this text')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--baseline', help='baseline JSON file to compare against')
+    parser.add_argument('--save', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed p95 slowdown, 0.3 = 30%%')
+    args = parser.parse_args()
+
+    app = bench_app(args.database)
+    app.config['WTF_CSRF_ENABLED'] = False
+    from sqlalchemy import event
+    from app import response_cache
+    from cache import NullBackend
+    from models import Venue, Artist, Show, db
+    if not args.cache:
+        response_cache.backend = NullBackend()
+
+    counter = {'queries': 0}
+    results = {}
+    with app.app_context():
+        def count(*args):
+            counter['queries'] += 1
+        event.listen(db.engine, 'before_cursor_execute', count)
+        rows = {'venues': Venue.query.count(), 'artists': Artist.query.count(), 'shows': Show.query.count()}
+        db.session.remove()
+    if not rows['venues'] or not rows['artists']:
+        sys.exit('The database is empty, load it with bench/seed.py first')
+
+    print(f'{rows["venues"]} venues, {rows["artists"]} artists, {rows["shows"]} shows, '
+          f'{args.requests} requests per route')
+    print(f'{"route":<20} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"RSS MiB":>8}')
+    for name, method, path, data in routes(rows['venues'] // 2 or 1, rows['artists'] // 2 or 1):
+        if args.only and args.only not in name:
+            continue
+        result = results[name] = measure(app, counter, method, path, data, args.requests)
+        print(f'{name:<20} {result["p50_ms"]:9.2f} {result["p95_ms"]:9.2f} {result["p99_ms"]:9.2f} '
+              f'{result["queries"]:8.1f} {result["rss_mib"]:8.1f}')
+
+    if not args.baseline:
+        return
+    if args.save:
+        with open(args.baseline, 'w') as baseline:
+            json.dump({'rows': rows, 'routes': results}, baseline, indent=2, sort_keys=True)
+        print(f'baseline written to {args.baseline}')
+        return
+    with open(args.baseline) as baseline:
+        baseline = json.load(baseline)
+    if baseline['rows'] != rows:
+        sys.exit(f'The baseline was recorded with {baseline["rows"]}, reload the same data set')
+    found = regressions(results, baseline, args.tolerance)
+    for message in found:
+        print(f'REGRESSION {message}')
+    sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
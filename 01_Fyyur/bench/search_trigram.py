@@ -0,0 +1,77 @@
+"""
+File:           bench/search_trigram.py
+Compare the venue name search with and without the pg_trgm GIN index.
+
+Builds a throwaway table of synthetic venue names (1M rows by default) in the
+database configured in config.py, runs the same ILIKE search before and after
+creating the trigram index and prints latency percentiles.
+
+    python bench/search_trigram.py [rows]
+"""
+import os
+import sys
+import time
+from statistics import median
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config  # noqa: E402
+
+TABLE = 'bench_search_venue'
+TERMS = ['jazz', 'club', 'hall', 'blue', 'park 12', 'the musical hop', 'xyz']
+REPEAT = 5
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run_searches(conn, ranked):
+    sql = f'SELECT name FROM {TABLE} WHERE name ILIKE :pattern'
+    if ranked:
+        sql += ' ORDER BY similarity(name, :term) DESC'
+    sql += ' LIMIT 50'
+    timings = []
+    for _ in range(REPEAT):
+        for term in TERMS:
+            start = time.perf_counter()
+            conn.execute(text(sql), pattern=f'%{term}%', term=term).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f'{label:<24} p50 {median(timings):8.2f} ms   p95 {percentile(timings, 95):8.2f} ms')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    engine = create_engine(os.getenv('BENCH_DATABASE_URI', config.SQLALCHEMY_DATABASE_URI))
+    with engine.connect() as conn:
+        conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        conn.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        conn.execute(f'CREATE TABLE {TABLE} (id serial PRIMARY KEY, name varchar NOT NULL)')
+        # Synthetic names such as "The Blue Club 123456"
+        conn.execute(text(f"""
+            INSERT INTO {TABLE} (name)
+            SELECT (ARRAY['The', 'Old', 'Park', 'Blue', 'Red'])[1 + i % 5] || ' ' ||
+                   (ARRAY['Musical', 'Jazz', 'Dueling', 'Hop', 'Rock'])[1 + (i / 5) % 5] || ' ' ||
+                   (ARRAY['Hall', 'Club', 'Pianos', 'Bar', 'Lounge'])[1 + (i / 25) % 5] || ' ' || i
+            FROM generate_series(1, :rows) AS i
+        """), rows=rows)
+        conn.execute(f'ANALYZE {TABLE}')
+        print(f'{rows} rows')
+        try:
+            report('ILIKE seq scan', run_searches(conn, ranked=False))
+            conn.execute(f'CREATE INDEX ix_{TABLE}_name_trgm ON {TABLE} USING gin (name gin_trgm_ops)')
+            conn.execute(f'ANALYZE {TABLE}')
+            report('ILIKE trigram index', run_searches(conn, ranked=False))
+            report('ranked trigram index', run_searches(conn, ranked=True))
+        finally:
+            conn.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+File:           bench/seed.py
+Seeded synthetic data set of venues, artists, genres and shows for the benchmarks.
+
+The scale is the number of shows, with one venue and one artist per ten shows
+and one to three genres each. The same seed always produces the same rows;
+two hour shows are spread over the evenings of the year before and after the
+anchor date (today), never double booking a venue or an artist.
+Venues are placed within about 20 km of their city, geocoded from data/places.csv.
+
+SQLite databases are created from the models. PostgreSQL databases have to be
+migrated first (flask db upgrade), their tables are truncated.
+
+    python bench/seed.py [--scale 1k|10k|100k|1m] [--seed 42] [--database URI]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forms import VenueForm  # noqa: E402
+from geo import load_places, geocode  # noqa: E402
+from models import (  # noqa: E402
+    Venue, VenuesGenres, VenueStats, Artist, ArtistsGenres, ArtistStats, Show, Deletions, record_shows, db
+)
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+DEFAULT_DATABASE = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.sqlite')
+PLACES_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'places.csv')
+CHUNK_SIZE = 10000
+# Shows start at one of these hours and last until the next one
+SHOW_HOURS = (18, 20, 22)
+SHOW_DAYS = 365
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+PLACES = [('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'),
+          ('Chicago', 'IL'), ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'), ('Portland', 'OR'),
+          ('Denver', 'CO'), ('Nashville', 'TN'), ('Atlanta', 'GA'), ('Miami', 'FL'), ('Boston', 'MA'),
+          ('New Orleans', 'LA'), ('Detroit', 'MI'), ('Philadelphia', 'PA'), ('Phoenix', 'AZ')]
+WORDS = ['The', 'Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live', 'Music',
+         'Coffee', 'Blue', 'Red', 'Wild', 'Sax', 'Band', 'Club', 'Hall', 'Lounge', 'Room']
+
+
+def bench_app(database):
+    """ The Fyyur app bound to the benchmark database """
+    from app import app
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    if database.startswith('sqlite'):
+        # Neither PostgreSQL startup options nor execute_values exist for SQLite
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].pop('connect_args', None)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].pop('executemany_mode', None)
+    return app
+
+
+def _name(rng, i):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f' {i}'
+
+
+def _owners(rng, count, now, seeking_column, **extra):
+    """ Yield (row, genres) of count venues / artists """
+    for id_ in range(1, count + 1):
+        city, state = rng.choice(PLACES)
+        genres = rng.sample(GENRES, rng.randint(1, 3))
+        row = {
+            'id': id_, 'name': _name(rng, id_), 'city': city, 'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'genre_names': genres, 'updated_at': now, seeking_column: rng.random() < 0.5
+        }
+        row.update(extra)
+        yield row, genres
+
+
+def _located(rows, seed):
+    """ Add coordinates around the geocoded city to venue rows, from their own random sequence """
+    rng = random.Random(seed)
+    places = load_places(PLACES_TABLE)
+    for row, genres in rows:
+        latitude, longitude = geocode(row['city'], row['state'], places)
+        # About 0.2 degree either way, the spread of a metropolitan area
+        row['latitude'] = latitude + rng.uniform(-0.2, 0.2)
+        row['longitude'] = longitude + rng.uniform(-0.2, 0.2)
+        yield row, genres
+
+
+def _shows(rng, count, owners, anchor):
+    """ Yield count shows, redrawing the ones whose venue or artist is already booked in that slot """
+    slots = (2 * SHOW_DAYS + 1) * len(SHOW_HOURS)
+    booked = set()  # venue_id * slots + slot, and negated for the artists
+    for id_ in range(1, count + 1):
+        while True:
+            venue_id, artist_id = rng.randint(1, owners), rng.randint(1, owners)
+            day, hour = rng.randint(-SHOW_DAYS, SHOW_DAYS), rng.randrange(len(SHOW_HOURS))
+            slot = (day + SHOW_DAYS) * len(SHOW_HOURS) + hour
+            venue_key, artist_key = venue_id * slots + slot, -(artist_id * slots + slot)
+            if venue_key not in booked and artist_key not in booked:
+                break
+        booked.update((venue_key, artist_key))
+        start_time = anchor + timedelta(days=day, hours=SHOW_HOURS[hour])
+        yield {
+            'id': id_,
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours=2)
+        }
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert_owners(model, genre_model, owner_column, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(model.__table__.insert(), [row for row, _ in chunk])
+        db.session.execute(genre_model.__table__.insert(), [
+            {owner_column: row['id'], 'genre': genre} for row, genres in chunk for genre in genres
+        ])
+
+
+def _reset():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        tables = ', '.join(f'"{x.__tablename__}"' for x in (
+            Show, VenuesGenres, ArtistsGenres, VenueStats, ArtistStats, Deletions, Venue, Artist))
+        db.session.execute(f'TRUNCATE {tables} RESTART IDENTITY')
+    else:
+        db.drop_all()
+        db.create_all()
+
+
+def _restart_sequences():
+    """ Rows were inserted with explicit ids, move the PostgreSQL sequences past them """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for model in (Venue, VenuesGenres, Artist, ArtistsGenres, Show):
+        table = model.__tablename__
+        db.session.execute(
+            f"SELECT setval('\"{table}_id_seq\"', COALESCE((SELECT MAX(id) FROM \"{table}\"), 0) + 1, false)"
+        )
+
+
+def seed(scale, seed=42, anchor=None):
+    """ Replace the content of the database with the synthetic data set, return (venues, artists, shows) """
+    rng = random.Random(seed)
+    anchor = anchor or datetime.combine(date.today(), datetime.min.time())
+    owners = max(1, scale // 10)
+    _reset()
+    _insert_owners(Venue, VenuesGenres, 'venue_id', _located(_owners(
+        rng, owners, anchor, 'seeking_talent', address='1015 Folsom Street'), seed))
+    _insert_owners(Artist, ArtistsGenres, 'artist_id', _owners(
+        rng, owners, anchor, 'seeking_venue'))
+    for chunk in _chunks(_shows(rng, scale, owners, anchor)):
+        db.session.execute(Show.__table__.insert(), chunk)
+        record_shows(chunk)
+    _restart_sequences()
+    db.session.commit()
+    return owners, owners, scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load the synthetic benchmark data set')
+    parser.add_argument('--scale', choices=SCALES, default='1k', help='number of shows')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE_URI', DEFAULT_DATABASE))
+    args = parser.parse_args()
+
+    app = bench_app(args.database)
+    start = time.perf_counter()
+    with app.app_context():
+        venues, artists, shows = seed(SCALES[args.scale], args.seed)
+    print(f'{venues} venues, {artists} artists, {shows} shows loaded in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+File:           bench/shows_range.py
+Latency of the filtered show listings as the history of past shows grows.
+
+The data set of bench/seed.py is loaded once, then past shows (before the
+anchor date) are added in steps up to the largest size. After each step the
+filtered /shows pages are requested through the Flask test client with the
+response cache disabled, and p50 / p95 are printed per size. Served from the
+(start_time, id) index, the pages only read the rows of their own time range,
+so the latency should stay flat however many past shows there are.
+
+    python bench/shows_range.py [--database URI] [--scale 10k] [--sizes 100k 1m 3m]
+                                [--requests 30] [--city Seattle]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from seed import SCALES, SHOW_DAYS, DEFAULT_DATABASE, bench_app, seed, _chunks  # noqa: E402
+from models import Show, record_shows, db  # noqa: E402
+
+SIZES = {'100k': 100000, '1m': 1000000, '3m': 3000000, '10m': 10000000}
+
+
+def paths(city):
+    """ (name, path) of the filtered listings """
+    city = city.replace(' ', '+')
+    month = f'from={date.today().isoformat()}&to={(date.today() + timedelta(days=30)).isoformat()}'
+    return [
+        ('tonight', '/shows?when=tonight'),
+        ('weekend city', f'/shows?when=weekend&city={city}'),
+        ('next month', f'/shows?{month}'),
+        ('api weekend city', f'/api/v1/shows?when=weekend&city={city}'),
+    ]
+
+
+def _past_show(id_, owners, anchor):
+    """
+    Show id_ in the past of the seeded ones. Every venue plays once per three hour slot, the
+    artists of a slot being a rotation of its venues, so nothing is double booked.
+    """
+    slot, venue = divmod(id_, owners)
+    start_time = anchor - timedelta(days=SHOW_DAYS + 1, hours=3 * slot)
+    return {
+        'id': id_,
+        'venue_id': venue + 1,
+        'artist_id': (venue + slot) % owners + 1,
+        'start_time': start_time,
+        'end_time': start_time + timedelta(hours=2)
+    }
+
+
+def add_past_shows(count, first_id, owners, anchor):
+    """ Insert count shows before the ones of the seeded data set """
+    shows = (_past_show(id_, owners, anchor) for id_ in range(first_id, first_id + count))
+    for chunk in _chunks(shows):
+        db.session.execute(Show.__table__.insert(), chunk)
+        record_shows(chunk)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def measure(client, path, requests):
+    client.get(path)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise SystemExit(f'{path} answered {response.status_code}')
+    return percentile(latencies, 50), percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filtered show listing latency as past shows grow')
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE_URI', DEFAULT_DATABASE))
+    parser.add_argument('--scale', choices=SCALES, default='10k', help='base data set, see bench/seed.py')
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=['100k', '1m', '3m'],
+                        help='total number of shows to measure at')
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--city', default='Seattle')
+    args = parser.parse_args()
+
+    app = bench_app(args.database)
+    from app import response_cache
+    from cache import NullBackend
+    response_cache.backend = NullBackend()
+    client = app.test_client()
+    anchor = datetime.combine(date.today(), datetime.min.time())
+
+    with app.app_context():
+        owners, _, total = seed(SCALES[args.scale], anchor=anchor)
+        sizes = [total] + sorted(SIZES[x] for x in args.sizes if SIZES[x] > total)
+        results = {}
+        for size in sizes:
+            if size > total:
+                start = time.perf_counter()
+                add_past_shows(size - total, total + 1, owners, anchor)
+                print(f'{size - total} past shows added in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+                total = size
+            for name, path in paths(args.city):
+                results.setdefault(name, []).append(measure(client, path, args.requests))
+
+    print(f'{"shows":<18}' + ''.join(f'{x:>22,}' for x in sizes))
+    for name, timings in results.items():
+        print(f'{name:<18}' + ''.join(f'{f"{p50:.1f} / {p95:.1f} ms":>22}' for p50, p95 in timings))
+    print(f'{"":<18}' + ''.join(f'{"p50 / p95":>22}' for _ in sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+File:           bench/suggest_memory.py
+Memory footprint and lookup latency of the type-ahead PrefixIndex.
+
+    python bench/suggest_memory.py [names]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from suggest import PrefixIndex, VENUE, ARTIST  # noqa: E402
+
+WORDS = ['The', 'Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live',
+         'Music', 'Coffee', 'Guns', 'N', 'Petals', 'Matt', 'Quevedo', 'Wild', 'Sax', 'Band']
+
+
+def names(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        kind = VENUE if i % 2 else ARTIST
+        yield kind, i, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f' {i}'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = PrefixIndex()
+    index.build(names(count))
+    build_time = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{count} names, {len(index._entries)} keys, built in {build_time:.1f} s')
+    print(f'memory: {current / 2 ** 20:.1f} MiB resident, {peak / 2 ** 20:.1f} MiB peak while building')
+
+    rng = random.Random(7)
+    prefixes = [rng.choice(WORDS).lower()[:rng.randint(1, 4)] for _ in range(2000)]
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.suggest(prefix, limit=10)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    print(f'suggest(): p50 {median(timings):.1f} us   p99 {timings[int(len(timings) * 0.99)]:.1f} us')
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(VENUE, count + i, f'New Venue {i}')
+    print(f'add(): {(time.perf_counter() - start) * 1000:.1f} us per name')
+
+
+if __name__ == '__main__':
+    main()
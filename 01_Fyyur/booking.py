@@ -0,0 +1,137 @@
+"""
+File:           booking.py
+Bulk show scheduling: a whole tour of shows validated and created at once.
+
+The venue and artist ids of the submission are checked with one IN query
+each, double bookings with Show.find_conflicts(), and the shows are written
+with a single multi-row INSERT in one transaction. A submission with any bad
+row is rejected as a whole and every error is reported with its row number,
+so the tour can be fixed and sent again.
+
+Used by /shows/batch (form) and /api/v1/shows/batch (JSON). After a commit
+the shows_booked signal carries the touched venue and artist ids, app.py
+drops the cached pages showing them.
+"""
+from datetime import datetime
+
+from blinker import Namespace
+from flask import current_app
+
+from models import Venue, Artist, Show, show_end_time, record_shows, MAX_SHOW_DURATION, db
+
+signals = Namespace()
+# Sent with venue_ids, artist_ids and at (the UTC time of the commit) once shows are created
+shows_booked = signals.signal('shows-booked')
+
+
+def _int(value, name):
+    """ A positive whole number from an int or a string of digits, 1.5 or '1.5' are not truncated """
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f'{name} must be a whole number above 0')
+    return value
+
+
+def _datetime(value, name):
+    """ A naive datetime, as stored in Shows. Times with an offset are refused rather than guessed. """
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError(f'{name} must be a date and time such as 2021-05-21 21:30')
+    if value.tzinfo is not None:
+        raise ValueError(f'{name} must be a local time of the venue, without a UTC offset')
+    return value
+
+
+def booking(venue_id, artist_id, start_time, duration=None, end_time=None):
+    """
+    Column values of one show from submitted values, duration in minutes or an end_time.
+    Raise ValueError with a message for bad values.
+    """
+    start_time = _datetime(start_time, 'start_time')
+    if end_time not in (None, ''):
+        end_time = _datetime(end_time, 'end_time')
+    else:
+        minutes = _int(duration, 'duration') if duration not in (None, '') else None
+        end_time = show_end_time(start_time, minutes)
+    if not start_time < end_time <= start_time + MAX_SHOW_DURATION:
+        raise ValueError(f'A show lasts from 1 minute to {MAX_SHOW_DURATION.total_seconds() // 3600:.0f} hours')
+    return {
+        'venue_id': _int(venue_id, 'venue_id'),
+        'artist_id': _int(artist_id, 'artist_id'),
+        'start_time': start_time,
+        'end_time': end_time
+    }
+
+
+def parse_tour(artist_id, text):
+    """
+    Bookings of the tour form: one show per non-empty line of text as
+    `venue_id, start time[, duration in minutes]`, all of them for artist_id.
+    Return (bookings, {row: error}), rows numbered from 1 over the non-empty lines.
+    """
+    bookings, errors = [], {}
+    lines = [x.strip() for x in text.splitlines() if x.strip()]
+    for row, line in enumerate(lines, start=1):
+        fields = [x.strip() for x in line.split(',')]
+        if len(fields) not in (2, 3):
+            errors[row] = 'Expected venue id, start time and optionally a duration in minutes'
+            continue
+        try:
+            bookings.append(booking(fields[0], artist_id, *fields[1:]))
+        except ValueError as err:
+            errors[row] = str(err)
+    return bookings, errors
+
+
+def touch_owners(venue_ids, artist_ids, now):
+    """ Bump updated_at of the venues and artists of new shows, whose show counts and show lists change """
+    Venue.query.filter(Venue.id.in_(venue_ids)).update({Venue.updated_at: now}, synchronize_session=False)
+    Artist.query.filter(Artist.id.in_(artist_ids)).update({Artist.updated_at: now}, synchronize_session=False)
+
+
+def _existing_ids(model, ids):
+    return {x for x, in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def schedule(bookings):
+    """
+    Create the shows of bookings (dicts of venue_id, artist_id, start_time and end_time) in
+    one transaction. Return {row: error} numbered from 1, nothing is written unless it is empty.
+    A show booked meanwhile by a concurrent transaction makes the commit raise IntegrityError
+    on PostgreSQL (exclusion constraints), the session is rolled back before it propagates.
+    """
+    venue_ids = {x['venue_id'] for x in bookings}
+    artist_ids = {x['artist_id'] for x in bookings}
+    known_venues = _existing_ids(Venue, venue_ids)
+    known_artists = _existing_ids(Artist, artist_ids)
+    errors = {}
+    for position, show in enumerate(bookings):
+        if show['venue_id'] not in known_venues:
+            errors[position + 1] = f'The venue id {show["venue_id"]} does not exist'
+        elif show['artist_id'] not in known_artists:
+            errors[position + 1] = f'The artist id {show["artist_id"]} does not exist'
+    valid = [x for x in range(len(bookings)) if x + 1 not in errors]
+    conflicts = Show.find_conflicts([bookings[x] for x in valid])
+    for position, conflict in conflicts.items():
+        message = str(conflict)
+        if conflict.position is not None:
+            message += f', row {valid[conflict.position] + 1}'
+        errors[valid[position] + 1] = message
+    if errors or not bookings:
+        return dict(sorted(errors.items()))
+
+    now = datetime.utcnow()
+    try:
+        # One multi-row INSERT ... VALUES statement for the whole tour
+        db.session.execute(Show.__table__.insert().values(bookings))
+        record_shows(bookings)
+        touch_owners(venue_ids, artist_ids, now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    shows_booked.send(current_app._get_current_object(), venue_ids=venue_ids, artist_ids=artist_ids, at=now)
+    return {}
@@ -0,0 +1,271 @@
+"""
+File:           cache.py
+Response cache for the read-heavy pages.
+
+Each cached page carries tags such as 'venues' (the listing) or 'venue:3'
+(anything showing venue 3). Write handlers invalidate by tag, so only the
+pages that display the changed entity are dropped.
+
+VersionStamps keeps the last-modified time of the same tags so that
+conditional GETs can be answered with 304 without touching the database.
+"""
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import wraps
+from threading import Lock
+
+from flask import request, session, g, Response, make_response, stream_with_context
+from flask_wtf.csrf import generate_csrf
+
+from metrics import CACHE_EVENTS
+
+# Stands in for the per-session CSRF token inside cached page bodies
+CSRF_PLACEHOLDER = b'\x00csrf-token\x00'
+
+# Version of a tag: time of its last change and number of deletions, which leave no updated_at behind
+Stamp = namedtuple('Stamp', ['modified_at', 'version'])
+
+
+class CachedPage:
+    """ Body and content type of a rendered page """
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+
+
+class NullBackend:
+    """ Backend that never stores anything, i.e. caching disabled """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl, tags):
+        pass
+
+    def invalidate(self, tags):
+        return 0
+
+
+class LRUBackend:
+    """ In-process LRU with a per-entry TTL """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._tags = {}                 # tag -> set of keys
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._delete(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, tags):
+        with self._lock:
+            self._delete(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._delete(key)
+            return len(keys)
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+BACKENDS = {
+    'null': NullBackend,
+    'lru': LRUBackend,
+}
+
+
+class ResponseCache:
+    """ Caches whole GET responses of decorated views, see cached() """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = 60
+        self.stats = {'hits': 0, 'misses': 0, 'bypasses': 0, 'invalidations': 0}
+        self._stats_lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = BACKENDS[app.config.get('CACHE_TYPE', 'lru')]
+        if backend is LRUBackend:
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        else:
+            self.backend = backend()
+        self.ttl = app.config.get('CACHE_TTL', 60)
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+        CACHE_EVENTS.labels(name).inc(value)
+
+    def tag(self, *tags):
+        """ Add tags to the page being rendered by the current request """
+        g.setdefault('cache_tags', set()).update(tags)
+
+    def invalidate(self, *tags):
+        """ Drop every cached page carrying any of the tags """
+        self._count('invalidations', self.backend.invalidate(tags))
+
+    def cached(self, *tags):
+        """ Cache the decorated GET view under its full path, tagged with tags """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pages carrying flashed messages are specific to one visitor
+                if request.method != 'GET' or session.get('_flashes'):
+                    self._count('bypasses')
+                    return view(*args, **kwargs)
+
+                key = request.full_path
+                page = self.backend.get(key)
+                if page is not None:
+                    self._count('hits')
+                    body = page.body.replace(CSRF_PLACEHOLDER, generate_csrf().encode())
+                    response = Response(body, mimetype=page.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                self.tag(*tags)
+                response = make_response(view(*args, **kwargs))
+                response.headers['X-Cache'] = 'MISS'
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = stream_with_context(
+                        self._store_when_done(key, response.response, response.charset, response.mimetype)
+                    )
+                else:
+                    self._store(key, response.get_data(), response.mimetype)
+                return response
+            return wrapper
+        return decorator
+
+    def _store(self, key, body, mimetype):
+        body = body.replace(generate_csrf().encode(), CSRF_PLACEHOLDER)
+        self.backend.set(key, CachedPage(body, mimetype), self.ttl, frozenset(g.get('cache_tags', ())))
+
+    def _store_when_done(self, key, iterable, charset, mimetype):
+        """ Pass a streamed body through and cache it once it has been sent completely """
+        chunks = []
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, b''.join(chunks), mimetype)
+
+
+class VersionStamps:
+    """
+    Stamp per tag ('venue:3', 'venues', ...) used to build ETags.
+    A stamp is loaded from the database once, then kept up to date by touch()
+    from the write handlers. Stamps expire after ttl seconds so that workers
+    which did not see a write pick the newer value up from the database.
+    ETags also change every `bucket` seconds: shows move from upcoming to past
+    as time passes, without any write.
+    """
+
+    def __init__(self, ttl=60, bucket=60):
+        self.ttl = ttl
+        self.bucket = bucket
+        self._stamps = {}   # tag -> (expires_at, Stamp)
+        self._lock = Lock()
+
+    def get(self, tag, load):
+        """
+        Return the Stamp of tag, calling load() to read it from the database when unknown.
+        load() returns a datetime, a (datetime, version) tuple or None.
+        """
+        with self._lock:
+            entry = self._stamps.get(tag)
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+        stamp = load()
+        if isinstance(stamp, tuple):
+            stamp = Stamp(*stamp) if stamp[0] is not None else None
+        elif stamp is not None:
+            stamp = Stamp(stamp, 0)
+        if stamp is not None:
+            with self._lock:
+                self._stamps[tag] = (time.monotonic() + self.ttl, stamp)
+        return stamp
+
+    def touch(self, *tags, at, deleted=False):
+        """ Record that the entities behind tags changed at `at`, by a deletion when deleted """
+        with self._lock:
+            for tag in tags:
+                entry = self._stamps.get(tag)
+                version = entry[1].version if entry is not None else 0
+                self._stamps[tag] = (time.monotonic() + self.ttl, Stamp(at, version + 1 if deleted else version))
+
+    def conditional(self, tag, load):
+        """
+        Add a weak ETag (bodies differ by their CSRF token) and Last-Modified to the decorated
+        GET view and answer If-None-Match / If-Modified-Since with 304 Not Modified without calling it.
+        `tag(**view_args)` names the stamp, `load(**view_args)` reads it from the database.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flashed messages have to be rendered into a fresh page
+                if session.get('_flashes'):
+                    return view(*args, **kwargs)
+                stamp = self.get(tag(**kwargs), lambda: load(**kwargs))
+                if stamp is None:
+                    return view(*args, **kwargs)
+                bucket = int(time.time() // self.bucket)
+                # HTTP dates have second precision, the start of the bucket counts as a change
+                last_modified = max(stamp.modified_at, datetime.utcfromtimestamp(bucket * self.bucket))
+                last_modified = last_modified.replace(microsecond=0)
+                etag = hashlib.sha1(
+                    f'{request.full_path}|{stamp.modified_at.isoformat()}|{stamp.version}|{bucket}'.encode()
+                ).hexdigest()
+
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains_weak(etag)
+                else:
+                    not_modified = request.if_modified_since is not None and \
+                        last_modified <= request.if_modified_since.replace(tzinfo=None, microsecond=0)
+                if not_modified:
+                    response = Response(status=304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag, weak=True)
+                response.last_modified = last_modified
+                return response
+            return wrapper
+        return decorator
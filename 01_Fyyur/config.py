@@ -1,4 +1,5 @@
 import os
+from dbpool import TimedQueuePool, TimedNullPool
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -14,3 +15,62 @@ DB_NAME = os.getenv('DB_NAME', 'fyyur')
 SQLALCHEMY_DATABASE_URI = f'postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
 
 # SQLALCHEMY_DATABASE_URI = 'postgres://Renad@localhost:5432/fyyur'
+
+# Connection pool. Keep DB_POOL_SIZE + DB_MAX_OVERFLOW times the number of workers
+# below the max_connections of the server.
+# DB_POOLER=pgbouncer is for an external pooler in transaction mode: connections are not
+# pooled in process and no startup parameters (statement timeout) are sent, PgBouncer
+# rejects them. psycopg2 never uses server-side prepared statements.
+DB_POOLER = os.getenv('DB_POOLER', '')
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+if DB_POOLER:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': TimedNullPool,
+        'executemany_mode': 'values'
+    }
+else:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        # Bulk inserts (flask import) go out as multi-row INSERT ... VALUES statements
+        'executemany_mode': 'values',
+        'connect_args': {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    }
+
+# Listing pages (/venues, /artists, /shows) are keyset paginated
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 20))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+# Maximum number of results returned by the venue / artist search
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', 50))
+
+# Response cache for the listing and detail pages: 'lru' (in-process) or 'null' (disabled)
+CACHE_TYPE = os.getenv('CACHE_TYPE', 'lru')
+CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+# ETags of the pages change at least this often (seconds), as shows move from upcoming to past
+VERSION_BUCKET = int(os.getenv('VERSION_BUCKET', 60))
+# The in-process type-ahead index and venue locator of every worker pick up the changes
+# of the other workers and of the CLI commands at most this long after (seconds)
+INDEX_SYNC_INTERVAL = int(os.getenv('INDEX_SYNC_INTERVAL', 10))
+
+# Per-request profiler: query count, DB / render time in the X-Request-Profile header,
+# requests slower than PROFILER_SLOW_MS logged as JSON lines to PROFILER_SLOW_LOG
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_SLOW_MS = int(os.getenv('PROFILER_SLOW_MS', 500))
+PROFILER_SLOW_LOG = os.getenv('PROFILER_SLOW_LOG', os.path.join(basedir, 'slow_requests.log'))
+PROFILER_TOP_STATEMENTS = int(os.getenv('PROFILER_TOP_STATEMENTS', 5))
+
+# Async read path (asgi.py): asyncpg connections of each ASGI worker
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', 2))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', 10))
+
+# Lookup table of places (city, state, latitude, longitude) the venues are geocoded from
+GEOCODE_TABLE = os.getenv('GEOCODE_TABLE', os.path.join(basedir, 'data', 'places.csv'))
+
+# Most shows accepted by one tour submission (/shows/batch, /api/v1/shows/batch)
+BATCH_MAX_SHOWS = int(os.getenv('BATCH_MAX_SHOWS', 200))
@@ -0,0 +1,105 @@
+"""
+File:           dbpool.py
+Connection pool classes that time checkouts, and pool telemetry.
+"""
+import time
+from threading import Lock
+
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool, NullPool
+
+from metrics import POOL_EVENTS, POOL_CHECKED_OUT, POOL_WAIT
+
+
+class PoolStats:
+    """ Process wide counters fed by the pool events """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        POOL_EVENTS.labels(name).inc()
+        if name == 'checkouts':
+            POOL_CHECKED_OUT.inc()
+        elif name == 'checkins':
+            POOL_CHECKED_OUT.dec()
+
+    def record_wait(self, seconds):
+        POOL_WAIT.observe(seconds)
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self, pool=None):
+        """ Return the counters, plus the live state of pool when it is a QueuePool """
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'checked_out': self.checkouts - self.checkins,
+                'wait_count': self.waits,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6)
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'pool_size': pool.size(),
+                'idle': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow()
+            })
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class TimedPoolMixin:
+    """ Records how long each connection checkout waited, including connecting """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+@event.listens_for(Pool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.count('connects')
+
+
+@event.listens_for(Pool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.count('checkouts')
+
+
+@event.listens_for(Pool, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.count('checkins')
+
+
+@event.listens_for(Pool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.count('invalidations')
@@ -0,0 +1,78 @@
+"""
+File:           exporter.py
+Streaming export of venues, artists and shows as JSON lines or CSV.
+
+Rows are fetched through a server-side cursor (yield_per) as plain column
+tuples, genres are aggregated in SQL, so memory stays flat for any table size.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from models import Venue, VenuesGenres, Artist, ArtistsGenres, Show, db
+
+# Model and (genre owner column, genre column) of every exportable entity
+ENTITIES = {
+    'venues': (Venue, VenuesGenres.venue_id, VenuesGenres.genre),
+    'artists': (Artist, ArtistsGenres.artist_id, ArtistsGenres.genre),
+    'shows': (Show, None, None),
+}
+FORMATS = ('jsonl', 'csv')
+BATCH_SIZE = 1000
+
+
+def _genres_column(model, owner_column, genre_column):
+    """ Correlated subquery aggregating the genres of each row, served by the owner id index """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        aggregate = db.func.array_agg(genre_column)
+    else:
+        aggregate = db.func.group_concat(genre_column, ';')
+    return db.session.query(aggregate).filter(owner_column == model.id).label('genres')
+
+
+def export_rows(entity):
+    """ Yield one dict per row of entity, ordered by id """
+    model, owner_column, genre_column = ENTITIES[entity]
+    # genre_names duplicates the genres column, which is aggregated from the genre table
+    columns = [x for x in model.__table__.columns if x.name != 'genre_names']
+    if owner_column is not None:
+        columns.append(_genres_column(model, owner_column, genre_column))
+    query = db.session.query(*columns).order_by(model.id).yield_per(BATCH_SIZE)
+    for row in query:
+        row = row._asdict()
+        if owner_column is not None:
+            genres = row['genres']
+            if isinstance(genres, str):
+                genres = genres.split(';')
+            row['genres'] = genres or []
+        yield row
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def serialize(rows, file_format):
+    """ Yield the rows encoded as JSON lines or CSV text, a line at a time """
+    if file_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, default=_default) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if 'genres' in row:
+            row['genres'] = ';'.join(row['genres'])
+        # Yes / No as posted by the forms, which `flask import` validates the rows with
+        row.update((key, 'Yes' if value else 'No') for key, value in row.items() if isinstance(value, bool))
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
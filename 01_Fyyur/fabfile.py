@@ -5,9 +5,13 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # The test suite with the route benchmarks, then every route on the seeded data set:
+    # regressions against bench/baseline.json fail
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest -q tests && python bench/seed.py --scale 1k && "
+            "python bench/routes.py --baseline bench/baseline.json",
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
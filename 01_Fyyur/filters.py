@@ -0,0 +1,60 @@
+"""
+File:           filters.py
+Time and place filters of the show listings (/shows, /api/v1/shows and asgi.py).
+
+?from= / ?to= take ISO dates or date-times (a date alone in ?to= includes that
+day), ?when=tonight|weekend is a shortcut for the matching range and
+?city= / ?state= keep the shows of the venues in that place.
+"""
+from datetime import datetime, timedelta, time
+
+from flask import request
+
+WHEN = ('tonight', 'weekend')
+# Late shows of the evening are still "tonight" until then
+NIGHT_ENDS = time(4)
+WEEKEND_STARTS = time(18)
+
+
+def _parse(value, end=False):
+    """ datetime of an ISO date / date-time, None for a missing or bad value """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if end and len(value) <= 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def when_range(when, now):
+    """ (start, end) of ?when=tonight / weekend as seen at now """
+    today = now.date()
+    if when == 'tonight':
+        # Past midnight it is still last night until NIGHT_ENDS
+        if now.time() < NIGHT_ENDS:
+            return now, datetime.combine(today, NIGHT_ENDS)
+        return now, datetime.combine(today + timedelta(days=1), NIGHT_ENDS)
+    # Friday evening to Monday, the current one from Friday to Sunday
+    friday = today + timedelta(days=4 - today.weekday()) if today.weekday() < 4 \
+        else today - timedelta(days=today.weekday() - 4)
+    start = datetime.combine(friday, WEEKEND_STARTS)
+    return max(now, start), datetime.combine(friday + timedelta(days=3), time())
+
+
+def show_filter_args():
+    """ {'start', 'end', 'city', 'state'} of a show listing request, missing / bad values are None """
+    when = request.args.get('when')
+    if when in WHEN:
+        start, end = when_range(when, datetime.now())
+    else:
+        start = _parse(request.args.get('from'))
+        end = _parse(request.args.get('to'), end=True)
+    return {
+        'start': start,
+        'end': end,
+        'city': request.args.get('city', '').strip() or None,
+        'state': request.args.get('state', '').strip().upper() or None
+    }
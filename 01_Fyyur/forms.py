@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 
 class ShowForm(FlaskForm):
@@ -16,6 +16,21 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # Minutes, two hours when left empty
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=24 * 60)]
+    )
+
+
+class TourForm(FlaskForm):
+    artist_id = StringField(
+        'artist_id', validators=[DataRequired()]
+    )
+    # One show per line: venue_id, start time[, duration in minutes]
+    dates = TextAreaField(
+        'dates', validators=[DataRequired()]
+    )
 
 
 class VenueForm(FlaskForm):
@@ -0,0 +1,339 @@
+"""
+File:           geo.py
+Venue coordinates: offline geocoding and the "venues near me" search.
+
+Coordinates come from a local lookup table of places (GEOCODE_TABLE, a CSV of
+city, state, latitude, longitude); no geocoding service is called. `flask
+geocode` fills the venues already stored, new and edited venues are geocoded
+by the handlers.
+
+On PostgreSQL nearby() is served by the GiST index on ll_to_earth(latitude,
+longitude) of the cube / earthdistance extensions: k-nearest ordering with <->
+and radius filtering with earth_box. Other backends use VenueLocator, an
+in-process k-d tree over the same coordinates built on the first request. Each
+worker holds its own, the changes of the other workers and of `flask geocode` /
+`flask import` reach it within INDEX_SYNC_INTERVAL seconds through the Venue
+table stamp.
+"""
+import csv
+import math
+from datetime import datetime
+from functools import lru_cache
+from heapq import heappush, heapreplace
+from threading import Lock
+
+from flask import current_app, request
+
+from models import Venue, TableSync, db
+
+EARTH_RADIUS_KM = 6371.0088
+# Changes kept beside the k-d tree before it is rebuilt
+REBUILD_AFTER = 1000
+
+
+#  Geocoding
+#  ----------------------------------------------------------------
+
+def _place_key(city, state):
+    return ' '.join((city or '').casefold().split()), (state or '').strip().upper()
+
+
+@lru_cache(maxsize=None)
+def load_places(path):
+    """ Return {(city, state): (latitude, longitude)} of a lookup table, cities casefolded """
+    with open(path, encoding='utf-8') as stream:
+        return {
+            _place_key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(stream)
+        }
+
+
+def geocode(city, state, places=None):
+    """ Return (latitude, longitude) of a city, (None, None) when the lookup table does not know it """
+    if places is None:
+        places = load_places(current_app.config['GEOCODE_TABLE'])
+    return places.get(_place_key(city, state), (None, None))
+
+
+def geocode_venues(places, overwrite=False, chunk_size=5000):
+    """
+    Fill latitude / longitude of the stored venues from places, one UPDATE per
+    distinct (city, state). Return the (geocoded, unknown) venue counts.
+    """
+    areas = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id)).group_by(Venue.city, Venue.state)
+    if not overwrite:
+        areas = areas.filter(Venue.latitude.is_(None))
+    geocoded = unknown = pending = 0
+    for city, state, count in areas.all():
+        latitude, longitude = geocode(city, state, places)
+        if latitude is None:
+            unknown += count
+            continue
+        query = Venue.query.filter(Venue.city == city, Venue.state == state)
+        if not overwrite:
+            query = query.filter(Venue.latitude.is_(None))
+        # updated_at tells the venue locators of the running workers to read the rows again
+        geocoded += query.update(
+            {Venue.latitude: latitude, Venue.longitude: longitude, Venue.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        pending += count
+        if pending >= chunk_size:
+            db.session.commit()
+            pending = 0
+    db.session.commit()
+    return geocoded, unknown
+
+
+#  Distances
+#  ----------------------------------------------------------------
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """ Great circle distance between two points """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _point(latitude, longitude):
+    """ Cartesian point on the earth sphere, chord lengths between them are in km """
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return (
+        EARTH_RADIUS_KM * math.cos(phi) * math.cos(lam),
+        EARTH_RADIUS_KM * math.cos(phi) * math.sin(lam),
+        EARTH_RADIUS_KM * math.sin(phi)
+    )
+
+
+def _chord_km(distance_km):
+    """ Chord length of a great circle distance, they grow together so ranking by either is the same """
+    return 2 * EARTH_RADIUS_KM * math.sin(min(distance_km, math.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+def _arc_km(chord_km):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord_km / (2 * EARTH_RADIUS_KM)))
+
+
+#  In-process index
+#  ----------------------------------------------------------------
+
+class KDTree:
+    """
+    Static 3-d tree over (x, y, z, id) points. The tree is implicit: the node of
+    a slice is its middle element, split on axis depth % 3.
+    """
+
+    def __init__(self, points):
+        self.points = list(points)
+        stack = [(0, len(self.points), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo < 2:
+                continue
+            self.points[lo:hi] = sorted(self.points[lo:hi], key=lambda x, axis=depth % 3: x[axis])
+            mid = (lo + hi) >> 1
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, target, limit, max_distance=math.inf):
+        """ Return up to limit (distance, id) of the points closest to target within max_distance """
+        points = self.points
+        tx, ty, tz = target
+        bound = max_distance * max_distance
+        heap = []   # max-heap of (-squared distance, id)
+        # Slices with the squared distance from target to their cell and its per-axis offsets
+        stack = [(0, len(points), 0, 0.0, (0.0, 0.0, 0.0))]
+        while stack:
+            lo, hi, depth, gap, offsets = stack.pop()
+            if lo >= hi or gap > bound:
+                continue
+            mid = (lo + hi) >> 1
+            point = points[mid]
+            squared = (point[0] - tx) ** 2 + (point[1] - ty) ** 2 + (point[2] - tz) ** 2
+            if squared <= bound:
+                if len(heap) < limit:
+                    heappush(heap, (-squared, point[3]))
+                elif squared < -heap[0][0]:
+                    heapreplace(heap, (-squared, point[3]))
+                if len(heap) == limit:
+                    bound = min(bound, -heap[0][0])
+            axis = depth % 3
+            diff = target[axis] - point[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # The far side is only visited when its cell is closer than the bound
+            far_offsets = offsets[:axis] + (diff,) + offsets[axis + 1:]
+            far_gap = gap - offsets[axis] ** 2 + diff * diff
+            stack.append((far[0], far[1], depth + 1, far_gap, far_offsets))
+            stack.append((near[0], near[1], depth + 1, gap, offsets))
+        return sorted((math.sqrt(-squared), id_) for squared, id_ in heap)
+
+
+class VenueLocator:
+    """
+    k-d tree of venue coordinates with k-nearest / radius lookup. Venues added
+    or removed after the build are kept beside the tree and merged into the
+    results, the tree is rebuilt once REBUILD_AFTER of them have piled up.
+    """
+
+    def __init__(self):
+        self._coordinates = {}  # id -> (latitude, longitude)
+        self._tree = KDTree([])
+        self._tree_ids = set()
+        self._pending = {}      # id -> point, added since the build
+        self._stale = set()     # ids of the tree removed or moved since the build
+        self._lock = Lock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def build(self, rows):
+        """ Replace the index with rows of (id, latitude, longitude), rows without coordinates are skipped """
+        coordinates = {id_: (lat, lon) for id_, lat, lon in rows if lat is not None and lon is not None}
+        tree = KDTree((*_point(lat, lon), id_) for id_, (lat, lon) in coordinates.items())
+        with self._lock:
+            self._install(coordinates, tree)
+            self.ready = True
+
+    def _install(self, coordinates, tree):
+        self._coordinates = coordinates
+        self._tree = tree
+        self._tree_ids = set(coordinates)
+        self._pending = {}
+        self._stale = set()
+
+    def add(self, id_, latitude, longitude):
+        """ Add or move a venue, a venue without coordinates is removed """
+        with self._lock:
+            self._remove(id_)
+            if latitude is None or longitude is None:
+                return
+            self._coordinates[id_] = (latitude, longitude)
+            self._pending[id_] = _point(latitude, longitude)
+            if len(self._pending) + len(self._stale) > REBUILD_AFTER:
+                coordinates = dict(self._coordinates)
+                self._install(coordinates, KDTree((*_point(*x), id_) for id_, x in coordinates.items()))
+
+    def remove(self, id_):
+        """ Drop a venue from the index """
+        with self._lock:
+            self._remove(id_)
+
+    def _remove(self, id_):
+        self._coordinates.pop(id_, None)
+        self._pending.pop(id_, None)
+        if id_ in self._tree_ids:
+            self._stale.add(id_)
+
+    def nearby(self, latitude, longitude, radius_km=None, limit=20):
+        """ Return up to limit (distance_km, id) of the venues closest to a point, within radius_km when given """
+        target = _point(latitude, longitude)
+        max_chord = math.inf if radius_km is None else _chord_km(radius_km)
+        with self._lock:
+            tree, stale, pending = self._tree, set(self._stale), list(self._pending.items())
+        # Stale entries are dropped from the tree results, ask for enough to still fill the page
+        found = [x for x in tree.nearest(target, limit + len(stale), max_chord) if x[1] not in stale]
+        for id_, point in pending:
+            chord = math.dist(point, target)
+            if chord <= max_chord:
+                found.append((chord, id_))
+        found.sort()
+        return [(_arc_km(chord), id_) for chord, id_ in found[:limit]]
+
+
+venue_locator = VenueLocator()
+venue_locator_sync = TableSync(Venue)
+
+
+def _uses_earthdistance():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def build_venue_locator():
+    """ Load the venue coordinates into the in-process index, unless PostgreSQL serves the search """
+    if _uses_earthdistance():
+        return
+    venue_locator_sync.reset()
+    rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(
+        Venue.latitude.isnot(None), Venue.longitude.isnot(None)
+    ).yield_per(1000)
+    venue_locator.build(rows)
+
+
+def sync_venue_locator():
+    """ Apply the venue changes of the other workers and of the CLI commands to the in-process index """
+    changes = venue_locator_sync.poll(current_app.config['INDEX_SYNC_INTERVAL'])
+    if changes is None:
+        return
+    if changes.deleted:
+        build_venue_locator()
+        return
+    rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(
+        Venue.updated_at >= changes.since
+    ).limit(REBUILD_AFTER + 1).all()
+    if len(rows) > REBUILD_AFTER:
+        # An import / geocode run, one build instead of a rebuild every REBUILD_AFTER adds
+        build_venue_locator()
+        return
+    for id_, latitude, longitude in rows:
+        venue_locator.add(id_, latitude, longitude)
+
+
+#  Nearby search
+#  ----------------------------------------------------------------
+
+def nearby_args():
+    """
+    {'latitude', 'longitude', 'radius_km', 'limit'} of a ?lat=&lon=&radius=&limit= request,
+    missing / bad values are None. The radius is in km, without it the closest venues are returned.
+    """
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius', type=float)
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        latitude = longitude = None
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'radius_km': radius_km if radius_km is not None and radius_km > 0 else None,
+        'limit': max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+    }
+
+
+def nearby_query(latitude, longitude, columns, radius_km=None, limit=20):
+    """
+    PostgreSQL query of `columns` and distance_km of up to limit venues closest to a point.
+    The ORDER BY <-> and the earth_box containment are both answered by the GiST index.
+    """
+    here = db.func.ll_to_earth(latitude, longitude)
+    location = db.func.ll_to_earth(Venue.latitude, Venue.longitude)
+    distance = db.func.earth_distance(here, location)
+    query = db.session.query(*columns, (distance / 1000).label('distance_km')).filter(
+        Venue.latitude.isnot(None), Venue.longitude.isnot(None)
+    )
+    if radius_km is not None:
+        query = query.filter(
+            db.func.earth_box(here, radius_km * 1000).op('@>')(location),
+            distance <= radius_km * 1000
+        )
+    return query.order_by(location.op('<->')(here)).limit(limit)
+
+
+def nearby(latitude, longitude, columns, radius_km=None, limit=20):
+    """
+    Return up to limit (row, distance_km) of the venues closest to a point, nearest first.
+    Rows are tuples of columns, which must include Venue.id.
+    """
+    if _uses_earthdistance():
+        return [(x, x.distance_km) for x in nearby_query(latitude, longitude, columns, radius_km, limit)]
+    sync_venue_locator()
+    found = venue_locator.nearby(latitude, longitude, radius_km, limit)
+    if not found:
+        return []
+    rows = {x.id: x for x in db.session.query(*columns).filter(Venue.id.in_([id_ for _, id_ in found]))}
+    return [(rows[id_], distance) for distance, id_ in found if id_ in rows]
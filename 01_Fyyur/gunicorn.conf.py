@@ -0,0 +1,12 @@
+# gunicorn -c gunicorn.conf.py app:app
+# Export prometheus_multiproc_dir (an empty directory) before starting so that
+# /metrics aggregates the samples of every worker.
+import os
+
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+
+
+def child_exit(server, worker):
+    if os.environ.get('prometheus_multiproc_dir'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
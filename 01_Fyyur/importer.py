@@ -0,0 +1,266 @@
+"""
+File:           importer.py
+Bulk import of venues, artists and shows from CSV or JSON lines files.
+
+Rows are read as a stream, validated with the same forms as the web handlers
+and written in chunks with executemany, one transaction per chunk.
+In CSV files genres are separated by ';'. Imported shows bump updated_at of
+their venues and artists and are announced with booking.shows_booked, as the
+shows booked through the web handlers.
+"""
+import csv
+import json
+import time
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+
+from booking import shows_booked, touch_owners
+from forms import ShowForm, VenueForm, ArtistForm
+from geo import geocode
+from models import Venue, VenuesGenres, Artist, ArtistsGenres, Show, show_end_time, record_shows, db
+
+# Form class, model and genre table of every importable entity
+ENTITIES = {
+    'venues': (VenueForm, Venue, VenuesGenres),
+    'artists': (ArtistForm, Artist, ArtistsGenres),
+    'shows': (ShowForm, Show, None),
+}
+# Rejected rows reported with their error, the ones beyond are only counted
+MAX_ERRORS = 1000
+
+
+class ImportReport:
+    """ Counters of one import run, with the (line, error) of the first max_errors rejected rows """
+
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def reject(self, line, error, rows=1):
+        """ Count rows rejected from line on, keeping the error while there is room """
+        self.rejected += rows
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, error))
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (f'{self.read} rows read, {self.imported} imported, {self.rejected} rejected, '
+                f'{self.rows_per_second:.0f} rows/sec')
+
+
+class InvalidRow(ValueError):
+    """ A row which could not be read, yielded by read_rows() in place of its dict """
+
+
+def _csv_rows(stream):
+    """ Yield (first line number, dict) of the rows of a CSV stream, quoted fields may span lines """
+    reader = csv.reader(stream)
+    header = next(reader, None) or []
+    end = reader.line_num
+    for values in reader:
+        line, end = end + 1, reader.line_num
+        if not values:
+            continue
+        row = {key: values[i] if i < len(values) else None for i, key in enumerate(header)}
+        if row.get('genres') is not None:
+            row['genres'] = [x.strip() for x in row['genres'].split(';') if x.strip()]
+        yield line, row
+
+
+def _jsonl_rows(stream):
+    """ Yield (line number, dict) of the rows of a JSON lines stream, InvalidRow for bad lines """
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as err:
+            yield line, InvalidRow(f'invalid JSON: {err}')
+            continue
+        yield line, row if isinstance(row, dict) else InvalidRow('expected a JSON object')
+
+
+def read_rows(stream, file_format):
+    """
+    Yield (line number, dict) for every row of a csv / jsonl stream, the line being the
+    first one of the row in the file. Rows which cannot be read come as InvalidRow.
+    """
+    return _csv_rows(stream) if file_format == 'csv' else _jsonl_rows(stream)
+
+
+def _formdata(row):
+    """ Turn an import row into form data as posted by the web forms """
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(x) for x in value])
+        elif isinstance(value, bool):
+            formdata[key] = 'Yes' if value else 'No'
+        elif value is not None:
+            formdata[key] = str(value)
+    return formdata
+
+
+def _coordinates(row):
+    """ (latitude, longitude) of a row carrying both, as exported by `flask export`, else None """
+    try:
+        latitude, longitude = float(row['latitude']), float(row['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def _entity_values(form, model, row):
+    """ Column values of a validated venue / artist / show form, and of the coordinates of its row """
+    if model is Show:
+        return {
+            'venue_id': int(form.venue_id.data),
+            'artist_id': int(form.artist_id.data),
+            'start_time': form.start_time.data,
+            'end_time': show_end_time(form.start_time.data, form.duration.data)
+        }
+    values = {
+        column: getattr(form, column).data or None
+        for column in ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website',
+                       'seeking_description')
+    }
+    if model is Venue:
+        values['address'] = form.address.data
+        values['seeking_talent'] = form.seeking_talent.data == 'Yes'
+        values['latitude'], values['longitude'] = _coordinates(row) or geocode(values['city'], values['state'])
+    else:
+        values['seeking_venue'] = form.seeking_venue.data == 'Yes'
+    values['updated_at'] = datetime.utcnow()
+    return values
+
+
+def _allocate_ids(model, count):
+    """ Reserve count primary keys from the PostgreSQL sequence of model """
+    sequence = f'"{model.__tablename__}_id_seq"'
+    return [x for x, in db.session.execute(
+        f"SELECT nextval('{sequence}') FROM generate_series(1, :count)", {'count': count}
+    )]
+
+
+def _flush_owners(model, genre_model, chunk):
+    """ Insert a chunk of (values, genres) venues / artists and their genre rows """
+    table = model.__table__
+    owner_column = 'venue_id' if model is Venue else 'artist_id'
+    if db.session.get_bind().dialect.name == 'postgresql':
+        ids = _allocate_ids(model, len(chunk))
+        db.session.execute(table.insert(), [dict(values, id=id_) for id_, (values, _) in zip(ids, chunk)])
+    else:
+        # No sequence to reserve keys from, insert one by one to learn them
+        ids = [db.session.execute(table.insert(), values).inserted_primary_key[0] for values, _ in chunk]
+    genre_rows = [
+        {owner_column: id_, 'genre': genre}
+        for id_, (_, genres) in zip(ids, chunk)
+        for genre in genres
+    ]
+    if genre_rows:
+        db.session.execute(genre_model.__table__.insert(), genre_rows)
+
+
+def _free_shows(chunk, report):
+    """
+    Column values of the (line, values) shows of a chunk whose venue and artist exist
+    and are free at that time, the others are rejected
+    """
+    venue_ids = {x for x, in db.session.query(Venue.id).filter(
+        Venue.id.in_({values['venue_id'] for _, values in chunk}))}
+    artist_ids = {x for x, in db.session.query(Artist.id).filter(
+        Artist.id.in_({values['artist_id'] for _, values in chunk}))}
+    rows = []
+    for line, values in chunk:
+        if values['venue_id'] not in venue_ids:
+            report.reject(line, f'The venue id {values["venue_id"]} does not exist')
+        elif values['artist_id'] not in artist_ids:
+            report.reject(line, f'The artist id {values["artist_id"]} does not exist')
+        else:
+            rows.append((line, values))
+    conflicts = Show.find_conflicts([values for _, values in rows])
+    for position, conflict in sorted(conflicts.items()):
+        if conflict.position is not None:
+            conflict = f'{conflict}, line {rows[conflict.position][0]}'
+        report.reject(rows[position][0], str(conflict))
+    return [values for position, (_, values) in enumerate(rows) if position not in conflicts]
+
+
+def _flush_shows(rows, now):
+    """ Insert shows and count them in the stats of their venues and artists, which are touched at now """
+    db.session.execute(Show.__table__.insert(), rows)
+    record_shows(rows)
+    touch_owners({x['venue_id'] for x in rows}, {x['artist_id'] for x in rows}, now)
+
+
+def import_rows(entity, rows, chunk_size=5000, report=None):
+    """
+    Validate and insert the (line number, row) of entity ('venues', 'artists' or 'shows') from read_rows().
+    Every chunk is committed on its own, a failing chunk is rolled back and reported.
+    """
+    form_class, model, genre_model = ENTITIES[entity]
+    report = report or ImportReport()
+    # One form instance validates every row
+    form = form_class(formdata=None, meta={'csrf': False})
+    chunk = []
+
+    def flush():
+        # Rows of the chunk rejected before a failed commit stay rejected, the others fail with it
+        rejected = report.rejected
+        now = datetime.utcnow()
+        try:
+            if model is Show:
+                written = _free_shows(chunk, report)
+                if written:
+                    _flush_shows(written, now)
+            else:
+                written = [values for _, values in chunk]
+                _flush_owners(model, genre_model, written)
+            db.session.commit()
+        except Exception as err:
+            db.session.rollback()
+            pending = len(chunk) - (report.rejected - rejected)
+            report.reject(chunk[0][0], f'chunk of {pending} rows failed: {err}', rows=pending)
+        else:
+            report.imported += len(written)
+            if model is Show and written:
+                shows_booked.send(
+                    current_app._get_current_object(), at=now,
+                    venue_ids={x['venue_id'] for x in written}, artist_ids={x['artist_id'] for x in written}
+                )
+        chunk.clear()
+
+    for line, row in rows:
+        report.read += 1
+        if isinstance(row, InvalidRow):
+            report.reject(line, str(row))
+            continue
+        form.process(formdata=_formdata(row))
+        if not form.validate():
+            report.reject(line, form.errors)
+            continue
+        try:
+            values = _entity_values(form, model, row)
+        except ValueError:
+            report.reject(line, 'venue_id and artist_id must be numbers')
+            continue
+        if model is not Show:
+            values['genre_names'] = list(dict.fromkeys(form.genres.data))
+        chunk.append((line, values if model is Show else (values, values['genre_names'])))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return report
@@ -0,0 +1,74 @@
+"""
+File:           metrics.py
+Prometheus metrics, exposed at /metrics in the text exposition format.
+
+Under gunicorn set the prometheus_multiproc_dir environment variable to an
+empty directory shared by the workers: every worker then writes its samples
+to mmap-backed files there and /metrics aggregates all of them
+(see gunicorn.conf.py for cleaning up after dead workers).
+"""
+import os
+import time
+
+from flask import g, request, Response
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'fyyur_request_duration_seconds', 'Request latency by endpoint', ['endpoint', 'method'],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter('fyyur_requests_total', 'Requests by endpoint and status', ['endpoint', 'method', 'status'])
+SERVER_ERRORS = Counter('fyyur_server_errors_total', 'Requests answered by the 500 handler', ['endpoint'])
+CACHE_EVENTS = Counter('fyyur_response_cache_events_total', 'Response cache hits, misses, bypasses and invalidations',
+                       ['event'])
+POOL_EVENTS = Counter('fyyur_db_pool_events_total', 'Connection pool connects, checkouts, checkins and invalidations',
+                      ['event'])
+POOL_CHECKED_OUT = Gauge('fyyur_db_pool_checked_out', 'Connections currently checked out of the pool',
+                         multiprocess_mode='livesum')
+POOL_WAIT = Histogram('fyyur_db_pool_wait_seconds', 'Time spent waiting for a pool connection',
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0))
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _start():
+    g.metrics_started = time.perf_counter()
+
+
+def _count(response):
+    REQUESTS.labels(_endpoint(), request.method, str(response.status_code)).inc()
+    return response
+
+
+def _observe(exc=None):
+    # Runs after a streamed body has been sent too
+    started = g.get('metrics_started')
+    if started is not None:
+        REQUEST_LATENCY.labels(_endpoint(), request.method).observe(time.perf_counter() - started)
+
+
+def init_app(app):
+    """ Record latency and counts of every request of app """
+    app.before_request(_start)
+    app.after_request(_count)
+    app.teardown_request(_observe)
+
+
+def count_server_error():
+    SERVER_ERRORS.labels(_endpoint()).inc()
+
+
+def metrics_response():
+    """ Text exposition of every metric, aggregated over all workers in multi-process mode """
+    if os.environ.get('prometheus_multiproc_dir'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
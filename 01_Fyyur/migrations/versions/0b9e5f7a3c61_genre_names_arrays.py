@@ -0,0 +1,42 @@
+"""genre names arrays
+
+Revision ID: 0b9e5f7a3c61
+Revises: f2a6c3d94e17
+Create Date: 2026-10-17 14:55:42.108337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0b9e5f7a3c61'
+down_revision = 'f2a6c3d94e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('genre_names', postgresql.ARRAY(sa.String()), nullable=True))
+    op.add_column('Artist', sa.Column('genre_names', postgresql.ARRAY(sa.String()), nullable=True))
+    # Backfill from the genre tables
+    op.execute('''
+        UPDATE "Venue" SET genre_names = ARRAY(
+            SELECT genre FROM "VenuesGenres" WHERE venue_id = "Venue".id ORDER BY id
+        )
+    ''')
+    op.execute('''
+        UPDATE "Artist" SET genre_names = ARRAY(
+            SELECT genre FROM "ArtistsGenres" WHERE artist_id = "Artist".id ORDER BY id
+        )
+    ''')
+    op.create_index('ix_Venue_genre_names', 'Venue', ['genre_names'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genre_names', 'Artist', ['genre_names'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genre_names', table_name='Artist')
+    op.drop_index('ix_Venue_genre_names', table_name='Venue')
+    op.drop_column('Artist', 'genre_names')
+    op.drop_column('Venue', 'genre_names')
@@ -0,0 +1,24 @@
+"""venue area order index
+
+Revision ID: 1f6d3a8c5e27
+Revises: 5b2e9c4d7a61
+Create Date: 2026-10-18 16:20:41.738215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f6d3a8c5e27'
+down_revision = '5b2e9c4d7a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
@@ -0,0 +1,51 @@
+"""show stats
+
+Revision ID: 3e7a5c1b9d42
+Revises: 9f3b6d2e8a14
+Create Date: 2026-10-17 23:58:10.482913
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7a5c1b9d42'
+down_revision = '9f3b6d2e8a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, owner, owner_table in (('VenueStats', 'venue_id', 'Venue'), ('ArtistStats', 'artist_id', 'Artist')):
+        op.create_table(
+            table,
+            sa.Column(owner, sa.Integer(), nullable=False),
+            sa.Column('upcoming_count', sa.Integer(), nullable=False),
+            sa.Column('past_count', sa.Integer(), nullable=False),
+            sa.Column('next_show_at', sa.DateTime(), nullable=True),
+            sa.Column('last_show_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint([owner], [f'{owner_table}.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(owner)
+        )
+        op.create_index(f'ix_{table}_next_show_at', table, ['next_show_at'])
+        # Counted at the time of the migration, `flask roll-stats` moves the shows started since
+        op.get_bind().execute(sa.text(f'''
+            INSERT INTO "{table}" ({owner}, upcoming_count, past_count, next_show_at, last_show_at)
+            SELECT {owner},
+                SUM(CASE WHEN start_time >= :now THEN 1 ELSE 0 END),
+                SUM(CASE WHEN start_time < :now THEN 1 ELSE 0 END),
+                MIN(CASE WHEN start_time >= :now THEN start_time END),
+                MAX(CASE WHEN start_time < :now THEN start_time END)
+            FROM "Shows"
+            GROUP BY {owner}
+        '''), now=datetime.now())
+
+
+def downgrade():
+    op.drop_index('ix_ArtistStats_next_show_at', table_name='ArtistStats')
+    op.drop_table('ArtistStats')
+    op.drop_index('ix_VenueStats_next_show_at', table_name='VenueStats')
+    op.drop_table('VenueStats')
@@ -0,0 +1,26 @@
+"""updated_at indexes
+
+Revision ID: 5b2e9c4d7a61
+Revises: 8d4f2b6e1a37
+Create Date: 2026-10-18 14:36:05.217480
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e9c4d7a61'
+down_revision = '8d4f2b6e1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_updated_at', 'Venue', ['updated_at'], unique=False)
+    op.create_index('ix_Artist_updated_at', 'Artist', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_updated_at', table_name='Artist')
+    op.drop_index('ix_Venue_updated_at', table_name='Venue')
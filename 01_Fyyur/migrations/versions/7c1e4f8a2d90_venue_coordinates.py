@@ -0,0 +1,35 @@
+"""venue coordinates
+
+Revision ID: 7c1e4f8a2d90
+Revises: d5a9e2c7f1b3
+Create Date: 2026-10-17 21:04:37.219845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4f8a2d90'
+down_revision = 'd5a9e2c7f1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    # The nearby search is served by a GiST index on PostgreSQL, other backends use an in-process k-d tree
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    op.execute('CREATE INDEX "ix_Venue_location" ON "Venue" USING gist (ll_to_earth(latitude, longitude))')
+    # Coordinates are filled afterwards from the lookup table: flask geocode
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Venue_location', table_name='Venue')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
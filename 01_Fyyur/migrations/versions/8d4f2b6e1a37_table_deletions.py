@@ -0,0 +1,30 @@
+"""table deletions
+
+Revision ID: 8d4f2b6e1a37
+Revises: 3e7a5c1b9d42
+Create Date: 2026-10-18 10:12:44.605118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f2b6e1a37'
+down_revision = '3e7a5c1b9d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'Deletions',
+        sa.Column('table_name', sa.String(length=120), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+
+
+def downgrade():
+    op.drop_table('Deletions')
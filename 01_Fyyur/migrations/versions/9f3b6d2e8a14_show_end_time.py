@@ -0,0 +1,53 @@
+"""show end time
+
+Revision ID: 9f3b6d2e8a14
+Revises: 7c1e4f8a2d90
+Create Date: 2026-10-17 23:15:52.730146
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3b6d2e8a14'
+down_revision = '7c1e4f8a2d90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Existing shows last the default two hours, cut short at the next show of their venue or
+    # artist: shows double booked before the constraints existed end when the next one starts
+    # (an empty range when both start together) instead of failing the migration.
+    op.execute('''
+        UPDATE "Shows" SET end_time = LEAST(
+            next.start_time + interval '2 hours', next.next_venue_show, next.next_artist_show
+        )
+        FROM (
+            SELECT id, start_time,
+                LEAD(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_venue_show,
+                LEAD(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id) AS next_artist_show
+            FROM "Shows"
+        ) next
+        WHERE next.id = "Shows".id
+    ''')
+    op.alter_column('Shows', 'end_time', nullable=False)
+    op.create_check_constraint('ck_Shows_end_time', 'Shows', 'end_time >= start_time')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('''
+        ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_venue_id_during"
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
+    op.execute('''
+        ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_artist_id_during"
+        EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
+
+
+def downgrade():
+    op.drop_constraint('ex_Shows_artist_id_during', 'Shows')
+    op.drop_constraint('ex_Shows_venue_id_during', 'Shows')
+    op.drop_constraint('ck_Shows_end_time', 'Shows', type_='check')
+    op.drop_column('Shows', 'end_time')
@@ -0,0 +1,48 @@
+"""search trigram indexes
+
+Revision ID: a3033b9d3351
+Revises: 50e0da94614e
+Create Date: 2026-10-17 10:12:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3033b9d3351'
+down_revision = '50e0da94614e'
+branch_labels = None
+depends_on = None
+
+# (index name, table, column) of the GIN trigram indexes used by the venue / artist search
+TRIGRAM_INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name'),
+    ('ix_Venue_city_trgm', 'Venue', 'city'),
+    ('ix_Venue_state_trgm', 'Venue', 'state'),
+    ('ix_Artist_name_trgm', 'Artist', 'name'),
+    ('ix_Artist_city_trgm', 'Artist', 'city'),
+    ('ix_Artist_state_trgm', 'Artist', 'state'),
+    ('ix_VenuesGenres_genre_trgm', 'VenuesGenres', 'genre'),
+    ('ix_ArtistsGenres_genre_trgm', 'ArtistsGenres', 'genre'),
+]
+
+
+def upgrade():
+    # Trigram indexes are PostgreSQL only, other backends keep using a sequential scan
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(
+            name, table, [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, column in reversed(TRIGRAM_INDEXES):
+        op.drop_index(name, table_name=table)
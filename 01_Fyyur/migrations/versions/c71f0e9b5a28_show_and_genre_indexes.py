@@ -0,0 +1,36 @@
+"""show and genre indexes
+
+Revision ID: c71f0e9b5a28
+Revises: a3033b9d3351
+Create Date: 2026-10-17 11:02:47.915306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f0e9b5a28'
+down_revision = 'a3033b9d3351'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_start_time_id', 'Shows', ['start_time', 'id'], unique=False)
+    op.create_index('ix_VenuesGenres_venue_id', 'VenuesGenres', ['venue_id'], unique=False)
+    op.create_index('ix_VenuesGenres_genre', 'VenuesGenres', ['genre'], unique=False)
+    op.create_index('ix_ArtistsGenres_artist_id', 'ArtistsGenres', ['artist_id'], unique=False)
+    op.create_index('ix_ArtistsGenres_genre', 'ArtistsGenres', ['genre'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ArtistsGenres_genre', table_name='ArtistsGenres')
+    op.drop_index('ix_ArtistsGenres_artist_id', table_name='ArtistsGenres')
+    op.drop_index('ix_VenuesGenres_genre', table_name='VenuesGenres')
+    op.drop_index('ix_VenuesGenres_venue_id', table_name='VenuesGenres')
+    op.drop_index('ix_Shows_start_time_id', table_name='Shows')
+    op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows')
+    op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows')
@@ -0,0 +1,25 @@
+"""venue city state index
+
+Revision ID: d5a9e2c7f1b3
+Revises: 0b9e5f7a3c61
+Create Date: 2026-10-17 18:20:11.604215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a9e2c7f1b3'
+down_revision = '0b9e5f7a3c61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /shows?city=&state= looks the venues of a place up case insensitively on the city
+    op.create_index('ix_Venue_city_state', 'Venue', [sa.text('lower(city)'), 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
@@ -0,0 +1,29 @@
+"""venue artist updated_at
+
+Revision ID: e4b8d2a17c90
+Revises: c71f0e9b5a28
+Create Date: 2026-10-17 12:21:05.377140
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8d2a17c90'
+down_revision = 'c71f0e9b5a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows get the migration time as their first version stamp
+    op.add_column('Venue', sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                     server_default=sa.text("(now() at time zone 'utc')")))
+    op.add_column('Artist', sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.text("(now() at time zone 'utc')")))
+
+
+def downgrade():
+    op.drop_column('Artist', 'updated_at')
+    op.drop_column('Venue', 'updated_at')
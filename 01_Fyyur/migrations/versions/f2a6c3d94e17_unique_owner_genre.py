@@ -0,0 +1,35 @@
+"""unique owner genre
+
+Revision ID: f2a6c3d94e17
+Revises: e4b8d2a17c90
+Create Date: 2026-10-17 13:40:18.622954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c3d94e17'
+down_revision = 'e4b8d2a17c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicated genres left by the old delete-all / re-insert edits, keep the first row
+    op.execute('''
+        DELETE FROM "VenuesGenres" a USING "VenuesGenres" b
+        WHERE a.venue_id = b.venue_id AND a.genre = b.genre AND a.id > b.id
+    ''')
+    op.execute('''
+        DELETE FROM "ArtistsGenres" a USING "ArtistsGenres" b
+        WHERE a.artist_id = b.artist_id AND a.genre = b.genre AND a.id > b.id
+    ''')
+    op.create_unique_constraint('uq_VenuesGenres_venue_id_genre', 'VenuesGenres', ['venue_id', 'genre'])
+    op.create_unique_constraint('uq_ArtistsGenres_artist_id_genre', 'ArtistsGenres', ['artist_id', 'genre'])
+
+
+def downgrade():
+    op.drop_constraint('uq_ArtistsGenres_artist_id_genre', 'ArtistsGenres', type_='unique')
+    op.drop_constraint('uq_VenuesGenres_venue_id_genre', 'VenuesGenres', type_='unique')
@@ -3,14 +3,269 @@ File:           models.py
 Author:         Dibyaranjan Sathua
 Created on:     19/12/2020, 18:17
 """
-from datetime import datetime
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects import postgresql
 
 db = SQLAlchemy()
 
+# Upcoming / past show counts for a single venue or artist
+ShowCounts = namedtuple('ShowCounts', ['upcoming', 'past'])
+
+# Length of a show booked without an end time
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+# Longest show accepted. It bounds the start_time range the conflict check has to scan.
+MAX_SHOW_DURATION = timedelta(hours=24)
+# Rows changed up to this long before the last seen change are read again by TableSync,
+# for the app servers whose clock runs behind and the transactions committed late
+SYNC_OVERLAP = timedelta(minutes=1)
+
+# Rows of a table to read again into an in-process copy, see TableSync.poll()
+TableChanges = namedtuple('TableChanges', ['since', 'deleted'])
+
+
+def _count_if(condition):
+    """
+    SUM(CASE WHEN condition THEN 1 ELSE 0 END). The 1 and 0 are inlined rather than bound,
+    as the server cannot type bound CASE results in statements prepared by asyncpg (asgi.py).
+    """
+    return db.func.sum(db.case([(condition, db.literal_column('1'))], else_=db.literal_column('0')))
+
+
+def _show_counts_query(owner_column, ids=None):
+    """ (owner_id, upcoming, past) query of the stats table of the owner column of Show """
+    stats = SHOW_STATS[owner_column.key]
+    key = getattr(stats, owner_column.key)
+    query = db.session.query(key, *_stats_counts(owner_column, datetime.now()))
+    if ids is not None:
+        query = query.filter(key.in_(list(ids)))
+    return query
+
+
+def collect_show_counts(rows):
+    """
+    Return {owner_id: ShowCounts} from the (owner_id, upcoming, past) rows of a show counts query.
+    Owners without shows are reported as ShowCounts(0, 0).
+    """
+    counts = defaultdict(lambda: ShowCounts(0, 0))
+    for owner_id, upcoming_count, past_count in rows:
+        counts[owner_id] = ShowCounts(int(upcoming_count or 0), int(past_count or 0))
+    return counts
+
+
+def _show_counts(owner_column, ids=None):
+    """
+    Return {owner_id: ShowCounts} for the owner column of Show (venue_id or artist_id).
+    Both counts are read from its stats table (VenueStats / ArtistStats) instead of counting the shows.
+    """
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return collect_show_counts(())
+    return collect_show_counts(_show_counts_query(owner_column, ids))
+
+
+def _sync_genres(genre_model, owner_column, owner_id, genres):
+    """
+    Make the genre rows of an owner (venue or artist) equal to genres.
+    Only the difference is written: one DELETE for removed genres and one
+    multi-row INSERT for added ones. Rows inserted by a concurrent edit are
+    skipped thanks to the unique (owner, genre) constraint.
+    """
+    genres = list(dict.fromkeys(genres))
+    stored = {x for x, in db.session.query(genre_model.genre).filter(owner_column == owner_id)}
+    removed = stored.difference(genres)
+    added = [x for x in genres if x not in stored]
+    if removed:
+        db.session.query(genre_model).filter(
+            owner_column == owner_id,
+            genre_model.genre.in_(removed)
+        ).delete(synchronize_session=False)
+    if added:
+        rows = [{owner_column.key: owner_id, 'genre': x} for x in added]
+        if db.session.get_bind().dialect.name == 'postgresql':
+            statement = postgresql.insert(genre_model.__table__).values(rows).on_conflict_do_nothing()
+        else:
+            statement = genre_model.__table__.insert().values(rows)
+        db.session.execute(statement)
+
+
+def _trigram_index(table, column):
+    """ GIN trigram index used by the ILIKE / similarity search on PostgreSQL """
+    return db.Index(
+        f'ix_{table}_{column}_trgm', column,
+        postgresql_using='gin',
+        postgresql_ops={column: 'gin_trgm_ops'}
+    )
+
+
+def _genre_names_column():
+    """ Denormalized copy of the genre rows, a GIN indexed ARRAY on PostgreSQL """
+    return db.Column(db.JSON().with_variant(postgresql.ARRAY(db.String), 'postgresql'))
+
+
+def _has_genre(model, genre_owner_column, genre_column, genre):
+    """
+    Filter for rows of model having genre. On PostgreSQL this is served by the
+    GIN index on genre_names, elsewhere it falls back to the genre table.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        genre_names = db.type_coerce(model.genre_names, postgresql.ARRAY(db.String))
+        return genre_names.contains(db.cast([genre], postgresql.ARRAY(db.String)))
+    return db.session.query(genre_owner_column).filter(
+        genre_owner_column == model.id,
+        genre_column == genre
+    ).exists()
+
+
+def _search(model, genre_owner_column, genre_column, search_term, limit, genre=None, columns=None):
+    """
+    Query of up to `limit` rows of `model` whose name, city, state or genre contains search_term,
+    restricted to the ones having `genre` when given. Rows are model instances, or tuples
+    of `columns` when given.
+    On PostgreSQL the ILIKE filters are served by the trigram indexes and the
+    results are ranked by name similarity, elsewhere they are ordered by name.
+    """
+    pattern = f'%{search_term}%'
+    genre_match = db.session.query(genre_owner_column).filter(
+        genre_owner_column == model.id,
+        genre_column.ilike(pattern)
+    ).exists()
+    query = db.session.query(*columns) if columns else model.query
+    query = query.filter(db.or_(
+        model.name.ilike(pattern),
+        model.city.ilike(pattern),
+        model.state.ilike(pattern),
+        genre_match
+    ))
+    if genre:
+        query = query.filter(_has_genre(model, genre_owner_column, genre_column, genre))
+    if db.session.get_bind().dialect.name == 'postgresql':
+        query = query.order_by(db.func.similarity(model.name, search_term).desc(), model.name)
+    else:
+        query = query.order_by(model.name)
+    return query.limit(limit)
+
+
+def group_areas(rows):
+    """
+    Yield the (city, state, id, name, num_upcoming_shows) rows of Venue.areas_query() grouped
+    by (city, state) as {'city': ..., 'state': ..., 'venues': iterator of {'id', 'name', 'num_upcoming_shows'}}.
+    """
+    for (city, state), venues in groupby(rows, key=itemgetter(0, 1)):
+        yield {
+            'city': city,
+            'state': state,
+            'venues': (
+                {'id': x[2], 'name': x[3], 'num_upcoming_shows': int(x[4])}
+                for x in venues
+            )
+        }
+
+
+class Deletions(db.Model):
+    """ Number and time of the row deletions of a table, which leave no updated_at behind """
+    __tablename__ = 'Deletions'
+
+    table_name = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def record(cls, table_name, now):
+        """ Count a deletion from table_name at now (UTC) """
+        if cls.query.filter(cls.table_name == table_name).update(
+            {cls.count: cls.count + 1, cls.deleted_at: now}, synchronize_session=False
+        ):
+            return
+        values = {'table_name': table_name, 'count': 1, 'deleted_at': now}
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # The first deletions of two concurrent transactions both land here
+            db.session.execute(postgresql.insert(cls.__table__).values(values).on_conflict_do_update(
+                index_elements=[cls.table_name], set_={'count': cls.count + 1, 'deleted_at': now}
+            ))
+        else:
+            db.session.execute(cls.__table__.insert().values(values))
+
+
+def _table_stamp(model):
+    """
+    (last change, deletion count) of a table from one query: the latest updated_at or
+    deletion, whichever is later, so the stamp never goes back when the newest row is deleted.
+    """
+    deletions = Deletions.query.filter(Deletions.table_name == model.__tablename__)
+    updated_at, count, deleted_at = db.session.query(
+        db.func.max(model.updated_at),
+        deletions.with_entities(Deletions.count).as_scalar(),
+        deletions.with_entities(Deletions.deleted_at).as_scalar()
+    ).one()
+    changes = [x for x in (updated_at, deleted_at) if x is not None]
+    return max(changes, default=None), count or 0
+
+
+class TableSync:
+    """
+    Change tracking of an in-process copy of a table (type-ahead index, venue locator).
+    Every worker holds its own copy, the edits of the other workers and of the CLI
+    commands reach it through the table stamp, which is read at most once per interval.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._stamp = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def reset(self):
+        """ Take the table stamp, right before the copy is loaded from the table """
+        with self._lock:
+            self._stamp = _table_stamp(self.model)
+            self._checked_at = time.monotonic()
+
+    def poll(self, interval):
+        """
+        Return None when the table did not change since the last reset / poll, else TableChanges:
+        the rows with updated_at >= since are to be read again, and when deleted is set the
+        rows gone from the table are to be dropped. Nothing is read within interval seconds
+        of the last check, or while another thread is checking.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < interval:
+                return None
+            stamp = _table_stamp(self.model)
+            previous, self._stamp, self._checked_at = self._stamp, stamp, now
+            if stamp == previous:
+                return None
+            if previous is None or previous[0] is None:
+                return TableChanges(datetime.min, False)
+            return TableChanges(previous[0] - SYNC_OVERLAP, stamp[1] != previous[1])
+        finally:
+            self._lock.release()
+
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        _trigram_index('Venue', 'name'),
+        _trigram_index('Venue', 'city'),
+        _trigram_index('Venue', 'state'),
+        db.Index('ix_Venue_genre_names', 'genre_names', postgresql_using='gin'),
+        # Shows in a city / state (/shows?city=&state=)
+        db.Index('ix_Venue_city_state', db.text('lower(city)'), 'state'),
+        # /venues pages in area order (area_order())
+        db.Index('ix_Venue_state_city_id', 'state', 'city', 'id'),
+        # Rows changed since the last sync of the in-process indexes (TableSync)
+        db.Index('ix_Venue_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -23,6 +278,13 @@ class Venue(db.Model):
     website = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.Text)
+    # Genres of the venue, kept in sync with VenuesGenres by sync_genres() for ?genre= filtering
+    genre_names = _genre_names_column()
+    # Geocoded from the city / state (geo.py), NULL when the lookup table does not know the place
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Version stamp of the venue page, bumped by edits and new shows (UTC)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     genres = db.relationship('VenuesGenres', backref='venue', lazy=True)
     shows = db.relationship('Show', backref='venue', lazy=True)
 
@@ -34,7 +296,7 @@ class Venue(db.Model):
         # upcoming_shows = [x for x in all_show if x.start_time >= now]
         # Join reference
         # https://www.tutorialspoint.com/sqlalchemy/sqlalchemy_orm_working_with_joins.htm
-        upcoming_shows = Show.query.join(Venue).filter(Show.start_time >= now).all()
+        upcoming_shows = Show.query.filter(Show.venue_id == self.id, Show.start_time >= now).all()
         return upcoming_shows
 
     @property
@@ -43,7 +305,7 @@ class Venue(db.Model):
         now = datetime.now()
         # all_show = Show.query.filter_by(venue_id=self.id).all()
         # past_shows = [x for x in all_show if x.start_time < now]
-        past_shows = Show.query.join(Venue).filter(Show.start_time < now).all()
+        past_shows = Show.query.filter(Show.venue_id == self.id, Show.start_time < now).all()
         return past_shows
 
     @property
@@ -52,9 +314,124 @@ class Venue(db.Model):
         # genres = VenuesGenres.query.filter_by(venue_id=self.id).all()
         return [x.genre for x in self.genres]
 
+    def shows_with_artist(self):
+        """ Return the venue shows with their artist columns, from a single joined query """
+        return self.shows_with_artist_query(self.id).all()
+
+    @classmethod
+    def shows_with_artist_query(cls, venue_id):
+        """ Query of the shows of a venue joined with their artist columns """
+        return db.session.query(
+            Show.start_time,
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        ).join(
+            Artist, Show.artist_id == Artist.id
+        ).filter(
+            Show.venue_id == venue_id
+        ).order_by(Show.start_time)
+
+    @classmethod
+    def search(cls, search_term, limit, genre=None, columns=None):
+        """ Return up to limit venues (or their columns) matching search_term (and genre), best matches first """
+        return cls.search_query(search_term, limit, genre, columns).all()
+
+    @classmethod
+    def search_query(cls, search_term, limit, genre=None, columns=None):
+        """ Query behind search() """
+        return _search(cls, VenuesGenres.venue_id, VenuesGenres.genre, search_term, limit, genre, columns)
+
+    def sync_genres(self, genres):
+        """ Replace the venue genres by genres, writing only the difference """
+        _sync_genres(VenuesGenres, VenuesGenres.venue_id, self.id, genres)
+        self.genre_names = list(dict.fromkeys(genres))
+
+    @classmethod
+    def has_genre(cls, genre):
+        """ Filter expression for venues having genre """
+        return _has_genre(cls, VenuesGenres.venue_id, VenuesGenres.genre, genre)
+
+    def touch(self, now):
+        """
+        Bump updated_at of the venue and of the artists playing there, whose pages show the venue.
+        Return the ids of those artists.
+        """
+        self.updated_at = now
+        artist_ids = [x for x, in db.session.query(Show.artist_id).filter(Show.venue_id == self.id).distinct()]
+        if artist_ids:
+            Artist.query.filter(Artist.id.in_(artist_ids)).update(
+                {Artist.updated_at: now}, synchronize_session=False
+            )
+        return artist_ids
+
+    @classmethod
+    def last_modified(cls, venue_id=None):
+        """ Return updated_at of a venue, or (last change, deletion count) of all venues """
+        if venue_id is not None:
+            return db.session.query(cls.updated_at).filter(cls.id == venue_id).scalar()
+        return _table_stamp(cls)
+
+    @classmethod
+    def show_counts(cls, venue_ids=None):
+        """ Return {venue_id: ShowCounts} for the given venues (all venues if None) """
+        return _show_counts(Show.venue_id, venue_ids)
+
+    @classmethod
+    def show_counts_query(cls, venue_ids):
+        """ Query behind show_counts(), its rows are turned into ShowCounts by collect_show_counts() """
+        return _show_counts_query(Show.venue_id, venue_ids)
+
+    @classmethod
+    def areas(cls, venue_ids=None):
+        """
+        Yield venues (all venues if venue_ids is None) grouped by (city, state) as
+        {'city': ..., 'state': ..., 'venues': iterator of {'id', 'name', 'num_upcoming_shows'}}.
+        Venues and their upcoming show counts (from VenueStats) come from one ordered query
+        and are bucketed while streaming, so each area is produced without rescanning the table.
+        """
+        return group_areas(cls.areas_query(venue_ids).yield_per(1000))
+
+    @classmethod
+    def areas_query(cls, venue_ids=None):
+        """ Query of (city, state, id, name, num_upcoming_shows) ordered by area, see areas() """
+        upcoming, _ = _stats_counts(Show.venue_id, datetime.now())
+        rows = db.session.query(
+            cls.city, cls.state, cls.id, cls.name, db.func.coalesce(upcoming, 0)
+        ).outerjoin(
+            VenueStats, VenueStats.venue_id == cls.id
+        )
+        if venue_ids is not None:
+            rows = rows.filter(cls.id.in_(list(venue_ids)))
+        return rows.order_by(*cls.area_order())
+
+    @classmethod
+    def area_order(cls):
+        """
+        Columns /venues is ordered and paginated by: areas follow each other, so an area
+        is only split where a page ends, and its venues come in id order
+        """
+        return [cls.state, cls.city, cls.id]
+
+
+# Spatial index of the nearby search (geo.py). ll_to_earth() comes from the PostgreSQL
+# cube / earthdistance extensions, other backends search an in-process k-d tree instead.
+event.listen(Venue.__table__, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS cube; CREATE EXTENSION IF NOT EXISTS earthdistance'
+).execute_if(dialect='postgresql'))
+event.listen(Venue.__table__, 'after_create', DDL(
+    'CREATE INDEX "ix_Venue_location" ON "Venue" USING gist (ll_to_earth(latitude, longitude))'
+).execute_if(dialect='postgresql'))
+
 
 class VenuesGenres(db.Model):
     __tablename__ = 'VenuesGenres'
+    __table_args__ = (
+        db.UniqueConstraint('venue_id', 'genre', name='uq_VenuesGenres_venue_id_genre'),
+        db.Index('ix_VenuesGenres_venue_id', 'venue_id'),
+        db.Index('ix_VenuesGenres_genre', 'genre'),
+        _trigram_index('VenuesGenres', 'genre'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
@@ -66,6 +443,13 @@ class VenuesGenres(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        _trigram_index('Artist', 'name'),
+        _trigram_index('Artist', 'city'),
+        _trigram_index('Artist', 'state'),
+        db.Index('ix_Artist_genre_names', 'genre_names', postgresql_using='gin'),
+        db.Index('ix_Artist_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -77,6 +461,10 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.Text)
+    # Genres of the artist, kept in sync with ArtistsGenres by sync_genres() for ?genre= filtering
+    genre_names = _genre_names_column()
+    # Version stamp of the artist page, bumped by edits and new shows (UTC)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     genres = db.relationship('ArtistsGenres', backref='artist', lazy=True)
     shows = db.relationship('Show', backref='artist', lazy=True)
 
@@ -92,7 +480,7 @@ class Artist(db.Model):
         now = datetime.now()
         # all_show = Show.query.filter_by(artist_id=self.id).all()
         # upcoming_shows = [x for x in all_show if x.start_time >= now]
-        upcoming_shows = Show.query.join(Artist).filter(Show.start_time >= now).all()
+        upcoming_shows = Show.query.filter(Show.artist_id == self.id, Show.start_time >= now).all()
         return upcoming_shows
 
     @property
@@ -101,7 +489,7 @@ class Artist(db.Model):
         now = datetime.now()
         # all_show = Show.query.filter_by(artist_id=self.id).all()
         # past_shows = [x for x in all_show if x.start_time < now]
-        past_shows = Show.query.join(Artist).filter(Show.start_time < now).all()
+        past_shows = Show.query.filter(Show.artist_id == self.id, Show.start_time < now).all()
         return past_shows
 
     @property
@@ -110,9 +498,83 @@ class Artist(db.Model):
         # genres = ArtistsGenres.query.filter_by(artist_id=self.id).all()
         return [x.genre for x in self.genres]
 
+    def shows_with_venue(self):
+        """ Return the artist shows with their venue columns, from a single joined query """
+        return self.shows_with_venue_query(self.id).all()
+
+    @classmethod
+    def shows_with_venue_query(cls, artist_id):
+        """ Query of the shows of a artist joined with their venue columns """
+        return db.session.query(
+            Show.start_time,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Venue.image_link.label('venue_image_link')
+        ).join(
+            Venue, Show.venue_id == Venue.id
+        ).filter(
+            Show.artist_id == artist_id
+        ).order_by(Show.start_time)
+
+    @classmethod
+    def search(cls, search_term, limit, genre=None, columns=None):
+        """ Return up to limit artists (or their columns) matching search_term (and genre), best matches first """
+        return cls.search_query(search_term, limit, genre, columns).all()
+
+    @classmethod
+    def search_query(cls, search_term, limit, genre=None, columns=None):
+        """ Query behind search() """
+        return _search(cls, ArtistsGenres.artist_id, ArtistsGenres.genre, search_term, limit, genre, columns)
+
+    def sync_genres(self, genres):
+        """ Replace the artist genres by genres, writing only the difference """
+        _sync_genres(ArtistsGenres, ArtistsGenres.artist_id, self.id, genres)
+        self.genre_names = list(dict.fromkeys(genres))
+
+    @classmethod
+    def has_genre(cls, genre):
+        """ Filter expression for artists having genre """
+        return _has_genre(cls, ArtistsGenres.artist_id, ArtistsGenres.genre, genre)
+
+    def touch(self, now):
+        """
+        Bump updated_at of the artist and of the venues it plays at, whose pages show the artist.
+        Return the ids of those venues.
+        """
+        self.updated_at = now
+        venue_ids = [x for x, in db.session.query(Show.venue_id).filter(Show.artist_id == self.id).distinct()]
+        if venue_ids:
+            Venue.query.filter(Venue.id.in_(venue_ids)).update(
+                {Venue.updated_at: now}, synchronize_session=False
+            )
+        return venue_ids
+
+    @classmethod
+    def last_modified(cls, artist_id=None):
+        """ Return updated_at of an artist, or (last change, deletion count) of all artists """
+        if artist_id is not None:
+            return db.session.query(cls.updated_at).filter(cls.id == artist_id).scalar()
+        return _table_stamp(cls)
+
+    @classmethod
+    def show_counts(cls, artist_ids=None):
+        """ Return {artist_id: ShowCounts} for the given artists (all artists if None) """
+        return _show_counts(Show.artist_id, artist_ids)
+
+    @classmethod
+    def show_counts_query(cls, artist_ids):
+        """ Query behind show_counts(), its rows are turned into ShowCounts by collect_show_counts() """
+        return _show_counts_query(Show.artist_id, artist_ids)
+
 
 class ArtistsGenres(db.Model):
     __tablename__ = 'ArtistsGenres'
+    __table_args__ = (
+        db.UniqueConstraint('artist_id', 'genre', name='uq_ArtistsGenres_artist_id_genre'),
+        db.Index('ix_ArtistsGenres_artist_id', 'artist_id'),
+        db.Index('ix_ArtistsGenres_genre', 'genre'),
+        _trigram_index('ArtistsGenres', 'genre'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
@@ -122,16 +584,345 @@ class ArtistsGenres(db.Model):
         return f'{self.__class__.__name__} [{self.id}, {self.genre}]'
 
 
+def show_end_time(start_time, minutes=None):
+    """ End of a show starting at start_time and lasting minutes, DEFAULT_SHOW_DURATION when not given """
+    return start_time + (timedelta(minutes=minutes) if minutes else DEFAULT_SHOW_DURATION)
+
+
+def _default_end_time(context):
+    return show_end_time(context.get_current_parameters()['start_time'])
+
+
+class Conflict(namedtuple('Conflict', ['side', 'owner_id', 'start_time', 'end_time', 'show_id', 'position'])):
+    """
+    The venue / artist of a new show already booked during it, by the stored show
+    show_id or by the new show at position of the same list.
+    """
+
+    def __str__(self):
+        booked_by = f'show {self.show_id}' if self.show_id is not None else 'another show of the submission'
+        return (f'The {self.side} {self.owner_id} is already booked from {self.start_time:%Y-%m-%d %H:%M} '
+                f'to {self.end_time:%Y-%m-%d %H:%M} by {booked_by}')
+
+
+def _overlapping(owner_column, owner_id, start_time, end_time):
+    """
+    Filter for the shows of an owner overlapping [start_time, end_time). No show lasts
+    longer than MAX_SHOW_DURATION, so the start_time bounds make it a short range scan
+    of the (owner, start_time) index.
+    """
+    return db.and_(
+        owner_column == owner_id,
+        Show.start_time > start_time - MAX_SHOW_DURATION,
+        Show.start_time < end_time,
+        Show.end_time > start_time
+    )
+
+
 class Show(db.Model):
     __tablename__ = 'Shows'
+    __table_args__ = (
+        # Past / upcoming shows of a venue or artist are range scans on these
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows is ordered and paginated by (start_time, id)
+        db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint('end_time >= start_time', name='ck_Shows_end_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # The show takes [start_time, end_time), its venue and artist cannot be booked twice during it
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
 
     def __repr__(self):
         return f'{self.__class__.__name__} [{self.id}, {self.venue_id}, {self.artist_id}]'
 
+    @classmethod
+    def filter_listing(cls, query, start=None, end=None, city=None, state=None):
+        """
+        Restrict a shows query to start <= start_time < end and to the venues of city / state,
+        in which case the query must join Venue. The time range is a range scan of
+        ix_Shows_start_time_id, the place is looked up through ix_Venue_city_state.
+        """
+        if start is not None:
+            query = query.filter(cls.start_time >= start)
+        if end is not None:
+            query = query.filter(cls.start_time < end)
+        if city:
+            query = query.filter(db.func.lower(Venue.city) == city.lower())
+        if state:
+            query = query.filter(Venue.state == state)
+        return query
+
+    @classmethod
+    def find_conflicts(cls, shows, chunk_size=100):
+        """
+        Return {position: Conflict} for the new shows, dicts of venue_id, artist_id, start_time
+        and end_time, whose venue or artist is already booked at that time by another show
+        of the list or by a stored show. The stored shows are looked up with one query per
+        chunk of new shows. On PostgreSQL the exclusion constraints on the table still
+        reject a show booked meanwhile by a concurrent transaction.
+        """
+        conflicts = {}
+        for side in ('venue', 'artist'):
+            key = f'{side}_id'
+            # Sorted by owner and start, each show is compared to the earlier show of its owner ending last
+            running = None
+            for position in sorted(range(len(shows)), key=lambda x: (shows[x][key], shows[x]['start_time'])):
+                show = shows[position]
+                if running is not None and shows[running][key] == show[key]:
+                    other = shows[running]
+                    if show['start_time'] < other['end_time']:
+                        conflicts.setdefault(position, Conflict(
+                            side, show[key], other['start_time'], other['end_time'], None, running
+                        ))
+                    if show['end_time'] <= other['end_time']:
+                        continue
+                running = position
+
+        for first in range(0, len(shows), chunk_size):
+            positions = [x for x in range(first, min(first + chunk_size, len(shows))) if x not in conflicts]
+            if not positions:
+                continue
+            stored = db.session.query(cls.id, cls.venue_id, cls.artist_id, cls.start_time, cls.end_time).filter(
+                db.or_(*[
+                    _overlapping(column, shows[x][column.key], shows[x]['start_time'], shows[x]['end_time'])
+                    for x in positions for column in (cls.venue_id, cls.artist_id)
+                ])
+            ).all()
+            booked = defaultdict(list)
+            for row in stored:
+                booked['venue', row.venue_id].append(row)
+                booked['artist', row.artist_id].append(row)
+            for position in positions:
+                show = shows[position]
+                for side in ('venue', 'artist'):
+                    for row in booked.get((side, show[f'{side}_id']), ()):
+                        if row.start_time < show['end_time'] and row.end_time > show['start_time']:
+                            conflicts.setdefault(position, Conflict(
+                                side, show[f'{side}_id'], row.start_time, row.end_time, row.id, None
+                            ))
+        return conflicts
+
     def __str__(self):
         return self.__repr__()
+
+
+# A venue or artist cannot be booked for two overlapping shows. PostgreSQL enforces it with
+# exclusion constraints (btree_gist for the = on the ids), elsewhere Show.find_conflicts() does.
+event.listen(Show.__table__, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS btree_gist'
+).execute_if(dialect='postgresql'))
+event.listen(Show.__table__, 'after_create', DDL(
+    'ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_venue_id_during" '
+    'EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)'
+).execute_if(dialect='postgresql'))
+event.listen(Show.__table__, 'after_create', DDL(
+    'ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_artist_id_during" '
+    'EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)'
+).execute_if(dialect='postgresql'))
+
+
+#  Show stats
+#  ----------------------------------------------------------------
+
+class VenueStats(db.Model):
+    """ Show counts of a venue, maintained by record_shows() / refresh_show_stats() """
+    __tablename__ = 'VenueStats'
+    __table_args__ = (
+        # Rows whose next show has started are found by roll_show_stats() with a range scan
+        db.Index('ix_VenueStats_next_show_at', 'next_show_at'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+    past_count = db.Column(db.Integer, nullable=False, default=0)
+    # Start of the first upcoming show and of the last past one, NULL when there is none
+    next_show_at = db.Column(db.DateTime)
+    last_show_at = db.Column(db.DateTime)
+
+
+class ArtistStats(db.Model):
+    """ Show counts of an artist, maintained by record_shows() / refresh_show_stats() """
+    __tablename__ = 'ArtistStats'
+    __table_args__ = (
+        db.Index('ix_ArtistStats_next_show_at', 'next_show_at'),
+    )
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+    past_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_at = db.Column(db.DateTime)
+    last_show_at = db.Column(db.DateTime)
+
+
+# Stats table of each owner column of Show
+SHOW_STATS = {'venue_id': VenueStats, 'artist_id': ArtistStats}
+# Owner ids per IN list of the stats queries
+STATS_CHUNK_SIZE = 1000
+
+
+def _id_chunks(ids):
+    ids = sorted(ids)
+    for first in range(0, len(ids), STATS_CHUNK_SIZE):
+        yield ids[first:first + STATS_CHUNK_SIZE]
+
+
+def _stats_counts(owner_column, now):
+    """
+    (upcoming, past) count expressions of the stats table of an owner column, exact at now.
+    A row is up to date while its next show has not started. Rows behind (the roll job has
+    not run since) recount their upcoming shows with a range scan of the (owner, start_time) index.
+    """
+    stats = SHOW_STATS[owner_column.key]
+    upcoming_now = db.session.query(db.func.count(Show.id)).filter(
+        owner_column == getattr(stats, owner_column.key),
+        Show.start_time >= now
+    ).correlate(stats).as_scalar()
+    current = db.or_(stats.next_show_at.is_(None), stats.next_show_at >= now)
+    upcoming = db.case([(current, stats.upcoming_count)], else_=upcoming_now)
+    past = db.case([(current, stats.past_count)], else_=stats.upcoming_count + stats.past_count - upcoming_now)
+    return upcoming, past
+
+
+def _recount_query(owner_column, ids, now):
+    """ (owner_id, upcoming, past, next_show_at, last_show_at) of owners counted from their shows """
+    upcoming = Show.start_time >= now
+    return db.session.query(
+        owner_column,
+        _count_if(upcoming),
+        _count_if(db.not_(upcoming)),
+        db.func.min(db.case([(upcoming, Show.start_time)])),
+        db.func.max(db.case([(db.not_(upcoming), Show.start_time)]))
+    ).filter(owner_column.in_(ids)).group_by(owner_column)
+
+
+def _stored_ids(stats, key, ids):
+    return {x for chunk in _id_chunks(ids) for x, in db.session.query(key).filter(key.in_(chunk))}
+
+
+def refresh_show_stats(owner_column, ids, now=None):
+    """
+    Recompute the stats rows of the owners (venue_id / artist_id values of owner_column) from
+    their shows, owners without shows get zero counts. Missing rows are inserted.
+    """
+    stats = SHOW_STATS[owner_column.key]
+    key = getattr(stats, owner_column.key)
+    now = now or datetime.now()
+    for chunk in _id_chunks(set(ids)):
+        rows = {x: {'owner_id': x, 'upcoming': 0, 'past': 0, 'next_show': None, 'last_show': None} for x in chunk}
+        for owner_id, upcoming, past, next_show, last_show in _recount_query(owner_column, chunk, now):
+            rows[owner_id].update(upcoming=int(upcoming), past=int(past), next_show=next_show, last_show=last_show)
+        stored = _stored_ids(stats, key, chunk)
+        if stored:
+            db.session.execute(
+                stats.__table__.update().where(key == db.bindparam('owner_id')).values({
+                    stats.upcoming_count: db.bindparam('upcoming'),
+                    stats.past_count: db.bindparam('past'),
+                    stats.next_show_at: db.bindparam('next_show'),
+                    stats.last_show_at: db.bindparam('last_show'),
+                }),
+                [rows[x] for x in stored]
+            )
+        missing = [
+            {key.key: x, 'upcoming_count': row['upcoming'], 'past_count': row['past'],
+             'next_show_at': row['next_show'], 'last_show_at': row['last_show']}
+            for x, row in rows.items() if x not in stored
+        ]
+        if missing:
+            _insert_stats(stats, key, missing)
+
+
+def _insert_stats(stats, key, rows):
+    """
+    Insert the stats rows of owners that had none. Every show is counted by record_shows() in
+    the transaction that books it, so an owner without a stats row had no committed show: its
+    recount holds only the shows of this transaction. A concurrent transaction booking the first
+    show of the same owner inserts its own row meanwhile, the counts of both are then added up.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        db.session.execute(stats.__table__.insert().values(rows))
+        return
+    statement = postgresql.insert(stats.__table__).values(rows)
+    db.session.execute(statement.on_conflict_do_update(index_elements=[key], set_={
+        'upcoming_count': stats.upcoming_count + statement.excluded.upcoming_count,
+        'past_count': stats.past_count + statement.excluded.past_count,
+        'next_show_at': _earliest(stats.next_show_at, statement.excluded.next_show_at),
+        'last_show_at': _latest(stats.last_show_at, statement.excluded.last_show_at),
+    }))
+
+
+def _earliest(column, value):
+    """ The earlier of column and value, NULL standing for no date """
+    return db.case([(column.is_(None), value), (value.is_(None), column), (value < column, value)], else_=column)
+
+
+def _latest(column, value):
+    return db.case([(column.is_(None), value), (value.is_(None), column), (value > column, value)], else_=column)
+
+
+def record_shows(shows, now=None):
+    """
+    Count new shows, dicts of venue_id, artist_id and start_time already written in the session,
+    in the stats of their venues and artists: the increments of every owner are sent as one
+    executemany UPDATE per side. Owners without a stats row get it counted from their shows.
+    """
+    now = now or datetime.now()
+    for owner_column in (Show.venue_id, Show.artist_id):
+        stats = SHOW_STATS[owner_column.key]
+        key = getattr(stats, owner_column.key)
+        deltas = {}
+        for show in shows:
+            owner_id = show[owner_column.key]
+            delta = deltas.setdefault(owner_id, {
+                'owner_id': owner_id, 'upcoming': 0, 'past': 0, 'next_show': None, 'last_show': None
+            })
+            if show['start_time'] >= now:
+                delta['upcoming'] += 1
+                delta['next_show'] = min(x for x in (delta['next_show'], show['start_time']) if x is not None)
+            else:
+                delta['past'] += 1
+                delta['last_show'] = max(x for x in (delta['last_show'], show['start_time']) if x is not None)
+        stored = _stored_ids(stats, key, deltas)
+        if stored:
+            next_show = db.bindparam('next_show', type_=db.DateTime)
+            last_show = db.bindparam('last_show', type_=db.DateTime)
+            db.session.execute(
+                stats.__table__.update().where(key == db.bindparam('owner_id')).values({
+                    stats.upcoming_count: stats.upcoming_count + db.bindparam('upcoming'),
+                    stats.past_count: stats.past_count + db.bindparam('past'),
+                    stats.next_show_at: _earliest(stats.next_show_at, next_show),
+                    stats.last_show_at: _latest(stats.last_show_at, last_show),
+                }),
+                [deltas[x] for x in stored]
+            )
+        missing = deltas.keys() - stored
+        if missing:
+            refresh_show_stats(owner_column, missing, now)
+
+
+def roll_show_stats(now=None, chunk_size=STATS_CHUNK_SIZE):
+    """
+    Move the shows started since the last roll from the upcoming to the past counts. Only the rows
+    whose next show has started are recounted, chunk by chunk, each chunk in its own transaction.
+    Its rows are locked first, so a show booked meanwhile is counted either by the recount or by
+    its own increment afterwards. Return the number of venues and artists rolled.
+    """
+    now = now or datetime.now()
+    rolled = 0
+    for owner_column in (Show.venue_id, Show.artist_id):
+        stats = SHOW_STATS[owner_column.key]
+        key = getattr(stats, owner_column.key)
+        while True:
+            ids = [x for x, in db.session.query(key).filter(
+                stats.next_show_at < now
+            ).order_by(stats.next_show_at).limit(chunk_size).with_for_update()]
+            if not ids:
+                break
+            refresh_show_stats(owner_column, ids, now)
+            db.session.commit()
+            rolled += len(ids)
+    return rolled
@@ -0,0 +1,119 @@
+"""
+File:           pagination.py
+Keyset (cursor) pagination for the listing pages.
+"""
+from datetime import datetime
+from urllib.parse import quote, unquote
+from flask import request, current_app
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """ One page of a keyset paginated query """
+
+    def __init__(self, items, keys, has_next, has_prev, limit):
+        self.items = items
+        self.keys = keys
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.limit = limit
+
+    @property
+    def next_cursor(self):
+        """ Cursor to pass as ?after= for the next page """
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self.keys(self.items[-1]))
+
+    @property
+    def prev_cursor(self):
+        """ Cursor to pass as ?before= for the previous page """
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self.keys(self.items[0]))
+
+
+def _encode_key(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Text keys (city, state) may hold the ',' separating the values
+    return quote(value, safe='') if isinstance(value, str) else str(value)
+
+
+def encode_cursor(values):
+    """ Encode a tuple of key values as a url safe cursor string """
+    return ','.join(_encode_key(x) for x in values)
+
+
+def decode_cursor(cursor, types):
+    """ Decode a cursor string into a tuple of key values. Returns None for a bad cursor """
+    if not cursor:
+        return None
+    parts = cursor.split(',')
+    if len(parts) != len(types):
+        return None
+    try:
+        return tuple(
+            datetime.fromisoformat(x) if type_ is datetime else unquote(x) if type_ is str else type_(x)
+            for x, type_ in zip(parts, types)
+        )
+    except ValueError:
+        return None
+
+
+def page_args(*types):
+    """ Read the ?after= / ?before= cursors and ?limit= page size of a listing request """
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+    return {
+        'limit': limit,
+        'after': decode_cursor(request.args.get('after'), types),
+        'before': decode_cursor(request.args.get('before'), types)
+    }
+
+
+def _after(columns, values):
+    """ Row-value comparison (c1, c2, ...) > (v1, v2, ...) spelled out for every backend """
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return or_(column > value, and_(column == value, _after(columns[1:], values[1:])))
+
+
+def _before(columns, values):
+    """ Row-value comparison (c1, c2, ...) < (v1, v2, ...) spelled out for every backend """
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column < value
+    return or_(column < value, and_(column == value, _before(columns[1:], values[1:])))
+
+
+def keyset_query(query, columns, limit, after=None, before=None):
+    """ `query` past the after / before cursor, ordered by `columns` and limited to limit + 1 rows """
+    if before is not None:
+        return query.filter(_before(columns, before)).order_by(
+            *[x.desc() for x in columns]
+        ).limit(limit + 1)
+    if after is not None:
+        query = query.filter(_after(columns, after))
+    return query.order_by(*columns).limit(limit + 1)
+
+
+def keyset_page(rows, keys, limit, after=None, before=None):
+    """ KeysetPage of the rows fetched with keyset_query() """
+    if before is not None:
+        has_prev = len(rows) > limit
+        items = list(reversed(rows[:limit]))
+        return KeysetPage(items, keys, has_next=True, has_prev=has_prev, limit=limit)
+    has_next = len(rows) > limit
+    return KeysetPage(rows[:limit], keys, has_next=has_next, has_prev=after is not None, limit=limit)
+
+
+def keyset_paginate(query, columns, keys, limit, after=None, before=None):
+    """
+    Return a KeysetPage of at most `limit` rows from `query` ordered by `columns`.
+    `keys` extracts the key values of `columns` from a row, `after` / `before`
+    are decoded cursors. Only limit + 1 rows are ever fetched.
+    """
+    rows = keyset_query(query, columns, limit, after, before).all()
+    return keyset_page(rows, keys, limit, after, before)
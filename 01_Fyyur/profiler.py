@@ -0,0 +1,139 @@
+"""
+File:           profiler.py
+Opt-in per-request profiler (PROFILER_ENABLED).
+
+For every request it records the number of SQL statements, the time spent in
+the database and in Jinja rendering, and the slowest statements. A summary is
+sent in the X-Request-Profile response header and requests slower than
+PROFILER_SLOW_MS are appended as JSON lines to PROFILER_SLOW_LOG.
+
+The header is written when the view returns, so the part of a streamed page
+rendered afterwards only shows up in the slow log.
+"""
+import heapq
+import json
+import logging
+import time
+from datetime import datetime
+
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile:
+    """ Timings of one request """
+
+    def __init__(self, top_statements):
+        self.started = time.perf_counter()
+        self.top_statements = top_statements
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = None
+        self.slowest = []   # min-heap of (seconds, statement)
+
+    def add_statement(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        entry = (seconds, statement)
+        if len(self.slowest) < self.top_statements:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        return (f'queries={self.queries}; db={self.db_seconds * 1000:.1f}ms; '
+                f'render={self.render_seconds * 1000:.1f}ms; total={self.total_seconds * 1000:.1f}ms')
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 3),
+            'render_ms': round(self.render_seconds * 1000, 3),
+            'total_ms': round(self.total_seconds * 1000, 3),
+            'slowest': [
+                {'ms': round(seconds * 1000, 3), 'statement': statement}
+                for seconds, statement in sorted(self.slowest, reverse=True)
+            ]
+        }
+
+
+def _current_profile():
+    return g.get('profile') if has_request_context() else None
+
+
+class RequestProfiler:
+    """ Hooks the request, template and SQLAlchemy cursor events when PROFILER_ENABLED is set """
+
+    def __init__(self, app=None):
+        self.slow_log = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('PROFILER_ENABLED'):
+            return
+        self.slow_ms = app.config.get('PROFILER_SLOW_MS', 500)
+        self.top_statements = app.config.get('PROFILER_TOP_STATEMENTS', 5)
+
+        self.slow_log = logging.getLogger('fyyur.slow_requests')
+        self.slow_log.propagate = False
+        self.slow_log.setLevel(logging.INFO)
+        handler = logging.FileHandler(app.config.get('PROFILER_SLOW_LOG', 'slow_requests.log'))
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.slow_log.addHandler(handler)
+
+        app.before_request(self._start)
+        app.after_request(self._add_header)
+        app.teardown_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _start(self):
+        g.profile = RequestProfile(self.top_statements)
+
+    def _add_header(self, response):
+        profile = _current_profile()
+        if profile is not None:
+            response.headers['X-Request-Profile'] = profile.header()
+        return response
+
+    def _finish(self, exc=None):
+        profile = _current_profile()
+        if profile is None or profile.total_seconds * 1000 < self.slow_ms:
+            return
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint
+        }
+        entry.update(profile.as_dict())
+        self.slow_log.info(json.dumps(entry))
+
+    def _render_started(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None:
+            profile.render_started = time.perf_counter()
+
+    def _render_finished(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None and profile.render_started is not None:
+            profile.render_seconds += time.perf_counter() - profile.render_started
+            profile.render_started = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        profile = _current_profile()
+        if profile is not None:
+            profile.add_statement(statement, time.perf_counter() - started)
@@ -2,3 +2,55 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Search type-ahead: fill the datalist from /search/suggest as the user types
+document.addEventListener('DOMContentLoaded', function () {
+  var input = document.querySelector('input[data-suggest]');
+  var list = document.getElementById('search-suggestions');
+  if (!input || !list) {
+    return;
+  }
+  var timer = null;
+  var lastPrefix = null;
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var prefix = input.value.trim();
+      if (prefix === lastPrefix) {
+        return;
+      }
+      lastPrefix = prefix;
+      if (!prefix) {
+        list.innerHTML = '';
+        return;
+      }
+      var url = '/search/suggest?type=' + input.dataset.suggest + '&q=' + encodeURIComponent(prefix);
+      fetch(url)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          list.innerHTML = '';
+          data.suggestions.forEach(function (suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.name;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
+
+// Venues near me: fill the coordinates of the search form from the browser location
+document.addEventListener('DOMContentLoaded', function () {
+  var button = document.getElementById('locate');
+  if (!button || !navigator.geolocation) {
+    return;
+  }
+  button.addEventListener('click', function () {
+    navigator.geolocation.getCurrentPosition(function (position) {
+      var form = button.form;
+      form.elements.lat.value = position.coords.latitude.toFixed(5);
+      form.elements.lon.value = position.coords.longitude.toFixed(5);
+      form.submit();
+    });
+  });
+});
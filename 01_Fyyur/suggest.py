@@ -0,0 +1,127 @@
+"""
+File:           suggest.py
+In-memory prefix index over venue and artist names for the search type-ahead.
+
+Every word of a name is a lookup key, so "park" finds "Park Square Live Music"
+and "square" finds it too. Keys live in one sorted list searched with bisect.
+
+Every worker holds its own index; app.sync_search_index() applies the changes
+made elsewhere through update(). With 1M names it holds about 3M keys and takes
+about 570 MiB (bench/suggest_memory.py).
+"""
+from bisect import bisect_left, insort
+from threading import Lock
+
+VENUE = 'venue'
+ARTIST = 'artist'
+# Changed names are inserted one by one below this, merged in one pass over the index above
+MERGE_AFTER = 100
+
+
+def _keys(name):
+    """ Return the casefolded suffixes of name starting at each word """
+    folded = name.casefold()
+    keys = []
+    start = 0
+    for word in folded.split():
+        start = folded.index(word, start)
+        keys.append(folded[start:])
+        start += len(word)
+    return keys
+
+
+class PrefixIndex:
+    """ Sorted array of (key, kind, id) entries with prefix lookup """
+
+    def __init__(self):
+        self._entries = []
+        self._names = {}
+        self._lock = Lock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, rows):
+        """ Replace the index with rows of (kind, id, name) """
+        names = {}
+        entries = []
+        for kind, id_, name in rows:
+            names[(kind, id_)] = name
+            entries.extend((key, kind, id_) for key in _keys(name))
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._names = names
+            self.ready = True
+
+    def add(self, kind, id_, name):
+        """ Add or replace the name of a venue / artist """
+        with self._lock:
+            self._insert(kind, id_, name)
+
+    def update(self, kind, rows, ids=None):
+        """
+        Add or replace rows of (id, name) of one kind. ids, when given, are all the ids
+        of that kind still stored and the others are dropped.
+        """
+        rows = list(rows)
+        with self._lock:
+            gone = set() if ids is None else {x for k, x in self._names if k == kind and x not in ids}
+            if len(rows) + len(gone) < MERGE_AFTER:
+                for id_ in gone:
+                    self._remove(kind, id_)
+                for id_, name in rows:
+                    self._insert(kind, id_, name)
+                return
+            gone.update(id_ for id_, _ in rows)
+            entries = [x for x in self._entries if x[1] != kind or x[2] not in gone]
+            for id_ in gone:
+                self._names.pop((kind, id_), None)
+            for id_, name in rows:
+                self._names[(kind, id_)] = name
+                entries.extend((key, kind, id_) for key in _keys(name))
+            # Sorted run plus a short tail: the sort is about one merge
+            entries.sort()
+            self._entries = entries
+
+    def remove(self, kind, id_):
+        """ Drop a venue / artist from the index """
+        with self._lock:
+            self._remove(kind, id_)
+
+    def _insert(self, kind, id_, name):
+        self._remove(kind, id_)
+        self._names[(kind, id_)] = name
+        for key in _keys(name):
+            insort(self._entries, (key, kind, id_))
+
+    def _remove(self, kind, id_):
+        name = self._names.pop((kind, id_), None)
+        if name is None:
+            return
+        for key in _keys(name):
+            position = bisect_left(self._entries, (key, kind, id_))
+            if position < len(self._entries) and self._entries[position] == (key, kind, id_):
+                del self._entries[position]
+
+    def suggest(self, prefix, limit=10, kind=None):
+        """ Return up to limit {'type', 'id', 'name'} dicts whose name has a word starting with prefix """
+        prefix = ' '.join(prefix.casefold().split())
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            entries = self._entries
+            position = bisect_left(entries, (prefix,))
+            while position < len(entries) and len(results) < limit:
+                key, entry_kind, id_ = entries[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if (kind is not None and entry_kind != kind) or (entry_kind, id_) in seen:
+                    continue
+                seen.add((entry_kind, id_))
+                results.append({'type': entry_kind, 'id': id_, 'name': self._names[(entry_kind, id_)]})
+        return results
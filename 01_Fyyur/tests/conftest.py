@@ -0,0 +1,54 @@
+"""
+File:           tests/conftest.py
+Fixtures: the app bound to a SQLite database seeded with the bench/seed.py data set.
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from seed import bench_app, seed  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """ The app on a seeded SQLite database, with the response cache and CSRF checks off """
+    app = bench_app('sqlite:///' + str(tmp_path_factory.mktemp('db') / 'fyyur.sqlite'))
+    app.config['WTF_CSRF_ENABLED'] = False
+    from app import response_cache
+    from cache import NullBackend
+    from models import db
+    response_cache.backend = NullBackend()
+    with app.app_context():
+        seed(1000)
+        db.session.remove()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    # The first request builds the in-process indexes, its queries are not the ones of a route
+    client.get('/')
+    return client
+
+
+@pytest.fixture
+def statements(app):
+    """ SQL statements run while the test is in progress """
+    from models import db
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
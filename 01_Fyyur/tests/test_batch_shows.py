@@ -0,0 +1,129 @@
+"""
+File:           tests/test_batch_shows.py
+POST /api/v1/shows/batch and the /shows/batch tour form: every show of a batch is
+created or none, errors are reported by row number.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Venue, Artist, Show, db
+
+# Far beyond the seeded shows and the days of test_booking.py
+DAY = datetime(2041, 1, 1, 20, 0)
+
+
+@pytest.fixture
+def owners(app):
+    """ Three venue ids and an artist id """
+    with app.app_context():
+        venues = [x for x, in db.session.query(Venue.id).order_by(Venue.id).limit(3)]
+        artist_id, = db.session.query(Artist.id).order_by(Artist.id.desc()).first()
+        db.session.remove()
+    return venues, artist_id
+
+
+def show_count(app):
+    with app.app_context():
+        count = Show.query.count()
+        db.session.remove()
+    return count
+
+
+def post_batch(client, shows):
+    response = client.post('/api/v1/shows/batch', data=json.dumps({'shows': shows}), content_type='application/json')
+    return response.status_code, response.get_json()
+
+
+def tour(venues, artist_id, first_day):
+    return [
+        {'venue_id': venue_id, 'artist_id': artist_id,
+         'start_time': (first_day + timedelta(days=i)).isoformat(), 'duration': 90}
+        for i, venue_id in enumerate(venues)
+    ]
+
+
+def test_batch_created(app, client, owners):
+    venues, artist_id = owners
+    count = show_count(app)
+    status, body = post_batch(client, tour(venues, artist_id, DAY))
+    assert status == 201
+    assert body['count'] == 3
+    assert body['data'][0] == {
+        'venue_id': venues[0], 'artist_id': artist_id,
+        'start_time': DAY.isoformat(), 'end_time': (DAY + timedelta(minutes=90)).isoformat()
+    }
+    assert show_count(app) == count + 3
+
+
+def test_batch_rolled_back_on_conflict(app, client, owners):
+    venues, artist_id = owners
+    booked_at = DAY + timedelta(days=10)
+    assert post_batch(client, tour(venues[:1], artist_id, booked_at))[0] == 201
+    shows = tour(venues, artist_id, DAY + timedelta(days=11))
+    # The last show takes the slot of the one just booked, the two valid ones are not created either
+    shows[-1]['start_time'] = (booked_at + timedelta(minutes=30)).isoformat()
+    count = show_count(app)
+    status, body = post_batch(client, shows)
+    assert status == 400
+    assert [x['row'] for x in body['errors']] == [3]
+    assert 'is already booked from 2041-01-11 20:00' in body['errors'][0]['error']
+    assert show_count(app) == count
+
+
+def test_batch_row_errors(app, client, owners):
+    venues, artist_id = owners
+    shows = tour(venues, artist_id, DAY + timedelta(days=20)) + [
+        'not a show',
+        {'venue_id': venues[0], 'artist_id': artist_id, 'start_time': '2041-03-01T20:00:00+02:00'},
+        {'venue_id': 1.5, 'artist_id': artist_id, 'start_time': '2041-03-02T20:00:00'},
+        {'venue_id': venues[0], 'artist_id': artist_id, 'start_time': '2041-03-03T20:00:00', 'duration': 0},
+    ]
+    count = show_count(app)
+    status, body = post_batch(client, shows)
+    assert status == 400
+    assert body['errors'] == [
+        {'row': 4, 'error': 'Expected an object'},
+        {'row': 5, 'error': 'start_time must be a local time of the venue, without a UTC offset'},
+        {'row': 6, 'error': 'venue_id must be a whole number above 0'},
+        {'row': 7, 'error': 'duration must be a whole number above 0'},
+    ]
+    assert show_count(app) == count
+
+
+def test_batch_size_limit(app, client, owners, monkeypatch):
+    venues, artist_id = owners
+    monkeypatch.setitem(app.config, 'BATCH_MAX_SHOWS', 2)
+    status, body = post_batch(client, tour(venues, artist_id, DAY + timedelta(days=30)))
+    assert (status, body) == (400, {'error': 'At most 2 shows per request'})
+    response = client.post('/shows/batch', data={
+        'artist_id': str(artist_id),
+        'dates': '\n'.join(f'{x}, 2041-02-0{i + 1} 20:00' for i, x in enumerate(venues))
+    })
+    assert response.status_code == 400
+    assert 'A tour has at most 2 shows' in response.get_data(as_text=True)
+
+
+def test_tour_form(app, client, owners):
+    venues, artist_id = owners
+    count = show_count(app)
+    # Blank lines are not rows
+    response = client.post('/shows/batch', data={
+        'artist_id': str(artist_id), 'dates': f'{venues[0]}, 2041-04-01 20:00\n\n{venues[1]}, tomorrow'
+    })
+    assert response.status_code == 400
+    assert 'Row 2: start_time must be a date and time' in response.get_data(as_text=True)
+    # The artist would play two venues at once
+    response = client.post('/shows/batch', data={
+        'artist_id': str(artist_id), 'dates': f'{venues[0]}, 2041-04-01 20:00\n{venues[1]}, 2041-04-01 21:00, 60'
+    })
+    assert response.status_code == 400
+    assert f'Row 2: The artist {artist_id} is already booked' in response.get_data(as_text=True)
+    assert show_count(app) == count
+
+    response = client.post('/shows/batch', data={
+        'artist_id': str(artist_id), 'dates': f'{venues[0]}, 2041-04-01 20:00\n{venues[1]}, 2041-04-02 21:00, 60'
+    })
+    assert response.status_code == 200
+    assert show_count(app) == count + 2
@@ -0,0 +1,105 @@
+"""
+File:           tests/test_booking.py
+Double booking: a venue or an artist cannot take two shows overlapping in time,
+shows that only touch (one ends when the next starts) are allowed.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Venue, Artist, Show, db
+
+# Far beyond the seeded shows, every test books its own day
+DAY = datetime(2040, 1, 1, 20, 0)
+
+
+@pytest.fixture
+def owners(app):
+    """ Two venue ids and two artist ids """
+    with app.app_context():
+        venues = [x for x, in db.session.query(Venue.id).order_by(Venue.id).limit(2)]
+        artists = [x for x, in db.session.query(Artist.id).order_by(Artist.id).limit(2)]
+        db.session.remove()
+    return venues, artists
+
+
+def book(client, venue_id, artist_id, start_time, duration=120):
+    """ POST /shows/create, return the messages it flashed """
+    response = client.post('/shows/create', data={
+        'venue_id': str(venue_id), 'artist_id': str(artist_id),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': str(duration)
+    })
+    if response.status_code == 200:
+        return ['Show listed successfully']
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop('_flashes', [])]
+
+
+def conflicts(app, venue_id, artist_id, start_time, duration=120):
+    """ Conflicts of a show not yet stored """
+    show = {'venue_id': venue_id, 'artist_id': artist_id,
+            'start_time': start_time, 'end_time': start_time + timedelta(minutes=duration)}
+    with app.app_context():
+        found = Show.find_conflicts([show])
+        db.session.remove()
+    return found
+
+
+def test_venue_slot_taken(app, client, owners):
+    (venue, _), (artist, other_artist) = owners
+    start = DAY
+    assert book(client, venue, artist, start) == ['Show listed successfully']
+    conflict = conflicts(app, venue, other_artist, start + timedelta(minutes=60))[0]
+    assert (conflict.side, conflict.owner_id) == ('venue', venue)
+    assert (conflict.start_time, conflict.end_time) == (start, start + timedelta(hours=2))
+    assert conflict.show_id is not None
+
+
+def test_artist_slot_taken(app, client, owners):
+    (venue, other_venue), (artist, _) = owners
+    start = DAY + timedelta(days=1)
+    assert book(client, venue, artist, start) == ['Show listed successfully']
+    conflict = conflicts(app, other_venue, artist, start - timedelta(minutes=30))[0]
+    assert (conflict.side, conflict.owner_id) == ('artist', artist)
+
+
+def test_touching_shows_allowed(app, client, owners):
+    (venue, _), (artist, other_artist) = owners
+    start = DAY + timedelta(days=2)
+    assert book(client, venue, artist, start, 90) == ['Show listed successfully']
+    # One ends when the next starts, on either side
+    assert conflicts(app, venue, other_artist, start + timedelta(minutes=90)) == {}
+    assert conflicts(app, venue, other_artist, start - timedelta(minutes=120)) == {}
+    assert book(client, venue, other_artist, start + timedelta(minutes=90)) == ['Show listed successfully']
+
+
+def test_conflicts_within_the_submission(app, owners):
+    (venue, other_venue), (artist, _) = owners
+    start = DAY + timedelta(days=3)
+    shows = [
+        {'venue_id': venue, 'artist_id': artist, 'start_time': start, 'end_time': start + timedelta(hours=2)},
+        {'venue_id': other_venue, 'artist_id': artist,
+         'start_time': start + timedelta(hours=1), 'end_time': start + timedelta(hours=3)},
+    ]
+    with app.app_context():
+        found = Show.find_conflicts(shows)
+    assert list(found) == [1]
+    assert (found[1].side, found[1].position, found[1].show_id) == ('artist', 0, None)
+
+
+def test_create_flashes_conflict(app, client, owners):
+    (venue, _), (artist, other_artist) = owners
+    start = DAY + timedelta(days=4)
+    assert book(client, venue, artist, start) == ['Show listed successfully']
+    with app.app_context():
+        show_id, = db.session.query(Show.id).filter(Show.venue_id == venue, Show.start_time == start).one()
+        count = Show.query.count()
+        db.session.remove()
+    messages = book(client, venue, other_artist, start + timedelta(minutes=30))
+    assert messages == [
+        f'The venue {venue} is already booked from {start:%Y-%m-%d %H:%M} '
+        f'to {start + timedelta(hours=2):%Y-%m-%d %H:%M} by show {show_id}'
+    ]
+    with app.app_context():
+        assert Show.query.count() == count
+        db.session.remove()
@@ -0,0 +1,18 @@
+"""
+File:           tests/test_filters.py
+?when=tonight ranges before and after midnight.
+"""
+from datetime import datetime
+
+import pytest
+
+from filters import when_range
+
+
+@pytest.mark.parametrize('now, end', [
+    (datetime(2026, 10, 16, 21, 0), datetime(2026, 10, 17, 4, 0)),
+    (datetime(2026, 10, 17, 1, 30), datetime(2026, 10, 17, 4, 0)),
+    (datetime(2026, 10, 17, 4, 0), datetime(2026, 10, 18, 4, 0)),
+])
+def test_tonight_ends_at_night_end(now, end):
+    assert when_range('tonight', now) == (now, end)
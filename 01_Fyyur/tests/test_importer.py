@@ -0,0 +1,109 @@
+"""
+File:           tests/test_importer.py
+Bulk import: rows counted once as imported or rejected, with their line numbers,
+imported shows seen by the pages of their venues and artists.
+"""
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+import importer
+from models import Venue, VenuesGenres, Artist, Show, db
+
+
+@pytest.fixture
+def owners(app):
+    """ Two venue ids and an artist id """
+    with app.app_context():
+        venues = [x for x, in db.session.query(Venue.id).order_by(Venue.id).limit(2)]
+        artist_id, = db.session.query(Artist.id).order_by(Artist.id).first()
+        db.session.remove()
+    return venues, artist_id
+
+
+def run_import(app, entity, text, file_format='jsonl', chunk_size=5000):
+    with app.app_context():
+        report = importer.import_rows(
+            entity, importer.read_rows(io.StringIO(text), file_format), chunk_size=chunk_size
+        )
+        db.session.remove()
+    return report
+
+
+def show_lines(*shows):
+    return '\n'.join(
+        x if isinstance(x, str) else json.dumps({'venue_id': x[0], 'artist_id': x[1], 'start_time': x[2]})
+        for x in shows
+    ) + '\n'
+
+
+def test_import_shows(app, client, owners):
+    (venue_id, other_venue), artist_id = owners
+    etag, _ = client.get(f'/venues/{venue_id}').get_etag()
+    with app.app_context():
+        updated_at = {x.id: x.updated_at for x in Venue.query.filter(Venue.id.in_([venue_id, other_venue]))}
+        db.session.remove()
+    text = show_lines(
+        (venue_id, artist_id, '2043-01-01 20:00:00'),
+        '{"venue_id": ',
+        (999999, artist_id, '2043-01-02 20:00:00'),
+        '',
+        # The artist plays the venue of line 1 at that time
+        (other_venue, artist_id, '2043-01-01 21:00:00'),
+        (venue_id, artist_id, '2043-01-03 20:00:00'),
+    )
+    report = run_import(app, 'shows', text)
+    assert (report.read, report.imported, report.rejected) == (5, 2, 3)
+    assert [line for line, _ in report.errors] == [2, 3, 5]
+    assert report.errors[1][1] == 'The venue id 999999 does not exist'
+    assert report.errors[2][1].endswith(', line 1')
+    with app.app_context():
+        assert Show.query.filter(Show.venue_id == venue_id, Show.start_time >= datetime(2043, 1, 1)).count() == 2
+        # Only the venue of the imported shows was touched
+        assert Venue.query.get(venue_id).updated_at > updated_at[venue_id]
+        assert Venue.query.get(other_venue).updated_at == updated_at[other_venue]
+        db.session.remove()
+    # The venue page changed with its new shows
+    response = client.get(f'/venues/{venue_id}', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_failed_chunk_counted_once(app, owners, monkeypatch):
+    (venue_id, _), artist_id = owners
+    text = show_lines(
+        (venue_id, artist_id, '2043-02-01 20:00:00'),
+        (999999, artist_id, '2043-02-02 20:00:00'),
+        (venue_id, artist_id, '2043-02-03 20:00:00'),
+    )
+
+    def fail(rows, now=None):
+        raise RuntimeError('stats table locked')
+    monkeypatch.setattr(importer, 'record_shows', fail)
+    report = run_import(app, 'shows', text)
+    # The unknown venue is rejected on its own, the two others with the chunk
+    assert (report.read, report.imported, report.rejected) == (3, 0, 3)
+    assert report.errors[1] == (1, 'chunk of 2 rows failed: stats table locked')
+    with app.app_context():
+        assert Show.query.filter(Show.start_time >= datetime(2043, 2, 1)).count() == 0
+        db.session.remove()
+
+
+def test_import_venues_csv(app):
+    text = (
+        'name,city,state,address,phone,genres,seeking_talent\n'
+        'Import Hall,San Francisco,CA,1 Main St,123-123-1234,Jazz;Blues,Yes\n'
+        '"Quoted\nHall",San Francisco,CA,2 Main St,123-123-1234,Jazz,No\n'
+        'No Genre Hall,San Francisco,CA,3 Main St,123-123-1234,,No\n'
+    )
+    report = run_import(app, 'venues', text, 'csv')
+    assert (report.read, report.imported, report.rejected) == (3, 2, 1)
+    assert report.errors[0][0] == 5
+    with app.app_context():
+        venue = Venue.query.filter(Venue.name == 'Import Hall').one()
+        assert sorted(x.genre for x in VenuesGenres.query.filter(VenuesGenres.venue_id == venue.id)) == \
+            ['Blues', 'Jazz']
+        assert venue.seeking_talent
+        db.session.remove()
@@ -0,0 +1,104 @@
+"""
+File:           tests/test_index_sync.py
+In-process type-ahead index and venue locator: changes written by another worker or
+a CLI run reach them through the table stamps, without going through the handlers of
+this worker.
+"""
+from datetime import datetime
+
+import pytest
+
+import geo
+from models import Artist, Venue, Deletions, db
+
+
+@pytest.fixture
+def suggest(app, client, monkeypatch):
+    """ GET /search/suggest?q= returning (type, id, name) of the suggestions, the tables polled on every call """
+    monkeypatch.setitem(app.config, 'INDEX_SYNC_INTERVAL', 0)
+
+    def get(prefix):
+        data = client.get('/search/suggest', query_string={'q': prefix}).get_json()
+        return [(x['type'], x['id'], x['name']) for x in data['suggestions']]
+    get('a')
+    return get
+
+
+def test_rename_by_another_worker(app, suggest):
+    with app.app_context():
+        artist = Artist.query.order_by(Artist.id).first()
+        old_name, artist.name, artist.updated_at = artist.name, 'Zyxwv Quartet', datetime.utcnow()
+        db.session.commit()
+        artist_id = artist.id
+    try:
+        assert suggest('zyxwv') == [('artist', artist_id, 'Zyxwv Quartet')]
+        assert suggest('quartet')[0][1] == artist_id
+    finally:
+        with app.app_context():
+            Artist.query.filter(Artist.id == artist_id).update(
+                {Artist.name: old_name, Artist.updated_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+    assert suggest('zyxwv') == []
+
+
+def test_insert_and_delete_by_another_worker(app, suggest):
+    with app.app_context():
+        artist = Artist(name='Qwfpg Trio', city='Austin', state='TX')
+        db.session.add(artist)
+        db.session.commit()
+        artist_id = artist.id
+    assert suggest('qwfpg') == [('artist', artist_id, 'Qwfpg Trio')]
+    with app.app_context():
+        Artist.query.filter(Artist.id == artist_id).delete(synchronize_session=False)
+        Deletions.record(Artist.__tablename__, datetime.utcnow())
+        db.session.commit()
+    assert suggest('qwfpg') == []
+
+
+@pytest.fixture
+def nearby(app, client, monkeypatch):
+    """ Ids of the venues within 5 km of a point, the Venue table polled on every call """
+    monkeypatch.setitem(app.config, 'INDEX_SYNC_INTERVAL', 0)
+
+    def get(latitude, longitude):
+        with app.app_context():
+            return [x.id for x, _ in geo.nearby(latitude, longitude, [Venue.id], radius_km=5)]
+    get(0, 0)
+    return get
+
+
+def test_geocode_run_moves_venue(app, nearby):
+    with app.app_context():
+        venue = Venue.query.order_by(Venue.id).first()
+        venue_id, city, state = venue.id, venue.city, venue.state
+        coordinates = venue.latitude, venue.longitude
+        Venue.query.filter(Venue.id == venue_id).update(
+            {Venue.latitude: None, Venue.longitude: None}, synchronize_session=False
+        )
+        db.session.commit()
+        assert geo.geocode_venues({geo._place_key(city, state): (-80.0, 10.0)}) == (1, 0)
+    try:
+        assert nearby(-80.0, 10.0) == [venue_id]
+    finally:
+        with app.app_context():
+            Venue.query.filter(Venue.id == venue_id).update(
+                {Venue.latitude: coordinates[0], Venue.longitude: coordinates[1], Venue.updated_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.commit()
+    assert nearby(-80.0, 10.0) == []
+
+
+def test_venue_deleted_by_another_worker(app, nearby):
+    with app.app_context():
+        venue = Venue(name='Polar Hall', city='Nowhere', state='AQ', latitude=-75.0, longitude=40.0)
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+    assert nearby(-75.0, 40.0) == [venue_id]
+    with app.app_context():
+        Venue.query.filter(Venue.id == venue_id).delete(synchronize_session=False)
+        Deletions.record(Venue.__tablename__, datetime.utcnow())
+        db.session.commit()
+    assert nearby(-75.0, 40.0) == []
@@ -0,0 +1,48 @@
+"""
+File:           tests/test_route_benchmarks.py
+pytest-benchmark cases of every route of app.py, the routes and their form data
+being the ones of bench/routes.py. Skipped where pytest-benchmark is not installed.
+
+Each route is requested `ROUNDS` times after a warm-up request, with queries per
+request and the process RSS recorded in the extra info of the benchmark:
+
+    python -m pytest tests/test_route_benchmarks.py --benchmark-columns=median,max,ops
+    python -m pytest tests --benchmark-skip      # the other tests only
+
+The baseline and regression gate of `fab test` stays bench/routes.py.
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from routes import routes, rss_mib  # noqa: E402
+
+ROUNDS = 20
+# Only the names are needed to collect the cases, the ids are looked up by route_args
+ROUTE_NAMES = [name for name, *_ in routes(1, 1)]
+
+
+@pytest.fixture(scope='module')
+def route_args(app):
+    """ {name: (method, path, data)} of the routes for a venue and an artist of the data set """
+    from models import Venue, Artist, db
+    with app.app_context():
+        venue_id, = db.session.query(Venue.id).order_by(Venue.id).offset(Venue.query.count() // 2).first()
+        artist_id, = db.session.query(Artist.id).order_by(Artist.id).offset(Artist.query.count() // 2).first()
+        db.session.remove()
+    return {name: (method, path, data) for name, method, path, data in routes(venue_id, artist_id)}
+
+
+@pytest.mark.parametrize('name', ROUTE_NAMES)
+def test_route(benchmark, client, statements, route_args, name):
+    method, path, data = route_args[name]
+    benchmark.group = 'routes'
+
+    def request():
+        response = client.open(path, method=method, data=data() if callable(data) else data)
+        response.get_data()
+        assert response.status_code < 400, f'{method} {path} answered {response.status_code}'
+
+    benchmark.pedantic(request, rounds=ROUNDS, warmup_rounds=1)
+    benchmark.extra_info['queries'] = round(len(statements) / (ROUNDS + 1), 1)
+    benchmark.extra_info['rss_mib'] = round(rss_mib(), 1)
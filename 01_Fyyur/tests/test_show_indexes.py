@@ -0,0 +1,80 @@
+"""
+File:           tests/test_show_indexes.py
+The past / upcoming show queries of a venue or artist are range scans of the
+(venue_id, start_time) / (artist_id, start_time) indexes, checked with EXPLAIN QUERY PLAN.
+The indexes added by migration c71f0e9b5a28 are the ones the models declare.
+"""
+import importlib.util
+import os
+from datetime import datetime
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, inspect
+
+from models import Venue, VenuesGenres, Artist, ArtistsGenres, Show, db
+
+MIGRATION = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'migrations', 'versions', 'c71f0e9b5a28_show_and_genre_indexes.py'
+)
+
+
+def query_plan(query):
+    """ Details of the EXPLAIN QUERY PLAN rows of a SQLite query """
+    compiled = query.statement.compile(dialect=db.session.get_bind().dialect)
+    params = [compiled.params[x] for x in compiled.positiontup]
+    params = [x.isoformat(' ') if isinstance(x, datetime) else x for x in params]
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+    return ' | '.join(x[-1] for x in cursor.fetchall())
+
+
+def show_queries(owner_column, model, owner_id):
+    now = datetime.now()
+    shows = model.shows_with_artist_query if model is Venue else model.shows_with_venue_query
+    return {
+        'upcoming': Show.query.filter(owner_column == owner_id, Show.start_time >= now),
+        'past': Show.query.filter(owner_column == owner_id, Show.start_time < now),
+        'page': shows(owner_id),
+    }
+
+
+@pytest.mark.parametrize('owner_column, model, index', [
+    (Show.venue_id, Venue, 'ix_Shows_venue_id_start_time'),
+    (Show.artist_id, Artist, 'ix_Shows_artist_id_start_time'),
+])
+def test_show_queries_use_owner_start_time_index(app, owner_column, model, index):
+    with app.app_context():
+        for name, query in show_queries(owner_column, model, 1).items():
+            plan = query_plan(query)
+            assert f'USING INDEX {index}' in plan, f'{name}: {plan}'
+
+
+def declared_indexes(model):
+    """ B-tree indexes of a model, the GIN ones are PostgreSQL only and come from later migrations """
+    return {
+        x.name: [column.name for column in x.columns]
+        for x in model.__table__.indexes if not x.dialect_options['postgresql']['using']
+    }
+
+
+def test_migration_creates_declared_indexes(tmp_path):
+    models = (Show, VenuesGenres, ArtistsGenres)
+    spec = importlib.util.spec_from_file_location('show_and_genre_indexes', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    engine = create_engine(f'sqlite:///{tmp_path / "migration.sqlite"}')
+    with engine.connect() as connection:
+        db.metadata.create_all(connection)
+        # The tables as they were before the migration
+        for model in models:
+            for name in declared_indexes(model):
+                connection.execute(f'DROP INDEX "{name}"')
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+        inspector = inspect(connection)
+        for model in models:
+            created = {x['name']: x['column_names'] for x in inspector.get_indexes(model.__tablename__)}
+            declared = declared_indexes(model)
+            assert {name: created.get(name) for name in declared} == declared
@@ -0,0 +1,115 @@
+"""
+File:           tests/test_show_stats.py
+VenueStats / ArtistStats stay equal to a count of the shows as shows are booked,
+venues deleted and the stats rolled.
+"""
+import json
+from datetime import datetime, timedelta
+
+from models import Venue, VenuesGenres, Artist, Show, Deletions, SHOW_STATS, _stats_counts, db
+from models import record_shows, roll_show_stats
+
+# Far beyond the seeded shows and the days of the other tests
+DAY = datetime(2042, 1, 1, 20, 0)
+
+
+def recount(owner_column, now):
+    """ {owner_id: (upcoming, past)} counted from the shows """
+    counts = {}
+    for owner_id, start_time in db.session.query(owner_column, Show.start_time):
+        upcoming, past = counts.get(owner_id, (0, 0))
+        counts[owner_id] = (upcoming + 1, past) if start_time >= now else (upcoming, past + 1)
+    return counts
+
+
+def stored_counts(owner_column, now):
+    """ {owner_id: (upcoming, past)} read from the stats table, owners without shows left out """
+    key = getattr(SHOW_STATS[owner_column.key], owner_column.key)
+    rows = db.session.query(key, *_stats_counts(owner_column, now))
+    return {x: (int(upcoming), int(past)) for x, upcoming, past in rows if upcoming or past}
+
+
+def assert_stats_match(app):
+    with app.app_context():
+        now = datetime.now()
+        for owner_column in (Show.venue_id, Show.artist_id):
+            assert stored_counts(owner_column, now) == recount(owner_column, now), owner_column.key
+        db.session.remove()
+
+
+def first_ids(app):
+    """ The first venue id and the first artist id """
+    with app.app_context():
+        ids = db.session.query(Venue.id).order_by(Venue.id).first()[0], \
+            db.session.query(Artist.id).order_by(Artist.id).first()[0]
+        db.session.remove()
+    return ids
+
+
+def test_create_show(app, client):
+    venue_id, artist_id = first_ids(app)
+    assert_stats_match(app)
+    response = client.post('/shows/create', data={
+        'venue_id': str(venue_id), 'artist_id': str(artist_id), 'start_time': f'{DAY:%Y-%m-%d %H:%M:%S}'
+    })
+    assert response.status_code == 200
+    assert_stats_match(app)
+
+
+def test_batch_create(app, client):
+    venue_id, artist_id = first_ids(app)
+    shows = [
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': (DAY + timedelta(days=x)).isoformat()}
+        for x in range(1, 4)
+    ]
+    response = client.post('/api/v1/shows/batch', data=json.dumps({'shows': shows}), content_type='application/json')
+    assert response.status_code == 201
+    assert_stats_match(app)
+
+
+def test_roll_show_stats(app):
+    now = datetime.now()
+    venue_id, artist_id = first_ids(app)
+    show = {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': now - timedelta(minutes=1)}
+    with app.app_context():
+        # Counted while still upcoming, it has started since
+        db.session.execute(Show.__table__.insert().values(show))
+        record_shows([show], now=now - timedelta(minutes=2))
+        db.session.commit()
+        assert roll_show_stats(now) >= 2
+        for owner_column in (Show.venue_id, Show.artist_id):
+            stats = SHOW_STATS[owner_column.key]
+            key = getattr(stats, owner_column.key)
+            assert stats.query.filter(stats.next_show_at < now).count() == 0
+            stored = {
+                x: (upcoming, past) for x, upcoming, past in
+                db.session.query(key, stats.upcoming_count, stats.past_count) if upcoming or past
+            }
+            assert stored == recount(owner_column, now)
+        db.session.remove()
+    assert_stats_match(app)
+
+
+def test_delete_venue(app, client):
+    with app.app_context():
+        venue_id, = db.session.query(Show.venue_id).order_by(Show.venue_id.desc()).first()
+        artist_ids = {x for x, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)}
+        deletions = db.session.query(Deletions.count).filter(Deletions.table_name == 'Venue').scalar() or 0
+        db.session.remove()
+    assert artist_ids
+
+    response = client.delete(f'/venues/{venue_id}')
+    assert response.status_code == 200
+
+    with app.app_context():
+        assert Venue.query.get(venue_id) is None
+        assert VenuesGenres.query.filter(VenuesGenres.venue_id == venue_id).count() == 0
+        assert Show.query.filter(Show.venue_id == venue_id).count() == 0
+        assert db.session.query(Deletions.count).filter(Deletions.table_name == 'Venue').scalar() == deletions + 1
+        # The artists lost the shows at the venue, their stats were recounted
+        now = datetime.now()
+        counts, stored = recount(Show.artist_id, now), stored_counts(Show.artist_id, now)
+        assert {x: stored.get(x) for x in artist_ids} == {x: counts.get(x) for x in artist_ids}
+        db.session.remove()
+    assert_stats_match(app)
+    assert client.delete(f'/venues/{venue_id}').status_code == 404
@@ -0,0 +1,45 @@
+"""
+File:           tests/test_statement_counts.py
+The show listing and the venue / artist pages run a fixed number of statements,
+however many shows they list: related venue and artist columns are loaded up front.
+"""
+import pytest
+
+from models import Show, db
+
+
+def owners_by_show_count(app, owner_column):
+    """ Ids of the owners with the fewest and with the most shows """
+    with app.app_context():
+        counts = db.session.query(owner_column, db.func.count(Show.id)).group_by(owner_column).order_by(
+            db.func.count(Show.id), owner_column
+        ).all()
+        db.session.remove()
+    return [counts[0][0], counts[-1][0]]
+
+
+def statement_count(client, statements, path):
+    """ Statements of a request once the version stamp of the page is loaded """
+    client.get(path)
+    del statements[:]
+    response = client.get(path)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('path', ['/shows', '/shows?limit=100'])
+def test_shows(client, statements, path):
+    # Shows joined with their venue and artist
+    assert statement_count(client, statements, path) == 1
+
+
+def test_venue(app, client, statements):
+    for venue_id in owners_by_show_count(app, Show.venue_id):
+        # Venue, its genres, its shows joined with their artist
+        assert statement_count(client, statements, f'/venues/{venue_id}') == 3
+
+
+def test_artist(app, client, statements):
+    for artist_id in owners_by_show_count(app, Show.artist_id):
+        # Artist, its genres, its shows joined with their venue
+        assert statement_count(client, statements, f'/artists/{artist_id}') == 3
@@ -0,0 +1,59 @@
+"""
+File:           tests/test_venue_pages.py
+/venues is paginated in area order: every venue is listed once, and an area
+only continues on the next page when it was cut where the previous page ended.
+"""
+import html
+import re
+
+from models import Venue, db
+
+AREA = re.compile(r'<h3>(.*?)</h3>')
+VENUE = re.compile(r'href="/venues/(\d+)"')
+NEXT = re.compile(r'<li class="next"><a href="([^"]+)"')
+PREVIOUS = re.compile(r'<li class="previous"><a href="([^"]+)"')
+
+
+def page(client, url):
+    """ ([(area, [venue ids])], next url, previous url) of a /venues page """
+    text = client.get(url).get_data(as_text=True)
+    blocks = AREA.split(text)[1:]
+    areas = [
+        (html.unescape(blocks[i]), [int(x) for x in VENUE.findall(blocks[i + 1])]) for i in range(0, len(blocks), 2)
+    ]
+    links = [x.search(text) for x in (NEXT, PREVIOUS)]
+    return areas, *[html.unescape(x.group(1)) if x else None for x in links]
+
+
+def test_areas_not_split_across_pages(app, client):
+    with app.app_context():
+        # A city with the ',' that separates the values of a cursor
+        venue = Venue.query.order_by(Venue.id).first()
+        venue.city = 'Washington, D.C.'
+        db.session.commit()
+        washington = f'Washington, D.C., {venue.state}'
+        expected = [x for x, in db.session.query(Venue.id).order_by(*Venue.area_order())]
+        db.session.remove()
+
+    url, pages, listed = '/venues?limit=7', [], []
+    while url:
+        areas, url, _ = page(client, url)
+        pages.append(areas)
+        listed.extend(x for _, ids in areas for x in ids)
+    assert listed == expected
+
+    seen = set()
+    for number, areas in enumerate(pages):
+        for position, (area, _) in enumerate(areas):
+            # Only the first area of a page may have been listed before, at the end of the previous page
+            if area in seen:
+                assert position == 0 and pages[number - 1][-1][0] == area
+            seen.add(area)
+    assert washington in seen
+
+
+def test_previous_page(client):
+    first, next_url, _ = page(client, '/venues?limit=5')
+    second, _, previous_url = page(client, next_url)
+    assert second != first
+    assert page(client, previous_url)[0] == first
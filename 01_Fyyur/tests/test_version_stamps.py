@@ -0,0 +1,62 @@
+"""
+File:           tests/test_version_stamps.py
+Conditional GETs of the listings: a deletion or the passing of time changes the ETag,
+even for a worker whose stamps were not touched by the write.
+"""
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import cache
+from models import Venue, Show, Deletions, db
+
+
+@pytest.fixture
+def stamps(app):
+    """ The version stamps of the app, forgotten before and after the test as by a fresh worker """
+    from app import version_stamps
+    version_stamps._stamps.clear()
+    yield version_stamps
+    version_stamps._stamps.clear()
+
+
+def test_weak_etag_answers_304(client, stamps):
+    response = client.get('/venues')
+    assert response.headers['ETag'].startswith('W/')
+    etag, _ = response.get_etag()
+    assert client.get('/venues', headers={'If-None-Match': f'W/"{etag}"'}).status_code == 304
+    last_modified = response.headers['Last-Modified']
+    assert client.get('/venues', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_deletion_seen_by_another_worker(app, client, stamps):
+    etag, _ = client.get('/venues').get_etag()
+    with app.app_context():
+        Deletions.record(Venue.__tablename__, datetime.utcnow())
+        db.session.commit()
+    stamps._stamps.clear()
+    response = client.get('/venues', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_deleted_venue_changes_etag(app, client, stamps):
+    with app.app_context():
+        venue_id, = db.session.query(Show.venue_id).order_by(Show.venue_id).first()
+        db.session.remove()
+    response = client.get('/venues')
+    etag, _ = response.get_etag()
+    assert client.delete(f'/venues/{venue_id}').status_code == 200
+    response = client.get('/venues', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_etag_changes_with_the_time_bucket(client, stamps):
+    now = cache.time.time()
+    with mock.patch.object(cache.time, 'time', return_value=now):
+        etag, _ = client.get('/shows').get_etag()
+    with mock.patch.object(cache.time, 'time', return_value=now + stamps.bucket):
+        response = client.get('/shows', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 200